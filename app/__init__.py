@@ -42,8 +42,10 @@ def create_app():
     app.config['SQLALCHEMY_ENGINE_OPTIONS']     = {
         'pool_pre_ping': True,
         'pool_recycle': 3600,
-        'connect_args': { 'connect_timeout': 10 }
     }
+    if database_url.startswith('postgresql'):
+        # libpq option; other drivers (e.g. SQLite for local tools) reject it
+        app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] = { 'connect_timeout': 10 }
 
     # ─── 4) Mail config from .env ───────────────────────────────────────────────
     app.config['MAIL_SERVER']         = os.getenv('MAIL_SERVER')
@@ -61,6 +63,9 @@ def create_app():
     login_manager.init_app(app)
     mail.init_app(app)
 
+    from app.services.notification_scheduler import notification_scheduler
+    notification_scheduler.init_app(app)
+
     # ─── 6) Register blueprints ──────────────────────────────────────────────────
     print("Registering blueprints...")
     from app.controllers.main      import main_bp
@@ -81,7 +86,10 @@ def create_app():
             from app.models.models import (
                 User, Supplier, Category, Product,
                 InventoryTransaction, Notification,
-                PurchaseOrder, PurchaseOrderItem, MLResult
+                PurchaseOrder, PurchaseOrderItem, MLResult,
+                Watermark, CacheEntry, MLSummary,
+                MLDailyAggregate, MLProductState, Job,
+                StockMovementRollup, ConversationState
             )
             db.create_all()
             print("All tables ensured.")
@@ -89,4 +97,11 @@ def create_app():
             print("❌ Database setup error:", e)
             sys.exit(1)
 
+    # ─── 8) Start background job workers ────────────────────────────────────────
+    # After the blueprints are registered, so every job handler is known
+    from app.services.rollup_service import stock_rollups
+    from app.services.job_queue import job_queue
+    stock_rollups.init_app(app)
+    job_queue.init_app(app)
+
     return app
@@ -1,9 +1,10 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
-from flask_login import login_user, logout_user, login_required, current_user
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, g, abort
+from flask_login import login_user, logout_user, login_required, current_user, login_url
 from werkzeug.security import check_password_hash, generate_password_hash
 from app import db, login_manager
 from app.models.models import User
 from app.controllers.forms import LoginForm, RegisterForm
+from app.services.identity_service import IdentityService, API_TOKEN_MAX_AGE
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -13,7 +14,36 @@ HASH_METHOD = 'pbkdf2:sha256:150000'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Served from the identity cache; the database is only read on a miss
+    return IdentityService.load(int(user_id))
+
+@login_manager.request_loader
+def load_user_from_request(request):
+    """Authenticate JSON clients from an "Authorization: Bearer <token>" header"""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    user = IdentityService.load_from_token(auth_header[len('Bearer '):].strip())
+    if user:
+        g.api_token_login = True
+    return user
+
+@login_manager.unauthorized_handler
+def unauthorized():
+    # API clients get a 401 they can act on instead of the login page
+    if request.headers.get('Authorization', '').startswith('Bearer '):
+        return jsonify({"error": "Invalid or expired API token"}), 401
+    flash(login_manager.login_message, login_manager.login_message_category)
+    return redirect(login_url(login_manager.login_view, next_url=request.url))
+
+@auth_bp.route('/token', methods=['POST'])
+@login_required
+def api_token():
+    """Issue an API token for the logged-in user (JSON endpoints accept it as a Bearer token)"""
+    # Tokens can't mint new tokens, or one token would never expire
+    if g.get('api_token_login'):
+        abort(403)
+    return jsonify({"token": IdentityService.issue_token(current_user), "expires_in": API_TOKEN_MAX_AGE})
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
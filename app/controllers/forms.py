@@ -8,6 +8,7 @@ from wtforms.validators import DataRequired, Email, EqualTo, Length, NumberRange
 from datetime import datetime
 from app.models.models import Product
 from wtforms.fields import DateTimeLocalField
+from wtforms.widgets import HiddenInput
 # Authentication forms
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
@@ -29,6 +30,8 @@ class ProductForm(FlaskForm):
     sku = StringField('SKU', validators=[DataRequired(), Length(max=50)])
     unit_price = FloatField('Unit Price', validators=[DataRequired(), NumberRange(min=0)])
     quantity_in_stock = IntegerField('Quantity in Stock', validators=[DataRequired(), NumberRange(min=0)])
+    # Stock level when the edit form was loaded; the edit applies the difference
+    loaded_quantity = IntegerField(widget=HiddenInput(), validators=[Optional()])
     reorder_level = IntegerField('Reorder Level', validators=[DataRequired(), NumberRange(min=0)])
     reorder_quantity = IntegerField('Reorder Quantity', validators=[DataRequired(), NumberRange(min=1)])
     category_id = SelectField('Category', validators=[DataRequired()], coerce=int)
@@ -86,6 +89,7 @@ class PurchaseOrderForm(FlaskForm):
                         choices=[
                             ('pending', 'Pending'),
                             ('approved', 'Approved'),
+                            ('partially_received', 'Partially received'),
                             ('received', 'Received'),
                             ('canceled', 'Canceled')
                         ],
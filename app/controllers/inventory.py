@@ -1,29 +1,38 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session, send_file
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 from app.models.models import (
     Product, Category, Supplier, InventoryTransaction, 
-    Notification, PurchaseOrder, PurchaseOrderItem
+    Notification, PurchaseOrder, PurchaseOrderItem, MLSummary, Job, User
 )
 from app.controllers.forms import (
     ProductForm, CategoryForm, SupplierForm, 
     InventoryTransactionForm, PurchaseOrderForm
 )
 from app.services.ai_service import AIService
+from app.services.ai_worker import ai_worker
+from app.services.job_queue import job_queue
 from app.services.chatbot_service import ChatbotService
+from app.services.transaction_service import TransactionService, TYPE_FILTERS, PAGE_SIZE
+from app.services.rollup_service import StockRollups
+from app.services.stock_ledger import StockLedger, InsufficientStock
+from app.services.purchase_order_service import PurchaseOrderService
+from app.services.import_service import IMPORT_EXTENSIONS
+from app.services.export_service import ExportService, parquet_available
 from app import db
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import func, desc
-import pandas as pd
 import json
+import os
+import uuid
+import tempfile
 from collections import defaultdict
 from PIL import Image
-from io import BytesIO
 from pyzbar.pyzbar import decode
 import base64
 from app.services.barcode_service import decode_dataurl_to_barcode_text
 from app.services.analysis_service import AnalysisService
-from app.services.email_service import EmailService
+from app.signals import stock_changed
 from flask import current_app
 
 inventory_bp = Blueprint('inventory', __name__)
@@ -60,6 +69,37 @@ def products():
                           categories=categories, 
                           category_id=category_id)
 
+@inventory_bp.route('/products/import', methods=['GET', 'POST'])
+@login_required
+def import_products():
+    """Upload a CSV/XLSX catalog; it is imported by a background job"""
+    if request.method == 'GET':
+        return render_template('inventory/product_import.html', extensions=IMPORT_EXTENSIONS)
+    
+    upload = request.files.get('file')
+    extension = os.path.splitext(upload.filename or '')[1].lower() if upload else ''
+    if extension not in IMPORT_EXTENSIONS:
+        return jsonify(success=False, error=f"Upload a {' or '.join(IMPORT_EXTENSIONS)} file"), 400
+    
+    # Saved where the job worker can read it; the job deletes it when done
+    upload_dir = os.getenv('IMPORT_UPLOAD_DIR', tempfile.gettempdir())
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, f"product-import-{uuid.uuid4().hex}{extension}")
+    upload.save(path)
+    
+    job = job_queue.enqueue('product_import', {
+        'path': path,
+        'opening_balance': request.form.get('opening_balance') == 'on',
+        'user_id': current_user.id,
+    }, user_id=current_user.id)
+    return _job_accepted(job)
+
+@inventory_bp.route('/products/export/csv')
+@login_required
+def export_products_csv():
+    category_id = request.args.get('category_id', type=int)
+    return _csv_download(ExportService.products_csv(category_id), 'products')
+
 @inventory_bp.route('/products/add', methods=['GET', 'POST'])
 @login_required
 def add_product():
@@ -113,6 +153,7 @@ def add_product():
                 )
                 db.session.add(transaction)
                 db.session.commit()
+                stock_changed.send(current_app._get_current_object(), product_ids=[product.id])
 
             flash("Product added successfully", "success")
             return redirect(url_for("inventory.products"))
@@ -130,16 +171,42 @@ def view_product(product_id):
     product = Product.query.get_or_404(product_id)
     transactions = InventoryTransaction.query.filter_by(product_id=product_id).order_by(InventoryTransaction.transaction_date.desc()).all()
     
-    # Get product analysis from AI
-    product_analysis = ai_service.analyze_inventory_trends(product, transactions)
-    
+    # The AI analysis is fetched separately by the page (see product_analysis)
     return render_template(
         'inventory/product_details.html', 
         product=product, 
-        transactions=transactions, 
-        analysis=product_analysis
+        transactions=transactions
     )
 
+@inventory_bp.route('/products/<int:product_id>/analysis')
+@login_required
+def product_analysis(product_id):
+    product = Product.query.get_or_404(product_id)
+    days = 30
+    transactions = InventoryTransaction.query.filter(
+        InventoryTransaction.product_id == product_id,
+        InventoryTransaction.transaction_date >= datetime.now() - timedelta(days=days)
+    ).all()
+    
+    prompt, fallback = ai_service.inventory_trends_prompt(product, transactions, days)
+    return _ai_content_response(prompt, fallback)
+
+def _ai_content_response(prompt, fallback):
+    """
+    JSON response for AI content loaded after the page renders: the HTML if it
+    is cached or done, otherwise 202 while a worker generates it.
+    """
+    key = ai_service.cache.key_for(ai_service.model_name, prompt)
+    
+    html = ai_worker.result(key) or ai_service.cached_render(prompt)
+    if html is None and not ai_service._api_available():
+        html = fallback
+    if html is not None:
+        return jsonify({'status': 'done', 'html': html})
+    
+    ai_worker.submit(key, ai_service.render, prompt, fallback)
+    return jsonify({'status': 'pending'}), 202
+
 @inventory_bp.route('/products/<int:product_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_product(product_id):
@@ -151,11 +218,16 @@ def edit_product(product_id):
     # Populate choices for category and supplier
     form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
     form.supplier_id.choices = [(s.id, s.name) for s in Supplier.query.all()]
+    if not form.is_submitted():
+        form.loaded_quantity.data = product.quantity_in_stock
     
     if form.validate_on_submit():
         try:
-            # Check if quantity has changed
-            old_quantity = product.quantity_in_stock
+            # The user changed stock relative to what the form showed, not to
+            # what it is now; fall back to the current level for old forms
+            old_quantity = form.loaded_quantity.data
+            if old_quantity is None:
+                old_quantity = product.quantity_in_stock
             new_quantity = form.quantity_in_stock.data
             
             # Update product
@@ -163,30 +235,33 @@ def edit_product(product_id):
             product.description = form.description.data
             product.sku = form.sku.data
             product.unit_price = form.unit_price.data
-            product.quantity_in_stock = new_quantity
             product.reorder_level = form.reorder_level.data
             product.reorder_quantity = form.reorder_quantity.data
             product.category_id = form.category_id.data
             product.supplier_id = form.supplier_id.data
             
-            # Create adjustment transaction if quantity changed
+            # Apply the change the user made as an adjustment, so stock moved by
+            # concurrent sales or receipts since the form was loaded isn't lost
             if old_quantity != new_quantity:
                 adjustment = new_quantity - old_quantity
-                
-                transaction = InventoryTransaction(
-                    product_id=product.id,
-                    transaction_type='adjustment',
-                    quantity=abs(adjustment),
+                StockLedger.apply(
+                    product.id,
+                    adjustment,
+                    'adjustment',
                     unit_price=form.unit_price.data,
-                    total_price=form.unit_price.data * abs(adjustment),
                     notes=f"Manual adjustment: {'increased' if adjustment > 0 else 'decreased'} by {abs(adjustment)}",
-                    created_by=current_user.id
+                    user_id=current_user.id
                 )
-                db.session.add(transaction)
             
             db.session.commit()
+            if old_quantity != new_quantity:
+                stock_changed.send(current_app._get_current_object(), product_ids=[product.id])
             flash('Product updated successfully', 'success')
             return redirect(url_for('inventory.products'))
+        except InsufficientStock as e:
+            db.session.rollback()
+            flash(f'Stock changed while you were editing; only {e.available} units are left to adjust.', 'danger')
+            return render_template('inventory/product_form.html', form=form, product=product, title='Edit Product')
         except IntegrityError:
             db.session.rollback()
             flash('A product with this SKU already exists. Please enter a unique SKU.', 'danger')
@@ -202,9 +277,12 @@ def delete_product(product_id):
     # Delete associated transactions and notifications
     InventoryTransaction.query.filter_by(product_id=product_id).delete()
     Notification.query.filter_by(product_id=product_id).delete()
+    MLSummary.query.filter_by(product_id=product_id).delete()
+    StockRollups.forget_product(product_id)
     
     db.session.delete(product)
     db.session.commit()
+    stock_changed.send(current_app._get_current_object(), product_ids=[product_id])
     
     flash('Product deleted successfully', 'success')
     return redirect(url_for('inventory.products'))
@@ -379,81 +457,78 @@ def delete_supplier(supplier_id):
 @inventory_bp.route('/suppliers/export/csv')
 @login_required
 def export_suppliers_csv():
-    suppliers = Supplier.query.all()
-    
-    # Create a DataFrame from the suppliers data
-    data = []
-    for supplier in suppliers:
-        data.append({
-            'ID': supplier.id,
-            'Name': supplier.name,
-            'Contact Person': supplier.contact_person,
-            'Email': supplier.email,
-            'Phone': supplier.phone,
-            'Address': supplier.address,
-            'Products Count': len(supplier.products)
-        })
-    
-    df = pd.DataFrame(data)
-    
-    # Create a string IO object to store the CSV
-    output = BytesIO()
-    df.to_csv(output, index=False, encoding='utf-8')
-    output.seek(0)
-    
-    # Return the CSV file as a response
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=f'suppliers_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-        mimetype='text/csv'
+    return _csv_download(ExportService.suppliers_csv(), 'suppliers')
+
+def _download(chunks, name, extension, mimetype):
+    """Stream an export generator as an attachment"""
+    filename = f'{name}_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
+def _csv_download(chunks, name):
+    return _download(chunks, name, 'csv', 'text/csv')
+
 # Inventory Transaction routes
 @inventory_bp.route('/transactions')
 @login_required
 def transactions():
-    # Get filter type parameter if provided
-    transaction_type = request.args.get('type')
+    # Get filter type parameter if provided; rows are loaded page by page from transactions_api
+    transaction_type = (request.args.get('type') or '').lower()
+    if transaction_type not in TYPE_FILTERS:
+        transaction_type = None
     
-    # Base query
-    query = InventoryTransaction.query
-    
-    # Apply filter if type is provided
-    IN_TYPES = {'purchase', 'in'}
-    OUT_TYPES = {'sale', 'out'}
-    
-    if transaction_type:
-        if transaction_type.lower() == 'purchase':
-            # Filter for stock in transactions
-            query = query.filter(InventoryTransaction.transaction_type.in_(['purchase', 'IN']))
-        elif transaction_type.lower() == 'sale':
-            # Filter for stock out transactions
-            query = query.filter(InventoryTransaction.transaction_type.in_(['sale', 'OUT']))
-    
-    # Get all transactions with applied filters
-    transactions = query.order_by(InventoryTransaction.transaction_date.desc()).all()
-    
-    # Calculate stats for all transactions (unfiltered)
-    all_transactions = InventoryTransaction.query.all()
-    stock_in_count = 0
-    stock_out_count = 0
-    total_value = 0.0
-    
-    for t in all_transactions:
-        ttype = (t.transaction_type or '').strip().lower()
-        if ttype in IN_TYPES:
-            stock_in_count += t.quantity
-        elif ttype in OUT_TYPES:
-            stock_out_count += t.quantity
-        total_value += float(t.total_price or 0.0)
+    # Stats for all transactions (unfiltered), aggregated in SQL and cached
+    totals = TransactionService.summary_totals()
+    
+    # Choices for the product / user filters
+    products = db.session.query(Product.id, Product.name).order_by(Product.name).all()
+    users = db.session.query(User.id, User.username).order_by(User.username).all()
     
     return render_template('inventory/transactions.html', 
-                          transactions=transactions,
-                          stock_in_count=stock_in_count, 
-                          stock_out_count=stock_out_count, 
-                          total_value=total_value,
-                          active_filter=transaction_type)
+                          transaction_count=totals['transaction_count'],
+                          stock_in_count=totals['stock_in_count'], 
+                          stock_out_count=totals['stock_out_count'], 
+                          total_value=totals['total_value'],
+                          products=products,
+                          users=users,
+                          active_filter=transaction_type,
+                          parquet_available=parquet_available())
+
+@inventory_bp.route('/api/transactions')
+@login_required
+def transactions_api():
+    """Keyset-paginated ledger: ?type=&product_id=&user_id=&date_from=&date_to=&limit=&cursor="""
+    try:
+        filters = TransactionService.parse_filters(request.args)
+        page = TransactionService.page(
+            filters,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', PAGE_SIZE, type=int)
+        )
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(page)
+
+@inventory_bp.route('/transactions/export/<fmt>')
+@login_required
+def export_transactions(fmt):
+    """Filtered ledger export (same filters as transactions_api) as csv or parquet"""
+    try:
+        filters = TransactionService.parse_filters(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    
+    if fmt == 'csv':
+        return _csv_download(ExportService.transactions_csv(filters), 'transactions')
+    if fmt == 'parquet':
+        if not parquet_available():
+            return jsonify(error="Parquet export needs pyarrow installed"), 501
+        return _download(ExportService.transactions_parquet(filters), 'transactions', 'parquet',
+                         'application/vnd.apache.parquet')
+    return jsonify(error=f"Unknown export format: {fmt}"), 404
 
 @inventory_bp.route('/transactions/add', methods=['GET', 'POST'])
 @login_required
@@ -464,35 +539,25 @@ def add_transaction():
     form.product_id.choices = [(p.id, f"{p.name} ({p.sku})") for p in Product.query.all()]
     
     if form.validate_on_submit():
-        product = Product.query.get(form.product_id.data)
-        
-        # Calculate total price
-        total_price = form.unit_price.data * form.quantity.data
-        
-        transaction = InventoryTransaction(
-            product_id=form.product_id.data,
-            transaction_type=form.transaction_type.data,
-            quantity=form.quantity.data,
-            unit_price=form.unit_price.data,
-            total_price=total_price,
-            transaction_date=form.transaction_date.data,
-            notes=form.notes.data,
-            created_by=current_user.id
-        )
-        
-        db.session.add(transaction)
-        
-        # Update product stock quantity
-        if form.transaction_type.data == 'purchase':
-            product.quantity_in_stock += form.quantity.data
-        elif form.transaction_type.data == 'sale':
-            if product.quantity_in_stock >= form.quantity.data:
-                product.quantity_in_stock -= form.quantity.data
-            else:
-                flash('Insufficient stock for this sale', 'danger')
-                return render_template('inventory/transaction_form.html', form=form, title='Add Transaction')
+        # Update product stock and record the transaction in one atomic step
+        try:
+            change = StockLedger.apply(
+                form.product_id.data,
+                StockLedger.delta_for(form.transaction_type.data, form.quantity.data),
+                form.transaction_type.data,
+                quantity=form.quantity.data,
+                unit_price=form.unit_price.data,
+                notes=form.notes.data,
+                user_id=current_user.id,
+                transaction_date=form.transaction_date.data,
+            )
+        except InsufficientStock:
+            db.session.rollback()
+            flash('Insufficient stock for this sale', 'danger')
+            return render_template('inventory/transaction_form.html', form=form, title='Add Transaction')
         
         db.session.commit()
+        stock_changed.send(current_app._get_current_object(), product_ids=[change.product_id])
         flash('Transaction added successfully', 'success')
         return redirect(url_for('inventory.transactions'))
     
@@ -597,17 +662,27 @@ def view_purchase_order(order_id):
     items = PurchaseOrderItem.query.options(
         db.joinedload(PurchaseOrderItem.product)
     ).filter_by(purchase_order_id=order_id).all()
-    # Get AI summary
     supplier = order.supplier  # Already loaded through the relationship
-    ai_summary = ai_service.generate_purchase_order_summary(order, supplier, items)
+    # The AI summary is fetched separately by the page (see purchase_order_summary)
     return render_template(
         'inventory/view_purchase_order.html',
         order=order,
         items=items,
         supplier=supplier,
-        ai_summary=ai_summary
+        receivable=order.status not in ('received', 'canceled')
     )
 
+@inventory_bp.route('/purchase-orders/<int:order_id>/summary')
+@login_required
+def purchase_order_summary(order_id):
+    order = PurchaseOrder.query.options(db.joinedload(PurchaseOrder.supplier)).get_or_404(order_id)
+    items = PurchaseOrderItem.query.options(
+        db.joinedload(PurchaseOrderItem.product)
+    ).filter_by(purchase_order_id=order_id).all()
+    
+    prompt, fallback = ai_service.purchase_order_summary_prompt(order, order.supplier, items)
+    return _ai_content_response(prompt, fallback)
+
 @inventory_bp.route('/api/products/<int:product_id>', methods=['GET'])
 @login_required
 def get_product_api_info(product_id):
@@ -633,36 +708,50 @@ def update_purchase_order_status(order_id):
     new_status = request.form.get('status')
     
     if new_status in ['pending', 'approved', 'received', 'canceled']:
-        order.status = new_status
-        
-        # If status is received, update inventory
+        # Received: take everything still outstanding into stock
         if new_status == 'received':
-            items = PurchaseOrderItem.query.filter_by(purchase_order_id=order_id).all()
-            
-            for item in items:
-                product = Product.query.get(item.product_id)
-                
-                # Create inventory transaction
-                transaction = InventoryTransaction(
-                    product_id=item.product_id,
-                    transaction_type='purchase',
-                    quantity=item.quantity,
-                    unit_price=item.unit_price,
-                    total_price=item.total_price,
-                    notes=f"Received from PO #{order.id}",
-                    created_by=current_user.id
-                )
-                
-                db.session.add(transaction)
-                
-                # Update product stock
-                product.quantity_in_stock += item.quantity
+            return _receive_purchase_order(order)
         
+        order.status = new_status
         db.session.commit()
         flash(f'Purchase order status updated to {new_status}', 'success')
     
     return redirect(url_for('inventory.view_purchase_order', order_id=order_id))
 
+@inventory_bp.route('/purchase-orders/<int:order_id>/receive', methods=['POST'])
+@login_required
+def receive_purchase_order(order_id):
+    """Partial receipt: form fields receive-<item id> give the units delivered per line"""
+    order = PurchaseOrder.query.get_or_404(order_id)
+    try:
+        quantities = {
+            int(key[len('receive-'):]): int(value or 0)
+            for key, value in request.form.items() if key.startswith('receive-')
+        }
+    except ValueError:
+        flash('Received quantities must be whole numbers', 'danger')
+        return redirect(url_for('inventory.view_purchase_order', order_id=order_id))
+    return _receive_purchase_order(order, quantities)
+
+def _receive_purchase_order(order, quantities=None):
+    try:
+        result = PurchaseOrderService.receive(order.id, quantities, user_id=current_user.id)
+    except (LookupError, ValueError) as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('inventory.view_purchase_order', order_id=order.id))
+    
+    db.session.commit()
+    if result['received']:
+        stock_changed.send(current_app._get_current_object(), product_ids=list(result['received']))
+        units = sum(result['received'].values())
+        flash(f"Received {units} units; purchase order is now {result['status'].replace('_', ' ')}", 'success')
+    elif quantities:
+        flash('No units were entered, so nothing was received', 'info')
+    else:
+        flash('Nothing left to receive on this purchase order', 'info')
+    return redirect(url_for('inventory.view_purchase_order', order_id=order.id))
+
 @inventory_bp.route('/purchase-orders/<int:order_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_purchase_order(order_id):
@@ -675,8 +764,11 @@ def edit_purchase_order(order_id):
     if form.validate_on_submit():
         # Update purchase order details
         form.populate_obj(purchase_order)
-          # Remove existing items - we'll replace them with the updated ones
+          # Remove existing items - we'll replace them with the updated ones,
+          # keeping what was already received so it isn't received twice
+        already_received = defaultdict(int)
         for item in purchase_order.items:
+            already_received[item.product_id] += item.received_quantity or 0
             db.session.delete(item)
         
         # Process items from form data
@@ -717,6 +809,7 @@ def edit_purchase_order(order_id):
                 purchase_order_id=purchase_order.id,
                 product_id=product_id,
                 quantity=quantity,
+                received_quantity=already_received.pop(product_id, 0),
                 unit_price=unit_price,
                 total_price=total_price
             )
@@ -773,72 +866,8 @@ def chatbot_api():
     data = request.json
     user_message = data.get('message', '')
     
-    # Check if this is a confirmation for a pending update
-    confirmation_words = ["yes", "confirm", "approved", "ok", "okay", "sure", "go ahead", "do it", "y", "yep", "yeah"]
-    is_confirmation = user_message.lower().strip() in confirmation_words or any(word in user_message.lower() for word in confirmation_words)
-    
-    # If we have a pending update in session and the message is a confirmation
-    if is_confirmation and 'pending_stock_update' in session:
-        try:
-            # Get the pending update info
-            update_info = session.pop('pending_stock_update')
-            product_id = update_info['product_id']
-            quantity = update_info['quantity']
-            
-            # For operations other than 'add', adjust the quantity accordingly
-            if update_info['operation'] != 'add':
-                quantity = -quantity
-            
-            # Process the stock update directly without going through chatbot service
-            product = Product.query.get(product_id)
-            
-            if not product:
-                return jsonify({
-                    "success": False, 
-                    "message": "Product not found. The update was not processed."
-                })
-            
-            # Update stock
-            original_quantity = product.quantity_in_stock
-            product.quantity_in_stock += quantity
-            
-            # Create transaction record
-            transaction = InventoryTransaction(
-                product_id=product.id,
-                transaction_type="IN" if quantity > 0 else "OUT",
-                quantity=abs(quantity),
-                unit_price=product.unit_price,
-                total_price=abs(quantity) * product.unit_price,
-                notes=f"Stock update via chatbot",
-                created_by=current_user.id
-            )
-            
-            db.session.add(transaction)
-            db.session.commit()
-            
-            return jsonify({
-                "success": True,
-                "message": f"Successfully updated {product.name} stock from {original_quantity} to {product.quantity_in_stock}."
-            })
-            
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({
-                "success": False, 
-                "message": f"Error updating stock: {str(e)}"
-            })
-    
-    # Otherwise, process message with chatbot service
+    # Confirmations resolve the pending update from the conversation store
     result = chatbot_service.process_message(user_message, current_user.id)
-    
-    # Store context in session if needed for confirmation flow
-    if result.get('needsConfirmation'):
-        session['pending_stock_update'] = {
-            'product_id': result['product']['id'],
-            'quantity': result['product']['quantity'],
-            'operation': result['product']['operation']
-        }
-    
     return jsonify(result)
 
 @inventory_bp.route('/chatbot/confirm', methods=['POST'])
@@ -848,64 +877,21 @@ def confirm_stock_update():
     data = request.json
     confirmation = data.get('confirmation', False)
     
-    if not confirmation or 'pending_stock_update' not in session:
+    result = chatbot_service.confirm_pending_update(current_user.id) if confirmation else None
+    if result is None:
         return jsonify({
             "success": False,
             "message": "No pending stock update to confirm"
         })
-    
-    # Get the same update info that would be used by chatbot/api
-    update_info = session.get('pending_stock_update')
-    product_id = update_info['product_id']
-    quantity = update_info['quantity']
-    
-    # For operations other than 'add', adjust the quantity accordingly
-    if update_info['operation'] != 'add':
-        quantity = -quantity
-    
-    # Process the stock update
-    product = Product.query.get(product_id)
-    
-    if not product:
-        return jsonify({"success": False, "message": "Product not found"})
-    
-    try:
-        # Update stock
-        original_quantity = product.quantity_in_stock
-        product.quantity_in_stock += quantity
-        
-        # Create transaction record
-        transaction = InventoryTransaction(
-            product_id=product.id,
-            transaction_type="IN" if quantity > 0 else "OUT",
-            quantity=abs(quantity),
-            unit_price=product.unit_price,
-            total_price=abs(quantity) * product.unit_price,
-            notes=f"Stock update via chatbot",
-            created_by=current_user.id
-        )
-        
-        db.session.add(transaction)
-        db.session.commit()
-        
-        # Remove from session after successful update
-        session.pop('pending_stock_update', None)
-        
-        return jsonify({
-            "success": True,
-            "message": f"Successfully updated {product.name} stock from {original_quantity} to {product.quantity_in_stock}."
-        })
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"success": False, "message": f"Error updating stock: {str(e)}"})
+    return jsonify(result)
 
 @inventory_bp.route('/analytics')
 def analytics_view():
-    # 1) Load or generate ML results
+    # 1) Load ML results; if there are none yet, queue a run instead of blocking the page
     results = AnalysisService.get_latest_results()
+    job = None
     if not results:
-        AnalysisService.run_ml_analysis()
-        results = AnalysisService.get_latest_results()
+        job = _enqueue_analytics_job('ml_analysis', {'incremental': True})
 
     # 2) Create a list of dicts for JSON‐ready data
     js_results = [r.to_dict() for r in results]
@@ -914,26 +900,46 @@ def analytics_view():
     return render_template(
         'inventory/analytics.html',
         ml_results=results,       # ORM objects for the table
-        ml_results_json=js_results  # list of simple dicts for Chart.js
+        ml_results_json=js_results,  # list of simple dicts for Chart.js
+        pending_job_url=url_for('inventory.job_status', job_id=job.id) if job else None
+    )
+
+def _enqueue_analytics_job(kind, params=None):
+    """
+    Queue an analytics job; a request while one with the same params is
+    queued or running gets that job back (a full run doesn't collapse into
+    an incremental one)
+    """
+    dedupe_key = kind
+    if params:
+        dedupe_key += ':' + ','.join(f"{name}={value}" for name, value in sorted(params.items()))
+    return job_queue.enqueue(
+        kind, params,
+        dedupe_key=dedupe_key,
+        user_id=current_user.id if current_user.is_authenticated else None
     )
 
+def _job_accepted(job):
+    return jsonify(
+        success=True,
+        job=job.to_dict(),
+        status_url=url_for('inventory.job_status', job_id=job.id)
+    ), 202
+
 @inventory_bp.route('/analytics/run', methods=['POST'])
+@login_required
 def analytics_run():
-    AnalysisService.run_ml_analysis()
-    return jsonify(success=True)
+    # ?mode=full rebuilds the aggregates and recomputes every product
+    job = _enqueue_analytics_job('ml_analysis', {'incremental': request.args.get('mode') != 'full'})
+    return _job_accepted(job)
 
 @inventory_bp.route('/analytics/email', methods=['POST'])
+@login_required
 def analytics_email():
-    # generate or load results
-    results = AnalysisService.get_latest_results()
-    if not results:
-        results = AnalysisService.run_ml_analysis()
-    run_date = datetime.utcnow()
+    return _job_accepted(_enqueue_analytics_job('analytics_email'))
 
-    # send email
-    try:
-        EmailService.send_analytics_report(results, run_date)
-        return jsonify(success=True)
-    except Exception as e:
-        current_app.logger.exception("Failed to send analytics emails")
-        return jsonify(success=False, error=str(e)), 500
\ No newline at end of file
+@inventory_bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    job = Job.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
@@ -44,6 +45,10 @@ class Category(db.Model):
         return f'<Category {self.name}>'
 
 class Product(db.Model):
+    __table_args__ = (
+        # Stock is only changed through StockLedger, which never goes below zero
+        db.CheckConstraint('quantity_in_stock >= 0', name='ck_product_quantity_in_stock_non_negative'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -52,8 +57,8 @@ class Product(db.Model):
     quantity_in_stock = db.Column(db.Integer, default=0)
     reorder_level = db.Column(db.Integer, default=10)
     reorder_quantity = db.Column(db.Integer, default=50)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
-    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'))
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), index=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -64,12 +69,28 @@ class Product(db.Model):
     def __repr__(self):
         return f'<Product {self.name}>'
 
+# Product search (ProductSearch): case-insensitive exact SKU lookups, plus
+# trigram indexes on PostgreSQL that serve ranked and '%term%' searches
+db.Index('ix_product_sku_lower', db.func.lower(Product.sku), postgresql_using='hash')
+for _column in ('name', 'sku', 'description'):
+    db.Index(f'ix_product_{_column}_trgm', Product.__table__.c[_column],
+             postgresql_using='gin', postgresql_ops={_column: 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+db.event.listen(
+    Product.__table__, 'before_create',
+    db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'),
+)
+
 class InventoryTransaction(db.Model):
+    __table_args__ = (
+        # Per-product history (newest first) and per-type date-range charts
+        db.Index('ix_inventory_transaction_product_id_date', 'product_id', 'transaction_date'),
+        db.Index('ix_inventory_transaction_type_date', 'transaction_type', 'transaction_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     transaction_type = db.Column(db.String(20), nullable=False)  # 'purchase', 'sale', 'adjustment'
     quantity = db.Column(db.Integer, nullable=False)
-    transaction_date = db.Column(db.DateTime, default=datetime.utcnow)
+    transaction_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     unit_price = db.Column(db.Float)
     total_price = db.Column(db.Float)
     notes = db.Column(db.Text)
@@ -82,7 +103,25 @@ class InventoryTransaction(db.Model):
     def __repr__(self):
         return f'<InventoryTransaction {self.id} {self.transaction_type}>'
 
+class StockMovementRollup(db.Model):
+    """Transaction quantities per product and type, bucketed by hour and by day for the dashboard"""
+    __tablename__ = 'stock_movement_rollups'
+    granularity       = db.Column(db.String(4), primary_key=True)  # 'hour' or 'day'
+    bucket            = db.Column(db.DateTime, primary_key=True)   # start of the hour / day
+    product_id        = db.Column(db.Integer, primary_key=True)
+    transaction_type  = db.Column(db.String(20), primary_key=True) # 'purchase', 'sale', 'adjustment', ...
+    quantity          = db.Column(db.Integer, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StockMovementRollup {self.granularity} {self.bucket} Product:{self.product_id} {self.transaction_type}>'
+
 class Notification(db.Model):
+    __table_args__ = (
+        # Duplicate checks in NotificationService, and unread-first listings
+        db.Index('ix_notification_product_type_read', 'product_id', 'notification_type', 'is_read'),
+        db.Index('ix_notification_read_created', 'is_read', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     notification_type = db.Column(db.String(50), nullable=False)  # 'low_stock', 'irregular_activity', etc.
@@ -95,12 +134,44 @@ class Notification(db.Model):
     def __repr__(self):
         return f'<Notification {self.id} {self.notification_type}>'
 
+class Watermark(db.Model):
+    """High-water marks for background jobs that process transactions incrementally"""
+    __tablename__ = 'watermarks'
+    name = db.Column(db.String(64), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Watermark {self.name} {self.last_id}>'
+
+class CacheEntry(db.Model):
+    """Rows for the SQL-backed response cache (see app.services.cache_service.SQLCache)"""
+    __tablename__ = 'cache_entries'
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_accessed = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<CacheEntry {self.key}>'
+
+class ConversationState(db.Model):
+    """Rows for the SQL-backed chat conversation state (see app.services.conversation_state)"""
+    __tablename__ = 'conversation_states'
+    key = db.Column(db.String(255), primary_key=True)
+    value = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<ConversationState {self.key}>'
+
 class PurchaseOrder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), nullable=False)
-    order_date = db.Column(db.DateTime, default=datetime.utcnow)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), nullable=False, index=True)
+    order_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     expected_delivery_date = db.Column(db.DateTime)
-    status = db.Column(db.String(20), default='pending')  # pending, approved, received, canceled
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, approved, partially_received, received, canceled
     total_amount = db.Column(db.Float, default=0)
     notes = db.Column(db.Text)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -117,15 +188,20 @@ class PurchaseOrder(db.Model):
 
 class PurchaseOrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    purchase_order_id = db.Column(db.Integer, db.ForeignKey('purchase_order.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    purchase_order_id = db.Column(db.Integer, db.ForeignKey('purchase_order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
+    received_quantity = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     unit_price = db.Column(db.Float, nullable=False)
     total_price = db.Column(db.Float, nullable=False)
     
     # Relationships
     product = db.relationship('Product')
     
+    @property
+    def outstanding_quantity(self):
+        return max(self.quantity - (self.received_quantity or 0), 0)
+    
     def __repr__(self):
         return f'<PurchaseOrderItem {self.id}>'
 
@@ -134,9 +210,9 @@ class PurchaseOrderItem(db.Model):
 class MLResult(db.Model):
     __tablename__ = 'ml_results'
     id                       = db.Column(db.Integer, primary_key=True)
-    run_id                   = db.Column(db.String(36), nullable=False)
-    run_date                 = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    product_id               = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    run_id                   = db.Column(db.String(36), nullable=False, index=True)
+    run_date                 = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    product_id               = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     product_name             = db.Column(db.String(100))
     category_name            = db.Column(db.String(64))
     supplier_name            = db.Column(db.String(100))
@@ -155,4 +231,75 @@ class MLResult(db.Model):
         }
 
     def __repr__(self):
-        return f'<MLResult {self.id} Run:{self.run_id} Product:{self.product_id}>'
\ No newline at end of file
+        return f'<MLResult {self.id} Run:{self.run_id} Product:{self.product_id}>'
+
+class MLSummary(db.Model):
+    """Latest AI summary per product, reused by ML runs while the product's facts are unchanged"""
+    __tablename__ = 'ml_summaries'
+    product_id  = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    ai_summary  = db.Column(db.Text, nullable=False)
+    updated_at  = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MLSummary Product:{self.product_id}>'
+
+class MLDailyAggregate(db.Model):
+    """Per-product daily transaction totals, maintained incrementally for ML runs"""
+    __tablename__ = 'ml_daily_aggregates'
+    product_id       = db.Column(db.Integer, primary_key=True)
+    day              = db.Column(db.Date, primary_key=True)
+    transaction_type = db.Column(db.String(20), primary_key=True)
+    quantity         = db.Column(db.Integer, nullable=False, default=0)
+    unit_price_sum   = db.Column(db.Float, nullable=False, default=0)
+    priced_count     = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<MLDailyAggregate Product:{self.product_id} {self.day} {self.transaction_type}>'
+
+class MLProductState(db.Model):
+    """Fingerprint of the inputs behind each product's latest MLResult row"""
+    __tablename__ = 'ml_product_state'
+    product_id        = db.Column(db.Integer, primary_key=True)
+    input_fingerprint = db.Column(db.String(64), nullable=False)
+    updated_at        = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MLProductState Product:{self.product_id}>'
+
+class Job(db.Model):
+    """A unit of background work (ML runs, report emails) and its progress"""
+    __tablename__ = 'jobs'
+    id           = db.Column(db.String(36), primary_key=True)
+    kind         = db.Column(db.String(50), nullable=False)
+    # Set while the job is queued/running so only one such job per key exists
+    active_key   = db.Column(db.String(100), unique=True)
+    status       = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, failed
+    progress     = db.Column(db.Integer, nullable=False, default=0)
+    message      = db.Column(db.String(255))
+    params       = db.Column(db.Text)  # JSON
+    result       = db.Column(db.Text)  # JSON
+    error        = db.Column(db.Text)
+    attempts     = db.Column(db.Integer, nullable=False, default=0)
+    created_by   = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at   = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at   = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at  = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
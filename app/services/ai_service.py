@@ -1,10 +1,11 @@
 import os
 import requests
-import json
 import logging
 import datetime
 import re  # Added for markdown conversion
 from dotenv import load_dotenv
+from app.services.gemini_client import get_client, CircuitOpenError
+from app.services.cache_service import get_ai_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,20 +19,38 @@ GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
 class AIService:
     def __init__(self):
-        # New Gemini 2.0 API base URL
-        self.api_base_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+        # New Gemini 2.0 API base URL (overridable, e.g. to point at a local stub server)
+        self.model_name = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+        self.api_base_url = os.environ.get(
+            "GEMINI_API_BASE_URL",
+            f"https://generativelanguage.googleapis.com/v1beta/models/{self.model_name}:generateContent"
+        )
         self.api_key = GEMINI_API_KEY
+        self.client = get_client()
+        self.cache = get_ai_cache()
         
         if not self.api_key:
             logger.warning("GEMINI_API_KEY environment variable not set. AI service functionality will be limited.")
     
-    def _generate_content(self, prompt):
-        """Make API call to Gemini 2.0 Flash model"""
-        url = f"{self.api_base_url}?key={self.api_key}"
+    def _api_available(self):
+        """Whether to call the API at all, or go straight to the non-API fallback"""
+        return bool(self.api_key) and not self.client.breaker.is_open()
+    
+    def _generate_content(self, prompt, fallback=None):
+        """Make API call to Gemini 2.0 Flash model
         
-        headers = {
-            "Content-Type": "application/json"
-        }
+        Responses are cached by prompt, so unchanged data costs no API call.
+        Returns `fallback` (when given) instead of an error message if the call
+        fails, or if there is no cached response and the API is unavailable.
+        """
+        cached = self.cache.get(self.model_name, prompt)
+        if cached is not None:
+            return cached
+        
+        if not self._api_available():
+            return fallback or "The AI assistant is temporarily unavailable. Please try again later."
+        
+        url = f"{self.api_base_url}?key={self.api_key}"
         
         data = {
             "contents": [
@@ -45,10 +64,7 @@ class AIService:
         }
         
         try:
-            response = requests.post(url, headers=headers, data=json.dumps(data))
-            response.raise_for_status()  # Raise exception for 4XX/5XX responses
-            
-            response_data = response.json()
+            response_data = self.client.post_json(url, data)
             logger.debug(f"Gemini API response: {response_data}")
             
             # Extract text from the response based on the Gemini 2.0 response format
@@ -57,25 +73,29 @@ class AIService:
                 if 'content' in candidate and 'parts' in candidate['content']:
                     parts = candidate['content']['parts']
                     text_parts = [part.get('text', '') for part in parts if 'text' in part]
-                    return ''.join(text_parts)
+                    content = ''.join(text_parts)
+                    self.cache.set(self.model_name, prompt, content)
+                    return content
             
             # Fallback if the expected structure is not found
             logger.warning("Unable to extract content from Gemini API response")
-            return "Unable to generate content. Please try again later."
+            return fallback or "Unable to generate content. Please try again later."
             
+        except CircuitOpenError:
+            logger.warning("Gemini API circuit breaker is open, using fallback content")
+            return fallback or "The AI assistant is temporarily unavailable. Please try again later."
         except requests.exceptions.HTTPError as http_err:
             logger.error(f"HTTP error occurred: {http_err}")
-            if response.status_code == 404:
+            if http_err.response is not None and http_err.response.status_code == 404:
                 logger.error("404 error: Check API endpoint URL is correct")
-            return f"Error generating content: {str(http_err)}"
+            return fallback or f"Error generating content: {str(http_err)}"
         except Exception as e:
             logger.error(f"Error calling Gemini API: {e}")
-            return f"Error generating content: {str(e)}"
+            return fallback or f"Error generating content: {str(e)}"
     
     def generate_low_stock_notification(self, product, supplier):
         """Generate a notification for low stock products"""
-        if not self.api_key:
-            return f"Low stock alert for {product.name}. Current stock: {product.quantity_in_stock}. Please reorder {product.reorder_quantity} units from {supplier.name}."
+        fallback = f"Low stock alert for {product.name}. Current stock: {product.quantity_in_stock}. Please reorder {product.reorder_quantity} units from {supplier.name}."
         
         prompt = f"""
         Product '{product.name}' (SKU: {product.sku}) is running low on stock.
@@ -87,7 +107,7 @@ class AIService:
         Include a recommendation to reorder and how many units should be ordered (reorder quantity: {product.reorder_quantity}).
         """
         
-        content = self._generate_content(prompt)
+        content = self._generate_content(prompt, fallback=fallback)
         return self._convert_markdown_to_html(content)
     
     def _convert_markdown_to_html(self, text):
@@ -106,10 +126,23 @@ class AIService:
         
         return text
     
+    def render(self, prompt, fallback):
+        """Generate content for a prompt built by one of the *_prompt methods, as HTML"""
+        content = self._generate_content(prompt, fallback=fallback)
+        return self._convert_markdown_to_html(content)
+    
+    def cached_render(self, prompt):
+        """Return the cached HTML for a prompt, or None if it hasn't been generated yet"""
+        content = self.cache.get(self.model_name, prompt)
+        return self._convert_markdown_to_html(content) if content is not None else None
+    
     def generate_purchase_order_summary(self, purchase_order, supplier, items):
         """Generate a summary of a purchase order"""
-        if not self.api_key:
-            return f"Purchase Order #{purchase_order.id} for {supplier.name} containing {len(items)} items with total amount ${purchase_order.total_amount:.2f}."
+        return self.render(*self.purchase_order_summary_prompt(purchase_order, supplier, items))
+    
+    def purchase_order_summary_prompt(self, purchase_order, supplier, items):
+        """Build the (prompt, fallback) pair for a purchase order summary"""
+        fallback = f"Purchase Order #{purchase_order.id} for {supplier.name} containing {len(items)} items with total amount ${purchase_order.total_amount:.2f}."
         
         items_text = "\n".join([
             f"- {item.product.name} (SKU: {item.product.sku}): {item.quantity} units at ${item.unit_price:.2f} each = ${item.total_price:.2f}"
@@ -129,13 +162,15 @@ class AIService:
         Please generate a concise, professional summary of this purchase order. Highlight any important details and suggest next steps based on the current status.
         """
         
-        content = self._generate_content(prompt)
-        return self._convert_markdown_to_html(content)
+        return prompt, fallback
     
     def analyze_inventory_trends(self, product, transactions, days=30):
         """Analyze inventory trends for a product"""
-        if not self.api_key:
-            return f"Inventory analysis for {product.name}: Current stock level is {product.quantity_in_stock} units."
+        return self.render(*self.inventory_trends_prompt(product, transactions, days))
+    
+    def inventory_trends_prompt(self, product, transactions, days=30):
+        """Build the (prompt, fallback) pair for a product's inventory trend analysis"""
+        fallback = f"Inventory analysis for {product.name}: Current stock level is {product.quantity_in_stock} units."
             
         # Filter transactions from the last 'days' days
         now = datetime.datetime.now()
@@ -165,13 +200,11 @@ class AIService:
         3. Suggestions for optimizing the reorder level and quantity based on recent sales patterns
         """
         
-        content = self._generate_content(prompt)
-        return self._convert_markdown_to_html(content)
+        return prompt, fallback
     
     def generate_irregular_activity_alert(self, product, transaction, avg_quantity):
         """Generate an alert for irregular inventory activity"""
-        if not self.api_key:
-            return f"Irregular activity detected for {product.name}. Transaction quantity: {transaction.quantity}, Average: {avg_quantity:.2f}"
+        fallback = f"Irregular activity detected for {product.name}. Transaction quantity: {transaction.quantity}, Average: {avg_quantity:.2f}"
             
         deviation = transaction.quantity / avg_quantity if avg_quantity > 0 else 0
         
@@ -187,7 +220,7 @@ class AIService:
         Please generate a concise alert message explaining this irregular activity and suggesting possible explanations and actions to take.
         """
         
-        content = self._generate_content(prompt)
+        content = self._generate_content(prompt, fallback=fallback)
         return self._convert_markdown_to_html(content)
     
     def predict_restock_timing(self, product, transactions):
@@ -254,8 +287,7 @@ class AIService:
     
     def generate_inventory_recommendations(self, products, transactions, top_sellers, low_stock_products):
         """Generate AI-powered inventory recommendations"""
-        if not self.api_key:
-            return "Based on your current inventory data, consider restocking your top-selling products and reviewing slow-moving items."
+        fallback = "Based on your current inventory data, consider restocking your top-selling products and reviewing slow-moving items."
         
         # Format top sellers for the prompt
         top_sellers_text = "\n".join([
@@ -307,5 +339,5 @@ class AIService:
         Format your response as a numbered list with brief explanations.
         """
         
-        content = self._generate_content(prompt)
+        content = self._generate_content(prompt, fallback=fallback)
         return self._convert_markdown_to_html(content)
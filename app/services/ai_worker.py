@@ -0,0 +1,57 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.services.cache_service import MemoryCache
+
+logger = logging.getLogger(__name__)
+
+
+class AIWorkerPool:
+    """
+    Runs slow AI calls on a small thread pool so pages can render without
+    waiting for the model. Work is keyed so concurrent requests for the same
+    content share one call; finished results are kept briefly for pollers.
+    """
+
+    def __init__(self, max_workers=4, result_ttl=120):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-worker')
+        self._futures = {}
+        self._results = MemoryCache(max_entries=1024, default_ttl=result_ttl)
+        self._lock = threading.Lock()
+
+    def result(self, key):
+        """Return the finished result for `key`, or None if there isn't one"""
+        return self._results.get(key)
+
+    def submit(self, key, fn, *args):
+        """Run fn(*args) inside the current app's context unless `key` is already in flight"""
+        app = current_app._get_current_object()
+
+        def run():
+            with app.app_context():
+                return fn(*args)
+
+        with self._lock:
+            if key in self._futures:
+                return self._futures[key]
+            future = self._executor.submit(run)
+            self._futures[key] = future
+
+        future.add_done_callback(lambda f: self._finish(key, f))
+        return future
+
+    def _finish(self, key, future):
+        try:
+            self._results.set(key, future.result())
+        except Exception:
+            logger.exception("AI worker task failed")
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+
+ai_worker = AIWorkerPool(max_workers=int(os.getenv('AI_WORKER_THREADS', 4)))
@@ -1,50 +1,155 @@
 import os
+import json
+import time
 import uuid
-from datetime import datetime, timedelta
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
 
 import pandas as pd
 import google.generativeai as genai
-from sqlalchemy import text, func
+from sqlalchemy import text, func, delete, insert
 from sklearn.cluster import KMeans
 from sklearn.linear_model import LinearRegression
 from dotenv import load_dotenv
 
 from app import db
-from app.models.models import MLResult
+from app.models.models import (
+    MLResult, MLSummary, MLDailyAggregate, MLProductState,
+    InventoryTransaction, Watermark
+)
+from app.utils.sql import upsert
+from app.services.email_service import EmailService
+from app.services.job_queue import job_queue
+
+logger = logging.getLogger(__name__)
 
 # Load your Gemini key once
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-_model = genai.GenerativeModel("gemini-1.5-flash")
+_MODEL_NAME = "gemini-1.5-flash"
+_model = genai.GenerativeModel(_MODEL_NAME)
+
+# Summary generation limits (products per request, parallel requests, requests per minute)
+SUMMARY_BATCH_SIZE  = int(os.getenv("ML_SUMMARY_BATCH_SIZE", 20))
+SUMMARY_CONCURRENCY = int(os.getenv("ML_SUMMARY_CONCURRENCY", 4))
+SUMMARY_RPM         = int(os.getenv("ML_SUMMARY_RPM", 60))
+
+
+class _RateLimiter:
+    """Spaces out calls across threads so at most `per_minute` start per minute"""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _product_facts(r, days):
+    """The facts an AI summary may use for one feature row"""
+    return (
+        f"• Product: {r.product_name} (ID {r.product_id})\n"
+        f"• Category: {r.category_name}\n"
+        f"• Supplier: {r.supplier_name}\n"
+        f"• Popularity Index (1→3): {r.popularity_index}\n"
+        f"• Current Stock: {r.current_stock}\n"
+        f"• Reorder Level: {r.reorder_level}\n"
+        f"• Stock In (last {days}d): {r.stock_in}\n"
+        f"• Stock Out (last {days}d): {r.stock_out}\n"
+        f"• Predicted Days Until Reorder: {r.predicted_days_until_reorder:.1f}\n"
+    )
+
+
+def _fallback_summary(r):
+    """Plain summary used when the LLM call for a product fails"""
+    summary = (
+        f"{r.product_name} has {r.current_stock:g} units in stock against a reorder level of "
+        f"{r.reorder_level:g}, with about {r.predicted_days_until_reorder:.1f} days until reorder."
+    )
+    if r.predicted_days_until_reorder < 0.05:
+        summary += " This product needs restocking immediately."
+    return summary
+
+
+def _summarize_batch(facts_by_product):
+    """One LLM request summarizing several products; returns {product_id: summary}"""
+    products_text = "\n".join(facts for facts in facts_by_product.values())
+    prompt = (
+        "You are an inventory analytics assistant. For EACH product below, write a "
+        "2–3 sentence summary using ONLY that product's facts. "
+        "If a product's Predicted Days Until Reorder is 0, say “This product needs restocking immediately.”\n"
+        "Return ONLY a JSON object mapping each product ID (as a string) to its summary.\n\n"
+        f"{products_text}"
+    )
+    text_out = _model.generate_content(prompt).text.strip()
+
+    # The response may be wrapped in a markdown code block
+    if "```" in text_out:
+        text_out = text_out.split("```")[1]
+        if text_out.startswith("json"):
+            text_out = text_out[len("json"):]
+    parsed = json.loads(text_out)
+
+    return {
+        int(product_id): str(summary).strip()
+        for product_id, summary in parsed.items()
+        if str(product_id).isdigit() and int(product_id) in facts_by_product
+    }
 
 
 class AnalysisService:
     @staticmethod
-    def run_ml_analysis(days: int = 90):
+    def run_ml_analysis(days: int = 90, incremental: bool = True, progress=None):
         """
-        1) Pull last `days` of transactions & product info
-        2) Compute popularity_index & predicted_days_until_reorder
-        3) Generate LLM summary per product
-        4) Bulk-insert into ml_results table
+        1) Fold transactions recorded since the last run into daily aggregates
+        2) Build per-product features for the last `days` from the aggregates
+        3) Compute popularity_index & predicted_days_until_reorder
+        4) Generate LLM summaries for products whose inputs changed
+        5) Bulk-insert a new run into ml_results, reusing unchanged rows
+
+        With incremental=False the aggregates are rebuilt from the raw
+        transactions and every product is recomputed. `progress(percent,
+        message)` is called as the run advances, e.g. to update a Job.
         """
+        progress = progress or (lambda percent, message=None: None)
         run_id   = str(uuid.uuid4())
         run_date = datetime.utcnow()
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
-        engine   = db.engine
 
-        # 1) Load transactions in window
+        # 1) Update the daily aggregates from new transactions only
+        progress(5, "Aggregating new transactions")
+        AnalysisService._ingest_transactions(start_date, rebuild=not incremental)
+        # The aggregates and watermark are consistent on their own; commit them
+        # so the slow steps below don't hold write locks
+        db.session.commit()
+        engine = db.session.connection()
+
+        # 2) Load windowed aggregates + product, category & supplier info
         txns = pd.read_sql(
             text("""
-                SELECT product_id, transaction_type, quantity, unit_price, transaction_date
-                FROM inventory_transaction
-                WHERE transaction_date BETWEEN :start_date AND :end_date
+                SELECT product_id, transaction_type,
+                       SUM(quantity)       AS quantity,
+                       SUM(unit_price_sum) AS unit_price_sum,
+                       SUM(priced_count)   AS priced_count
+                FROM ml_daily_aggregates
+                WHERE day BETWEEN :start_day AND :end_day
+                GROUP BY product_id, transaction_type
             """),
             engine,
-            params={"start_date": start_date, "end_date": end_date}
+            params={"start_day": start_date.date(), "end_day": end_date.date()}
         )
 
-        # 2) Load product + category + supplier
         products = pd.read_sql(
             text("""
                 SELECT p.id              AS product_id,
@@ -62,11 +167,11 @@ class AnalysisService:
         )
 
         # 3) Feature engineering
+        progress(25, "Building features")
         grouped = (
             txns
-            .groupby(["product_id","transaction_type"])["quantity"]
-            .sum()
-            .unstack(fill_value=0)
+            .pivot_table(index="product_id", columns="transaction_type",
+                         values="quantity", aggfunc="sum", fill_value=0)
             .reset_index()
         )
         feat = products.merge(grouped, on="product_id", how="left").fillna(0)
@@ -74,13 +179,11 @@ class AnalysisService:
         feat["stock_out"]   = feat.get("sale", 0)
         feat["total_moved"] = feat["stock_in"] + feat["stock_out"]
 
-        avg_price = (
-            txns[txns.transaction_type=="sale"]
-            .groupby("product_id")["unit_price"]
-            .mean()
-            .reset_index()
-            .rename(columns={"unit_price":"avg_unit_price"})
-        )
+        sales = txns[(txns.transaction_type=="sale") & (txns.priced_count > 0)]
+        avg_price = pd.DataFrame({
+            "product_id":     sales["product_id"],
+            "avg_unit_price": sales["unit_price_sum"] / sales["priced_count"],
+        })
         feat = feat.merge(avg_price, on="product_id", how="left") \
                    .fillna({"avg_unit_price": 0})
 
@@ -91,17 +194,18 @@ class AnalysisService:
             / feat["avg_daily_sale"]
         ).clip(lower=0)
 
-        # 4) Popularity index via K-Means (3 clusters)
+        # 4) Popularity index via K-Means (3 clusters), numbered by activity
+        progress(35, "Fitting models")
+        #    so index 1 is always the least and 3 the most popular cluster
         pop_inputs = feat[[
             "current_stock","stock_out",
             "stock_in","total_moved",
             "avg_unit_price"
         ]]
-        feat["popularity_index"] = (
-            KMeans(n_clusters=3, random_state=42)
-            .fit_predict(pop_inputs)
-            + 1
-        )
+        kmeans = KMeans(n_clusters=3, random_state=42).fit(pop_inputs)
+        order  = kmeans.cluster_centers_[:, pop_inputs.columns.get_loc("total_moved")].argsort()
+        rank   = {cluster: i + 1 for i, cluster in enumerate(order)}
+        feat["popularity_index"] = [rank[label] for label in kmeans.labels_]
 
         # 5) Predict days_until_reorder with a simple regression
         X = feat[[
@@ -115,46 +219,200 @@ class AnalysisService:
             .clip(min=0)
         )
 
-        # 6) Generate AI summaries
-        def _make_summary(r):
-            prompt = (
-                f"You are an inventory analytics assistant. Use ONLY these facts:\n"
-                f"• Product: {r.product_name} (ID {r.product_id})\n"
-                f"• Category: {r.category_name}\n"
-                f"• Supplier: {r.supplier_name}\n"
-                f"• Popularity Index (1→3): {r.popularity_index}\n"
-                f"• Current Stock: {r.current_stock}\n"
-                f"• Reorder Level: {r.reorder_level}\n"
-                f"• Stock In (last {days}d): {r.stock_in}\n"
-                f"• Stock Out (last {days}d): {r.stock_out}\n"
-                f"• Predicted Days Until Reorder: {r.predicted_days_until_reorder:.1f}\n\n"
-                "Write a 2–3 sentence summary. "
-                "If Predicted Days Until Reorder is 0, say “This product needs restocking immediately.”"
+        # 6) Split products into unchanged (reuse last run's row) and changed
+        feat["input_fingerprint"] = [
+            hashlib.sha256(repr((
+                days, r.product_name, r.category_name, r.supplier_name,
+                int(r.current_stock), int(r.reorder_level), int(r.reorder_quantity),
+                float(r.stock_in), float(r.stock_out), round(float(r.avg_unit_price), 4),
+            )).encode("utf-8")).hexdigest()
+            for r in feat.itertuples(index=False)
+        ]
+
+        previous_rows = {}
+        if incremental:
+            previous_run_id = (
+                db.session.query(MLResult.run_id)
+                          .order_by(MLResult.run_date.desc())
+                          .limit(1)
+                          .scalar()
             )
-            return _model.generate_content(prompt).text.strip()
+            if previous_run_id:
+                fingerprints = dict(zip(feat["product_id"].astype(int), feat["input_fingerprint"]))
+                unchanged = {
+                    s.product_id
+                    for s in MLProductState.query.all()
+                    if fingerprints.get(s.product_id) == s.input_fingerprint
+                }
+                previous_rows = {
+                    r.product_id: r
+                    for r in MLResult.query.filter(MLResult.run_id == previous_run_id)
+                    if r.product_id in unchanged
+                }
 
-        feat["ai_summary"] = feat.apply(_make_summary, axis=1)
+        changed = feat[~feat["product_id"].isin(list(previous_rows))]
+        logger.info("ML run %s: %d products unchanged, %d recomputed", run_id, len(previous_rows), len(changed))
 
-        # 7) Prepare ORM objects & bulk-save
+        # 7) Generate AI summaries for changed products (batched & concurrent)
+        progress(45, f"Summarizing {len(changed)} changed products")
+        summaries = AnalysisService._generate_summaries(
+            changed, days,
+            on_batch_done=lambda done, total: progress(45 + 45 * done // total, f"Summarized {done}/{total} batches")
+        ) if len(changed) else {}
+
+        # 8) Prepare ORM objects & bulk-save
+        progress(90, "Saving results")
         results = []
         for row in feat.itertuples(index=False):
+            product_id = int(row.product_id)
+            previous   = previous_rows.get(product_id)
             results.append(MLResult(
                 run_id                      = run_id,
                 run_date                    = run_date,
-                product_id                  = int(row.product_id),
+                product_id                  = product_id,
                 product_name                = row.product_name,
                 category_name               = row.category_name,
                 supplier_name               = row.supplier_name,
-                popularity_index            = int(row.popularity_index),
-                predicted_days_until_reorder= float(row.predicted_days_until_reorder),
-                ai_summary                  = row.ai_summary,
+                popularity_index            = previous.popularity_index if previous else int(row.popularity_index),
+                predicted_days_until_reorder= previous.predicted_days_until_reorder if previous else float(row.predicted_days_until_reorder),
+                ai_summary                  = previous.ai_summary if previous else (summaries.get(product_id) or _fallback_summary(row)),
             ))
 
+        if len(changed):
+            changed_ids = [int(product_id) for product_id in changed["product_id"]]
+            db.session.execute(delete(MLProductState).where(MLProductState.product_id.in_(changed_ids)))
+            # Products that fell back get no fingerprint, so the next run
+            # counts them as changed and retries their summary
+            summarized = [
+                {"product_id": int(r.product_id), "input_fingerprint": r.input_fingerprint}
+                for r in changed.itertuples(index=False)
+                if int(r.product_id) in summaries
+            ]
+            if summarized:
+                db.session.execute(insert(MLProductState), summarized)
+
         db.session.bulk_save_objects(results)
         db.session.commit()
 
         return results
 
+    @staticmethod
+    def _ingest_transactions(start_date, rebuild=False):
+        """
+        Fold inventory_transaction rows past the 'ml_analysis' watermark into
+        ml_daily_aggregates. With rebuild=True the aggregates are cleared and
+        rebuilt from transactions dated on or after `start_date`.
+        """
+        watermark = db.session.get(Watermark, "ml_analysis") or Watermark(name="ml_analysis", last_id=0)
+        if rebuild:
+            db.session.execute(delete(MLDailyAggregate))
+            watermark.last_id = 0
+
+        max_id = db.session.query(func.max(InventoryTransaction.id)).scalar() or 0
+        if max_id > watermark.last_id:
+            day = func.date(InventoryTransaction.transaction_date)
+            query = db.session.query(
+                InventoryTransaction.product_id,
+                day,
+                InventoryTransaction.transaction_type,
+                func.sum(InventoryTransaction.quantity),
+                func.coalesce(func.sum(InventoryTransaction.unit_price), 0),
+                func.count(InventoryTransaction.unit_price),
+            ).filter(
+                InventoryTransaction.id > watermark.last_id,
+                InventoryTransaction.id <= max_id,
+                InventoryTransaction.transaction_date.isnot(None),
+            )
+            if rebuild:
+                query = query.filter(InventoryTransaction.transaction_date >= start_date)
+            query = query.group_by(InventoryTransaction.product_id, day, InventoryTransaction.transaction_type)
+
+            upsert(
+                MLDailyAggregate.__table__,
+                [
+                    {
+                        "product_id": product_id,
+                        # SQLite returns DATE() as a string
+                        "day": date.fromisoformat(day_) if isinstance(day_, str) else day_,
+                        "transaction_type": transaction_type,
+                        "quantity": int(quantity or 0),
+                        "unit_price_sum": float(unit_price_sum),
+                        "priced_count": int(priced_count),
+                    }
+                    for product_id, day_, transaction_type, quantity, unit_price_sum, priced_count in query
+                ],
+                key_columns=("product_id", "day", "transaction_type"),
+                add_columns=("quantity", "unit_price_sum", "priced_count"),
+            )
+
+        watermark.last_id = max_id
+        db.session.add(watermark)
+
+    @staticmethod
+    def _generate_summaries(feat, days, on_batch_done=None):
+        """
+        Return {product_id: summary} for the products of `feat` that have a
+        real summary; products left out need _fallback_summary. Products whose
+        facts match their stored MLSummary fingerprint reuse it; the rest are
+        summarized several per request on a bounded, rate-limited thread pool.
+        A failed request only falls back for its own products.
+        `on_batch_done(done, total)` is called as each request finishes.
+        """
+        rows = list(feat.itertuples(index=False))
+        facts = {int(r.product_id): _product_facts(r, days) for r in rows}
+        fingerprints = {
+            product_id: hashlib.sha256(f"{_MODEL_NAME}\n{text_}".encode("utf-8")).hexdigest()
+            for product_id, text_ in facts.items()
+        }
+
+        stored = {
+            s.product_id: s
+            for s in MLSummary.query.filter(MLSummary.product_id.in_(list(facts)))
+        }
+        summaries = {
+            product_id: stored[product_id].ai_summary
+            for product_id, fingerprint in fingerprints.items()
+            if product_id in stored and stored[product_id].fingerprint == fingerprint
+        }
+
+        pending = [product_id for product_id in facts if product_id not in summaries]
+        batches = [
+            {product_id: facts[product_id] for product_id in pending[i:i + SUMMARY_BATCH_SIZE]}
+            for i in range(0, len(pending), max(SUMMARY_BATCH_SIZE, 1))
+        ]
+        logger.info(
+            "ML summaries: %d reused, %d to generate in %d requests",
+            len(summaries), len(pending), len(batches)
+        )
+
+        limiter = _RateLimiter(SUMMARY_RPM)
+
+        def run_batch(batch):
+            limiter.wait()
+            return _summarize_batch(batch)
+
+        generated = {}
+        with ThreadPoolExecutor(max_workers=max(SUMMARY_CONCURRENCY, 1)) as executor:
+            futures = {executor.submit(run_batch, batch): batch for batch in batches}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    generated.update(future.result())
+                except Exception as e:
+                    logger.warning(f"Summary request for {len(futures[future])} products failed: {e}")
+                if on_batch_done:
+                    on_batch_done(done, len(batches))
+
+        # Remember the new summaries; products that fell back are retried next run
+        if generated:
+            db.session.execute(delete(MLSummary).where(MLSummary.product_id.in_(list(generated))))
+            db.session.execute(insert(MLSummary), [
+                {"product_id": product_id, "fingerprint": fingerprints[product_id], "ai_summary": summary}
+                for product_id, summary in generated.items()
+            ])
+        summaries.update(generated)
+
+        return {product_id: summary for product_id, summary in summaries.items() if summary}
+
     @staticmethod
     def get_latest_results():
         """
@@ -169,3 +427,21 @@ class AnalysisService:
                     .order_by(MLResult.product_name)
                     .all()
         )
+
+
+@job_queue.handler("ml_analysis")
+def run_ml_analysis_job(job, incremental=True):
+    """Background job: run the ML pipeline and report which run it produced"""
+    results = AnalysisService.run_ml_analysis(incremental=incremental, progress=job.progress)
+    return {"run_id": results[0].run_id if results else None, "products": len(results)}
+
+
+@job_queue.handler("analytics_email")
+def send_analytics_email_job(job):
+    """Background job: email the latest ML results, running the pipeline first if there are none"""
+    results = AnalysisService.get_latest_results()
+    if not results:
+        results = AnalysisService.run_ml_analysis(progress=lambda percent, message=None: job.progress(percent * 8 // 10, message))
+    job.progress(80, "Sending report")
+    EmailService.send_analytics_report(results, datetime.utcnow())
+    return {"products": len(results)}
@@ -0,0 +1,210 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete, func
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCache:
+    """Thread-safe in-process cache with a TTL per entry and LRU eviction"""
+
+    def __init__(self, max_entries=1024, default_ttl=3600):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def pop(self, key):
+        """Remove `key` and return its value; only one of several concurrent callers gets it"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class SQLCache:
+    """
+    Cache stored in the cache_entries table so it is shared between worker
+    processes and survives restarts. Values must be strings. Uses its own
+    connection so cache writes never commit the caller's session.
+    """
+
+    def __init__(self, max_entries=10000, default_ttl=86400):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def _table(self):
+        from app.models.models import CacheEntry
+        return CacheEntry.__table__
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        from app import db
+        table = self._table
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            value = conn.execute(
+                select(table.c.value).where(table.c.key == key, table.c.expires_at > now)
+            ).scalar()
+            if value is not None:
+                conn.execute(update(table).where(table.c.key == key).values(last_accessed=now))
+        self._count(value is not None)
+        return value
+
+    def set(self, key, value, ttl=None):
+        from app import db
+        table = self._table
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl if ttl is not None else self.default_ttl)
+        with db.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.key == key))
+            conn.execute(table.insert().values(
+                key=key, value=value, created_at=now, last_accessed=now, expires_at=expires_at
+            ))
+            # Drop expired entries, then the least recently used ones over the limit
+            conn.execute(delete(table).where(table.c.expires_at <= now))
+            overflow = conn.execute(select(func.count()).select_from(table)).scalar() - self.max_entries
+            if overflow > 0:
+                oldest = select(table.c.key).order_by(table.c.last_accessed).limit(overflow)
+                conn.execute(delete(table).where(table.c.key.in_(oldest.scalar_subquery())))
+
+    def delete(self, key):
+        from app import db
+        with db.engine.begin() as conn:
+            conn.execute(delete(self._table).where(self._table.c.key == key))
+
+    def clear(self):
+        from app import db
+        with db.engine.begin() as conn:
+            conn.execute(delete(self._table))
+
+    def stats(self):
+        return {'backend': 'sql', 'hits': self.hits, 'misses': self.misses}
+
+
+class AIResponseCache:
+    """
+    Content-addressed cache for LLM responses: the key is a hash of the model
+    name plus the prompt with whitespace normalized, so identical requests for
+    unchanged data are served without calling the API.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def key_for(model, prompt):
+        normalized = ' '.join(prompt.split())
+        return hashlib.sha256(f"{model}\n{normalized}".encode('utf-8')).hexdigest()
+
+    def get(self, model, prompt):
+        try:
+            return self.backend.get(self.key_for(model, prompt))
+        except Exception as e:
+            logger.warning(f"AI cache lookup failed: {e}")
+            return None
+
+    def set(self, model, prompt, text):
+        try:
+            self.backend.set(self.key_for(model, prompt), text)
+        except Exception as e:
+            logger.warning(f"AI cache write failed: {e}")
+
+    def stats(self):
+        return self.backend.stats()
+
+
+class NullCache:
+    """Backend that stores nothing (AI_CACHE_BACKEND=none)"""
+
+    hits = 0
+    misses = 0
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'none'}
+
+
+_ai_cache = None
+_ai_cache_lock = threading.Lock()
+
+
+def get_ai_cache():
+    """Return the process-wide AI response cache, configured from the environment"""
+    global _ai_cache
+    if _ai_cache is None:
+        with _ai_cache_lock:
+            if _ai_cache is None:
+                backend_name = os.getenv('AI_CACHE_BACKEND', 'memory').lower()
+                ttl = int(os.getenv('AI_CACHE_TTL', 86400))
+                max_entries = int(os.getenv('AI_CACHE_MAX_ENTRIES', 2048))
+                if backend_name == 'sql':
+                    backend = SQLCache(max_entries=max_entries, default_ttl=ttl)
+                elif backend_name == 'none':
+                    backend = NullCache()
+                else:
+                    backend = MemoryCache(max_entries=max_entries, default_ttl=ttl)
+                _ai_cache = AIResponseCache(backend)
+    return _ai_cache
@@ -1,91 +1,81 @@
 from app.services.ai_service import AIService
 from app.models.models import Product, Supplier, InventoryTransaction
 from app import db
+from app.signals import stock_changed
+from app.services.stock_ledger import StockLedger, InsufficientStock
+from app.services.search_service import ProductSearch
+from app.services.conversation_state import get_conversation_store, WEB_CHANNEL, PENDING_STOCK_UPDATE, LISTING_CURSOR
+from app.services.intent_matcher import intent_matcher, SHOW_MORE_PATTERN
+from flask import current_app
+from markupsafe import escape
+from sqlalchemy import and_, or_, select
 from datetime import datetime
-import re
+import os
+
+# Product listings are sent a page at a time and each reply is capped in size
+LIST_PAGE_SIZE = int(os.getenv('CHATBOT_LIST_PAGE_SIZE', 25))
+MAX_RESPONSE_CHARS = int(os.getenv('CHATBOT_MAX_RESPONSE_CHARS', 6000))
+
+# How long a stock update waits for "yes"
+CONFIRMATION_TTL = int(os.getenv('CHATBOT_CONFIRMATION_TTL', 300))
 
 class ChatbotService:
     def __init__(self):
         self.ai_service = AIService()
         
-    def process_message(self, message, user_id=None):
+    def process_message(self, message, user_id=None, channel=WEB_CHANNEL):
         """
         Process a user message and generate a response
         Returns a dict with response and any additional actions needed
         """
-        # First check if this is a confirmation message - this should take priority
-        if self._is_confirmation(message):
-            return {
-                "response": "Thank you for confirming. I'll process the stock update now.",
-                "isConfirmation": True
-            }              # Check if this is a stock update request
-        update_request = self._check_for_stock_update(message)
-        if update_request:
-            return self._handle_stock_update_request(update_request, user_id)
-        
-        # Check if this is a request to list low stock products
-        if self._is_low_stock_request(message):
-            return self._handle_low_stock_request()
+        # One scan of the message finds its intent; "show more" and
+        # confirmations take priority over everything else
+        intent, update_request = intent_matcher.match(message)
+        
+        # "show more" continues the user's last product listing
+        if intent == "show_more":
+            return self._handle_show_more_request(user_id, channel)
+        
+        # A confirmation applies the update this conversation is waiting on
+        if intent == "confirmation":
+            result = self.confirm_pending_update(user_id, channel)
+            if result is None:
+                return {
+                    "response": "There's no stock update waiting for confirmation.",
+                    "isConfirmation": True
+                }
+            return dict(result, response=result["message"], isConfirmation=True)
+        
+        if intent == "stock_update":
+            return self._handle_stock_update_request(update_request, user_id, channel)
+        
+        if intent == "low_stock":
+            return self._handle_low_stock_request(user_id, channel)
             
-        # Check if this is a request to list all stock
-        if self._is_stock_listing_request(message):
-            return self._handle_stock_listing_request()
+        if intent == "stock_listing":
+            return self._handle_stock_listing_request(user_id, channel)
         
         # Handle general inventory queries
         return self._handle_general_query(message)
     
     def _check_for_stock_update(self, message):
         """Check if the message is a request to update stock"""
-        # Pattern to match requests like "add 20 units to product SKU-1234" or "update product SKU-5678 add 10 units"
-        add_pattern = r"(?:add|update|increase)\s+(\d+)\s+(?:units?|items?|stock|pieces?)\s+(?:to|for)\s+(?:product\s+)?(?:sku[\s-]*)?([a-zA-Z0-9-]+)"
-        
-        # Alternative pattern that might have the SKU first
-        alt_pattern = r"(?:update|add\s+to)\s+(?:product\s+)?(?:sku[\s-]*)?([a-zA-Z0-9-]+)\s+(?:add|with)\s+(\d+)\s+(?:units?|items?|stock|pieces?)"
-        
-        # Patterns for decrease/remove operations
-        decrease_pattern = r"(?:decrease|reduce|remove|subtract)\s+(\d+)\s+(?:units?|items?|stock|pieces?)\s+(?:from)\s+(?:product\s+)?(?:sku[\s-]*)?([a-zA-Z0-9-]+)"
-        
-        # Alternative decrease pattern with SKU first
-        alt_decrease_pattern = r"(?:update|decrease|reduce|remove\s+from)\s+(?:product\s+)?(?:sku[\s-]*)?([a-zA-Z0-9-]+)\s+(?:decrease|reduce|remove|subtract)\s+(\d+)\s+(?:units?|items?|stock|pieces?)"
-        
-        # Check first pattern (add)
-        match = re.search(add_pattern, message.lower())
-        if match:
-            quantity = int(match.group(1))
-            sku = match.group(2)
-            return {"sku": sku, "quantity": quantity, "operation": "add"}
-        
-        # Check alternative pattern (add)
-        match = re.search(alt_pattern, message.lower())
-        if match:
-            sku = match.group(1)
-            quantity = int(match.group(2))
-            return {"sku": sku, "quantity": quantity, "operation": "add"}
-        
-        # Check decrease pattern
-        match = re.search(decrease_pattern, message.lower())
-        if match:
-            quantity = int(match.group(1))
-            sku = match.group(2)
-            return {"sku": sku, "quantity": quantity, "operation": "remove"}
-          # Check alternative decrease pattern
-        match = re.search(alt_decrease_pattern, message.lower())
-        if match:
-            sku = match.group(1)
-            quantity = int(match.group(2))
-            return {"sku": sku, "quantity": quantity, "operation": "remove"}
-            
-        return None
+        return intent_matcher.stock_update(message.lower())
     
-    def _handle_stock_update_request(self, update_request, user_id):
+    def _handle_stock_update_request(self, update_request, user_id, channel=WEB_CHANNEL):
         """Handle a request to update stock levels"""
         sku = update_request["sku"]
         quantity = update_request["quantity"]
         operation = update_request["operation"]
         
-        # Find the product by SKU
-        product = Product.query.filter(Product.sku.ilike(f"%{sku}%")).first()
+        # Find the product by SKU; never guess between several matches
+        product, candidates = ProductSearch.resolve_sku(sku)
         
+        if not product and candidates:
+            options = ", ".join(f"{c['name']} ({c['sku']})" for c in candidates)
+            return {
+                "response": f"Several products match '{sku}': {options}. Which SKU did you mean?"
+            }
         if not product:
             return {
                 "response": f"I couldn't find a product with SKU similar to '{sku}'. Please check the SKU and try again."
@@ -100,6 +90,16 @@ class ChatbotService:
         # Prepare appropriate message based on operation
         operation_text = "add to" if operation == "add" else "remove from"
         
+        # Remember what a "yes" in this conversation confirms, with what the
+        # update needs, so confirming doesn't look the product up again
+        get_conversation_store().set(user_id, channel, PENDING_STOCK_UPDATE, {
+            "product_id": product.id,
+            "name": product.name,
+            "unit_price": product.unit_price,
+            "operation": operation,
+            "quantity": quantity
+        }, ttl=CONFIRMATION_TTL)
+        
         # Return with product details for confirmation
         return {
             "response": f"I found {product.name} with SKU-{product.sku}. Current stock level is {product.quantity_in_stock}. Would you like to {operation_text} the stock by {quantity} units?",
@@ -114,6 +114,52 @@ class ChatbotService:
             }
         }
         
+    def confirm_pending_update(self, user_id, channel=WEB_CHANNEL):
+        """
+        Apply the stock update the conversation is waiting on. Returns
+        {"success", "message"}, or None if nothing is pending (each pending
+        update is applied at most once, however many confirmations arrive)
+        """
+        pending = get_conversation_store().pop(user_id, channel, PENDING_STOCK_UPDATE)
+        if not pending:
+            return None
+        
+        quantity = pending["quantity"] if pending["operation"] == "add" else -pending["quantity"]
+        try:
+            # Update stock and create the transaction record atomically
+            change = StockLedger.apply(
+                pending["product_id"],
+                quantity,
+                "IN" if quantity > 0 else "OUT",
+                unit_price=pending["unit_price"],
+                notes="Stock update via chatbot",
+                # Discord conversations are keyed by Discord user ids, which aren't app users
+                user_id=user_id if isinstance(user_id, int) else None
+            )
+            db.session.commit()
+            stock_changed.send(current_app._get_current_object(), product_ids=[pending["product_id"]])
+            
+            return {
+                "success": True,
+                "message": f"Successfully updated {pending['name']} stock from {change.old_quantity} to {change.new_quantity}."
+            }
+        except InsufficientStock as e:
+            db.session.rollback()
+            return {
+                "success": False,
+                "message": f"Not enough stock: only {e.available} units available. The update was not processed."
+            }
+        except LookupError:
+            db.session.rollback()
+            return {"success": False, "message": "Product not found. The update was not processed."}
+        except Exception as e:
+            db.session.rollback()
+            return {"success": False, "message": f"Error updating stock: {str(e)}"}
+    
+    def discard_pending_update(self, user_id, channel=WEB_CHANNEL):
+        """Forget the stock update the conversation is waiting on, e.g. when confirmation timed out"""
+        get_conversation_store().delete(user_id, channel, PENDING_STOCK_UPDATE)
+    
     def update_stock(self, product_id, quantity, user_id=None):
         """Actually update the stock after confirmation"""
         product = Product.query.get(product_id)
@@ -122,25 +168,27 @@ class ChatbotService:
             return {"success": False, "message": "Product not found"}
         
         try:
-            # Update stock
-            original_quantity = product.quantity_in_stock
-            product.quantity_in_stock += quantity
-              # Create transaction record
-            transaction = InventoryTransaction(
-                product_id=product.id,
-                transaction_type="IN" if quantity > 0 else "OUT",
-                quantity=abs(quantity),
+            # Update stock and create the transaction record atomically
+            change = StockLedger.apply(
+                product.id,
+                quantity,
+                "IN" if quantity > 0 else "OUT",
                 unit_price=product.unit_price,
-                total_price=abs(quantity) * product.unit_price,
-                notes=f"Stock update via chatbot",
-                created_by=user_id if user_id else None
+                notes="Stock update via chatbot",
+                user_id=user_id if user_id else None
             )
-            db.session.add(transaction)
             db.session.commit()
+            stock_changed.send(current_app._get_current_object(), product_ids=[product.id])
             
             return {
                 "success": True,
-                "message": f"Successfully updated {product.name} stock from {original_quantity} to {product.quantity_in_stock}."
+                "message": f"Successfully updated {product.name} stock from {change.old_quantity} to {change.new_quantity}."
+            }
+        except InsufficientStock as e:
+            db.session.rollback()
+            return {
+                "success": False,
+                "message": f"Not enough stock. Current stock: {e.available}, Requested removal: {e.requested}"
             }
         except Exception as e:
             db.session.rollback()
@@ -148,100 +196,89 @@ class ChatbotService:
     
     def _is_confirmation(self, message):
         """Check if the message is confirming a previous request"""
-        confirmation_words = ["yes", "confirm", "approved", "ok", "okay", "sure", "go ahead", "do it", "y", "yep", "yeah"]
-        message_lower = message.lower().strip()
-        
-        # Check for exact matches first
-        if message_lower in confirmation_words:
-            return True
-            
-        # Then check for partial matches
-        return any(word in message_lower for word in confirmation_words)
+        return intent_matcher.is_confirmation(message)
     
     def _is_stock_listing_request(self, message):
         """Check if the message is a request to list all stock"""
-        message_lower = message.lower().strip()
-        
-        # First check if this is a low stock request (to avoid conflicts)
-        if self._is_low_stock_request(message_lower):
-            return False
-            
-        listing_patterns = [
-            "list all stock", 
-            "show all stock",
-            "list all products",
-            "show all products", 
-            "list inventory",
-            "show inventory",
-            "what products do we have",
-            "what items do we have",            "all products",
-            "all items",
-            "all stock",
-            "show me all",
-            "list all",
-            "all available products",
-            "available stock"
-        ]
-        
-        # Check if any of the patterns match the message
-        return any(pattern in message_lower for pattern in listing_patterns)
+        found = intent_matcher.keywords_in(message.lower())
+        # Low stock phrases ("list all products with low stock") win
+        return "stock_listing" in found and "low_stock" not in found
     
     def _is_low_stock_request(self, message):
         """Check if the message is a request to list low stock products"""
-        message_lower = message.lower().strip()
-        low_stock_patterns = [
-            "low stock",
-            "stock below",
-            "reorder level",
-            "need to reorder",
-            "running low",
-            "stock alert",
-            "inventory alert",            "products to reorder",
-            "items to reorder",
-            "low inventory",
-            "inventory running low",
-            "list all products with low stock",
-            "show products with low stock",
-            "which products have low stock",
-            "which all have low stock"
-        ]
-        
-        # Check if any of the low stock patterns match the message
-        return any(pattern in message_lower for pattern in low_stock_patterns)
-        
-    def _handle_stock_listing_request(self):
-        """Handle a request to list all stock"""
-        products = Product.query.order_by(Product.name).all()
-        
-        if not products:
-            return {"response": "There are no products in the inventory."}
-        
-        # Create HTML formatted response with all products
-        response = "<p>Here's the current inventory stock levels:</p>\n<ul>"
-        
-        for product in products:
-            response += f"\n    <li><strong>{product.name}</strong>: SKU: {product.sku}, Stock: {product.quantity_in_stock} units</li>"
-        
-        response += "\n</ul>"
+        return "low_stock" in intent_matcher.keywords_in(message.lower())
         
-        return {"response": response}
+    def _is_show_more_request(self, message):
+        """Check if the message asks for the next page of a listing"""
+        return bool(SHOW_MORE_PATTERN.match(message.lower().strip()))
+    
+    def _handle_stock_listing_request(self, user_id=None, channel=WEB_CHANNEL):
+        """Handle a request to list all stock"""
+        return self._product_listing_page(user_id, channel, "all")
     
-    def _handle_low_stock_request(self):
+    def _handle_low_stock_request(self, user_id=None, channel=WEB_CHANNEL):
         """Handle a request to list low stock products"""
-        low_stock_products = Product.query.filter(Product.quantity_in_stock < Product.reorder_level).order_by(Product.name).all()
-        
-        if not low_stock_products:
-            return {"response": "<p>All products are sufficiently stocked. There are no products with inventory levels below their reorder points.</p>"}
-        
-        # Create HTML formatted response with low stock products
-        response = "<p>Here are the products that need reordering:</p>\n<ul>"
-        
-        for product in low_stock_products:
-            response += f"\n    <li><strong>{product.name}</strong>: SKU: {product.sku}, Stock: {product.quantity_in_stock} units (Reorder level: {product.reorder_level} units)</li>"
-        
-        response += "\n</ul>"
+        return self._product_listing_page(user_id, channel, "low")
+    
+    def _handle_show_more_request(self, user_id=None, channel=WEB_CHANNEL):
+        """Send the next page of the user's last listing"""
+        cursor = get_conversation_store().get(user_id, channel, LISTING_CURSOR)
+        if not cursor:
+            return {"response": "<p>There's nothing more to show. Ask me to list all stock or low stock products to start a new list.</p>"}
+        return self._product_listing_page(user_id, channel, cursor["kind"], after=cursor["after"], shown=cursor["shown"])
+    
+    def _product_listing_page(self, user_id, channel, kind, after=None, shown=0):
+        """
+        One page of a product listing ("all" or "low" stock), ordered by name
+        and continued with a keyset cursor on (name, id). Only the listed
+        columns are loaded; a page stops early once the reply would exceed
+        MAX_RESPONSE_CHARS.
+        """
+        stmt = select(Product.id, Product.name, Product.sku, Product.quantity_in_stock, Product.reorder_level)
+        if kind == "low":
+            stmt = stmt.where(Product.quantity_in_stock < Product.reorder_level)
+        if after:
+            last_name, last_id = after
+            stmt = stmt.where(or_(Product.name > last_name, and_(Product.name == last_name, Product.id > last_id)))
+        rows = db.session.execute(stmt.order_by(Product.name, Product.id).limit(LIST_PAGE_SIZE + 1)).all()
+        
+        if not rows and not after:
+            get_conversation_store().delete(user_id, channel, LISTING_CURSOR)
+            if kind == "low":
+                return {"response": "<p>All products are sufficiently stocked. There are no products with inventory levels below their reorder points.</p>"}
+            return {"response": "There are no products in the inventory."}
         
-        return {"response": response}
+        if after:
+            intro = f"<p>Products {shown + 1} onwards:</p>"
+        elif kind == "low":
+            intro = "<p>Here are the products that need reordering:</p>"
+        else:
+            intro = "<p>Here's the current inventory stock levels:</p>"
+        more = "\n<p>Say <strong>show more</strong> to see the next products.</p>"
+        
+        # Collect list items, leaving room for the intro and "show more" hint
+        items = []
+        budget = MAX_RESPONSE_CHARS - len(intro) - len(more) - len("<ul>\n</ul>")
+        for row in rows[:LIST_PAGE_SIZE]:
+            line = f"\n    <li><strong>{escape(row.name)}</strong>: SKU: {escape(row.sku or '')}, Stock: {row.quantity_in_stock} units"
+            if kind == "low":
+                line += f" (Reorder level: {row.reorder_level} units)"
+            line += "</li>"
+            if items and len(line) > budget:
+                break
+            items.append(line)
+            budget -= len(line)
+        
+        has_more = len(items) < len(rows)
+        if has_more:
+            last = rows[len(items) - 1]
+            get_conversation_store().set(user_id, channel, LISTING_CURSOR,
+                                         {"kind": kind, "after": [last.name, last.id], "shown": shown + len(items)})
+        else:
+            get_conversation_store().delete(user_id, channel, LISTING_CURSOR)
+        
+        response = intro + "\n<ul>" + "".join(items) + "\n</ul>" + (more if has_more else "")
+        return {"response": response, "hasMore": has_more}
         
     def _handle_general_query(self, message):
         """Handle general inventory-related queries"""
@@ -0,0 +1,117 @@
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete
+
+from app.services.cache_service import MemoryCache
+
+# Channel of conversations in the web chatbot; Discord uses "discord:<channel id>"
+WEB_CHANNEL = 'web'
+
+# What a conversation can be waiting on
+PENDING_STOCK_UPDATE = 'pending_stock_update'
+LISTING_CURSOR = 'listing_cursor'
+
+
+class SQLStateStore:
+    """
+    State stored in the conversation_states table, so every web worker (and
+    the Discord bot) sees the same conversations. Values are stored as JSON.
+    Uses its own connection so writes never commit the caller's session.
+    """
+
+    def __init__(self, default_ttl=900):
+        self.default_ttl = default_ttl
+
+    @property
+    def _table(self):
+        from app.models.models import ConversationState
+        return ConversationState.__table__
+
+    def get(self, key):
+        from app import db
+        table = self._table
+        with db.engine.connect() as conn:
+            value = conn.execute(
+                select(table.c.value).where(table.c.key == key, table.c.expires_at > datetime.utcnow())
+            ).scalar()
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        from app import db
+        from app.utils.sql import upsert
+        table = self._table
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl if ttl is not None else self.default_ttl)
+        with db.engine.begin() as conn:
+            upsert(table, [{'key': key, 'value': json.dumps(value), 'expires_at': expires_at}],
+                   key_columns=('key',), set_columns=('value', 'expires_at'), bind=conn)
+            # Abandoned conversations expire here rather than in a sweeper job
+            conn.execute(delete(table).where(table.c.expires_at <= now))
+
+    def pop(self, key):
+        """Remove `key` and return its value; only the caller whose DELETE removed the row gets it"""
+        from app import db
+        table = self._table
+        with db.engine.begin() as conn:
+            value = conn.execute(
+                select(table.c.value).where(table.c.key == key, table.c.expires_at > datetime.utcnow())
+            ).scalar()
+            removed = conn.execute(delete(table).where(table.c.key == key)).rowcount
+        return json.loads(value) if value is not None and removed else None
+
+    def delete(self, key):
+        from app import db
+        with db.engine.begin() as conn:
+            conn.execute(delete(self._table).where(self._table.c.key == key))
+
+
+class ConversationStore:
+    """
+    Short-lived state of chatbot conversations (a stock update waiting for
+    "yes", where a product listing stopped), keyed by user and channel so
+    the same user can hold separate conversations on the web and in each
+    Discord channel. Every lookup is by primary key.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def key_for(user_id, channel, name):
+        return f"{name}:{channel}:{user_id}"
+
+    def get(self, user_id, channel, name):
+        return self.backend.get(self.key_for(user_id, channel, name))
+
+    def set(self, user_id, channel, name, value, ttl=None):
+        self.backend.set(self.key_for(user_id, channel, name), value, ttl)
+
+    def pop(self, user_id, channel, name):
+        return self.backend.pop(self.key_for(user_id, channel, name))
+
+    def delete(self, user_id, channel, name):
+        self.backend.delete(self.key_for(user_id, channel, name))
+
+
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """Return the process-wide conversation store, configured from the environment"""
+    global _conversation_store
+    if _conversation_store is None:
+        with _conversation_store_lock:
+            if _conversation_store is None:
+                backend_name = os.getenv('CONVERSATION_STATE_BACKEND', 'sql').lower()
+                ttl = int(os.getenv('CONVERSATION_STATE_TTL', 900))
+                if backend_name == 'memory':
+                    backend = MemoryCache(max_entries=int(os.getenv('CONVERSATION_STATE_MAX_ENTRIES', 10000)),
+                                          default_ttl=ttl)
+                else:
+                    backend = SQLStateStore(default_ttl=ttl)
+                _conversation_store = ConversationStore(backend)
+    return _conversation_store
@@ -0,0 +1,229 @@
+import os
+import time
+import logging
+import datetime
+from contextlib import contextmanager
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.models import (
+    Category, InventoryTransaction, Notification, Product, PurchaseOrder, Supplier
+)
+from app.services.cache_service import MemoryCache
+from app.services.rollup_service import StockRollups
+from app.signals import stock_changed
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('today', 'week', 'month', 'year')
+MONTH_LABELS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# Writes to these tables change something the dashboard shows
+WATCHED_MODELS = (Product, Category, Supplier, InventoryTransaction, PurchaseOrder, Notification)
+
+# Writes from this process clear the cache straight away; the TTL bounds how
+# stale it gets from other processes (e.g. the Discord bot) and Core updates
+_snapshot_cache = MemoryCache(max_entries=len(PERIODS) * 2, default_ttl=int(os.getenv('DASHBOARD_CACHE_TTL', 30)))
+
+
+class DashboardService:
+    @staticmethod
+    def snapshot(period='week'):
+        """
+        Everything the dashboard shows for `period`, as plain dicts and lists
+        so it can be cached between requests. Returns (snapshot, timings) where
+        timings maps each section (or 'cache' on a hit) to milliseconds.
+        """
+        if period not in PERIODS:
+            period = 'week'
+
+        today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        key = (period, today.date())
+
+        started = time.perf_counter()
+        cached = _snapshot_cache.get(key)
+        if cached is not None:
+            return cached, {'cache': (time.perf_counter() - started) * 1000}
+
+        timings = {}
+        start_date, end_date = DashboardService.period_range(period, today)
+        snapshot = {'active_period': period}
+
+        with _timed(timings, 'counts'):
+            snapshot.update(DashboardService._counts())
+        with _timed(timings, 'chart'):
+            snapshot.update(DashboardService._chart(period, today, start_date, end_date))
+        with _timed(timings, 'transactions'):
+            snapshot['recent_transactions'] = DashboardService._recent_transactions(start_date, end_date)
+        with _timed(timings, 'orders'):
+            snapshot['recent_purchase_orders'] = DashboardService._recent_purchase_orders(start_date, end_date)
+        with _timed(timings, 'low_stock'):
+            snapshot['low_stock_products'] = DashboardService._low_stock_products()
+        with _timed(timings, 'notifications'):
+            snapshot['notifications'] = DashboardService._notifications()
+
+        _snapshot_cache.set(key, snapshot)
+        logger.debug("Dashboard snapshot for %s built in %s", period,
+                     ', '.join(f"{name}={ms:.1f}ms" for name, ms in timings.items()))
+        return snapshot, timings
+
+    @staticmethod
+    def period_range(period, today):
+        """[start, end) of the period containing `today`"""
+        if period == 'today':
+            return today, today + datetime.timedelta(days=1)
+        if period == 'month':
+            start_date = today.replace(day=1)
+            if today.month == 12:
+                return start_date, today.replace(year=today.year + 1, month=1, day=1)
+            return start_date, today.replace(month=today.month + 1, day=1)
+        if period == 'year':
+            return today.replace(month=1, day=1), today.replace(year=today.year + 1, month=1, day=1)
+        # week: starts on Monday
+        start_date = today - datetime.timedelta(days=today.weekday())
+        return start_date, start_date + datetime.timedelta(days=7)
+
+    @staticmethod
+    def invalidate(sender=None, **extra):
+        _snapshot_cache.clear()
+
+    # ─── Sections ──────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _counts():
+        """All of the headline counts in a single round trip"""
+        def count(column, *criteria):
+            return select(func.count(column)).where(*criteria).scalar_subquery()
+
+        row = db.session.execute(select(
+            count(Product.id).label('product_count'),
+            count(Category.id).label('category_count'),
+            count(Supplier.id).label('supplier_count'),
+            count(Notification.id, Notification.is_read.is_(False)).label('notification_count'),
+        )).one()
+        return {name: int(value or 0) for name, value in row._mapping.items()}
+
+    @staticmethod
+    def _chart(period, today, start_date, end_date):
+        # Stock in/out and the period's transaction count come from the
+        # precomputed rollups: one small range query whatever the ledger size
+        granularity = 'hour' if period == 'today' else 'day'
+        movements = StockRollups.movements(granularity, start_date, end_date)
+
+        if period == 'year':
+            labels = MONTH_LABELS
+            index_of = lambda bucket: bucket.month - 1
+        else:
+            if period == 'today':
+                chart_dates = [today.replace(hour=i) for i in range(24)]
+                labels = [d.strftime('%H:%M') for d in chart_dates]
+            else:
+                chart_dates = [start_date + datetime.timedelta(days=i) for i in range((end_date - start_date).days)]
+                date_format = '%a' if period == 'week' else '%d'  # Day name for week, day of month
+                labels = [d.strftime(date_format) for d in chart_dates]
+            bucket_to_index = {d: i for i, d in enumerate(chart_dates)}
+            index_of = bucket_to_index.get
+
+        stock_in = [0] * len(labels)
+        stock_out = [0] * len(labels)
+        for bucket, ttype, total, _ in movements:
+            idx = index_of(bucket)
+            if idx is None:
+                continue
+            if ttype == 'purchase':
+                stock_in[idx] += int(total)
+            elif ttype == 'sale':
+                stock_out[idx] += int(total)
+
+        return {
+            'transaction_count': int(sum(count for _, _, _, count in movements)),
+            'chart_labels': labels,
+            'stock_in_by_month': stock_in,
+            'stock_out_by_month': stock_out,
+        }
+
+    @staticmethod
+    def _recent_transactions(start_date, end_date, limit=5):
+        t = InventoryTransaction
+        rows = (
+            db.session.query(t.id, t.transaction_type, t.quantity, t.transaction_date,
+                             Product.name.label('product_name'))
+            .join(Product, Product.id == t.product_id)
+            .filter(t.transaction_date >= start_date, t.transaction_date < end_date)
+            .order_by(t.transaction_date.desc())
+            .limit(limit)
+            .all()
+        )
+        return [dict(row._mapping) for row in rows]
+
+    @staticmethod
+    def _recent_purchase_orders(start_date, end_date, limit=5):
+        po = PurchaseOrder
+        rows = (
+            db.session.query(po.id, po.status, po.created_at, Supplier.name.label('supplier_name'))
+            .outerjoin(Supplier, Supplier.id == po.supplier_id)
+            .filter(po.order_date >= start_date, po.order_date < end_date)
+            .order_by(po.order_date.desc())
+            .limit(limit)
+            .all()
+        )
+        return [dict(row._mapping) for row in rows]
+
+    @staticmethod
+    def _low_stock_products(limit=5):
+        rows = (
+            db.session.query(Product.id, Product.name, Product.quantity_in_stock, Product.reorder_level)
+            .filter(Product.quantity_in_stock <= Product.reorder_level)
+            .limit(limit)
+            .all()
+        )
+        return [dict(row._mapping) for row in rows]
+
+    @staticmethod
+    def _notifications(limit=5):
+        # Latest notifications (generated in the background by NotificationScheduler)
+        rows = (
+            db.session.query(Notification.id, Notification.message, Notification.is_read, Notification.created_at)
+            .order_by(Notification.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+        return [dict(row._mapping) for row in rows]
+
+
+def server_timing(timings):
+    """Format section timings as a Server-Timing header value"""
+    return ', '.join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
+
+
+@contextmanager
+def _timed(timings, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = (time.perf_counter() - started) * 1000
+
+
+def _note_dashboard_writes(session, flush_context):
+    if not session.info.get('dashboard_dirty') and any(
+        isinstance(obj, WATCHED_MODELS) for obj in (*session.new, *session.dirty, *session.deleted)
+    ):
+        session.info['dashboard_dirty'] = True
+
+
+def _invalidate_after_commit(session):
+    if session.info.pop('dashboard_dirty', False):
+        DashboardService.invalidate()
+
+
+def _forget_rolled_back_writes(session, previous_transaction):
+    session.info.pop('dashboard_dirty', None)
+
+
+event.listen(Session, 'after_flush', _note_dashboard_writes)
+event.listen(Session, 'after_commit', _invalidate_after_commit)
+event.listen(Session, 'after_soft_rollback', _forget_rolled_back_writes)
+stock_changed.connect(DashboardService.invalidate, weak=False)
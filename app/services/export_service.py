@@ -0,0 +1,146 @@
+import io
+import os
+import csv
+import tempfile
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models.models import Category, InventoryTransaction, Product, Supplier, User
+from app.services.transaction_service import TransactionService
+
+BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 5000))
+FLUSH_BYTES = 64 * 1024
+
+TRANSACTION_HEADER = ['ID', 'Date', 'Product ID', 'Product', 'SKU', 'Type', 'Quantity',
+                      'Unit Price', 'Total Price', 'Created By', 'Notes']
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ExportService:
+    """
+    Streamed exports. Rows are read in batches of EXPORT_BATCH_SIZE with
+    server-side cursors (stream_results/yield_per; PostgreSQL uses a named
+    cursor) and written out as they arrive, so memory stays flat however
+    large the table is. The generators use the session, so views must wrap
+    them in stream_with_context().
+    """
+
+    @staticmethod
+    def products_csv(category_id=None):
+        stmt = (
+            select(
+                Product.id, Product.sku, Product.name, Product.description,
+                Category.name.label('category'), Supplier.name.label('supplier'),
+                Product.unit_price, Product.quantity_in_stock, Product.reorder_level, Product.reorder_quantity,
+            )
+            .outerjoin(Category, Category.id == Product.category_id)
+            .outerjoin(Supplier, Supplier.id == Product.supplier_id)
+            .order_by(Product.id)
+        )
+        if category_id:
+            stmt = stmt.where(Product.category_id == category_id)
+        header = ['ID', 'SKU', 'Name', 'Description', 'Category', 'Supplier', 'Unit Price',
+                  'Quantity In Stock', 'Reorder Level', 'Reorder Quantity']
+        return ExportService._csv(stmt, header)
+
+    @staticmethod
+    def suppliers_csv():
+        # Product counts come from one grouped subquery, not a lazy load per supplier
+        counts = (
+            select(Product.supplier_id, func.count(Product.id).label('product_count'))
+            .group_by(Product.supplier_id)
+            .subquery()
+        )
+        stmt = (
+            select(
+                Supplier.id, Supplier.name, Supplier.contact_person, Supplier.email,
+                Supplier.phone, Supplier.address, func.coalesce(counts.c.product_count, 0),
+            )
+            .outerjoin(counts, counts.c.supplier_id == Supplier.id)
+            .order_by(Supplier.id)
+        )
+        header = ['ID', 'Name', 'Contact Person', 'Email', 'Phone', 'Address', 'Products Count']
+        return ExportService._csv(stmt, header)
+
+    @staticmethod
+    def transactions_csv(filters):
+        return ExportService._csv(ExportService._transactions(filters), TRANSACTION_HEADER)
+
+    @staticmethod
+    def transactions_parquet(filters):
+        """
+        The ledger as a Parquet file, written batch by batch into a spooled
+        temporary file (Parquet's footer is only known at the end) and then
+        streamed out in chunks. Needs pyarrow.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([
+            ('id', pa.int64()), ('transaction_date', pa.timestamp('us')), ('product_id', pa.int64()),
+            ('product_name', pa.string()), ('sku', pa.string()), ('transaction_type', pa.string()),
+            ('quantity', pa.int64()), ('unit_price', pa.float64()), ('total_price', pa.float64()),
+            ('created_by', pa.string()), ('notes', pa.string()),
+        ])
+
+        def generate():
+            with tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024) as spool:
+                with pq.ParquetWriter(spool, schema, compression='snappy') as writer:
+                    result = db.session.execute(
+                        ExportService._transactions(filters),
+                        execution_options={'stream_results': True, 'yield_per': BATCH_SIZE},
+                    )
+                    for rows in result.partitions():
+                        columns = list(zip(*rows))
+                        writer.write_table(pa.Table.from_arrays(
+                            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                            schema=schema,
+                        ))
+                spool.seek(0)
+                while True:
+                    block = spool.read(FLUSH_BYTES)
+                    if not block:
+                        break
+                    yield block
+
+        return generate()
+
+    @staticmethod
+    def _transactions(filters):
+        t = InventoryTransaction
+        stmt = (
+            select(
+                t.id, t.transaction_date, t.product_id, Product.name, Product.sku, t.transaction_type,
+                t.quantity, t.unit_price, t.total_price, User.username, t.notes,
+            )
+            .join(Product, Product.id == t.product_id)
+            .outerjoin(User, User.id == t.created_by)
+            .order_by(t.transaction_date, t.id)
+        )
+        return TransactionService.apply_filters(stmt, filters)
+
+    @staticmethod
+    def _csv(stmt, header):
+        """Yield CSV text in ~64 KB pieces while reading `stmt` batch by batch"""
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(header)
+            result = db.session.execute(stmt, execution_options={'stream_results': True, 'yield_per': BATCH_SIZE})
+            for rows in result.partitions():
+                writer.writerows(rows)
+                if buffer.tell() >= FLUSH_BYTES:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+
+        return generate()
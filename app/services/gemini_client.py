@@ -0,0 +1,160 @@
+import os
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Upstream responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is rejecting calls to the upstream API"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling the upstream after `failure_threshold` consecutive failed
+    calls. After `reset_timeout` seconds one trial call is let through; it
+    closes the circuit on success or re-opens it on failure.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        """True while calls would be rejected (no side effects)"""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            cooled_down = time.monotonic() - self._opened_at >= self.reset_timeout
+            return not cooled_down or self._trial_in_flight
+
+    def allow(self):
+        """Return True if a call may go ahead now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            # Half-open: let a single trial call through
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Gemini circuit breaker opened after %d consecutive failures", self._failures)
+                self._opened_at = time.monotonic()
+
+
+class GeminiClient:
+    """
+    Shared HTTP client for the Gemini REST API: one keep-alive session with a
+    bounded connection pool, connect/read timeouts on every call, jittered
+    exponential backoff on 429/5xx and a circuit breaker around the lot.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=30.0, max_retries=2,
+                 backoff_base=0.5, backoff_max=8.0, pool_size=10, breaker=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _backoff(self, attempt, response=None):
+        """Seconds to wait before retry number `attempt` (full jitter, honours Retry-After)"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post_json(self, url, payload):
+        """POST `payload` as JSON and return the decoded response body"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("Gemini API circuit breaker is open")
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = e
+            except requests.exceptions.RequestException:
+                # Not worth retrying (bad URL, broken response body, ...) but still a
+                # failed call; recording it also ends a half-open trial
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    try:
+                        response.raise_for_status()
+                    except requests.exceptions.HTTPError:
+                        # Other 4XX errors are our fault, not a sign the upstream is degraded
+                        self.breaker.record_success()
+                        raise
+                    self.breaker.record_success()
+                    return response.json()
+                last_error = requests.exceptions.HTTPError(
+                    f"{response.status_code} error from Gemini API", response=response
+                )
+
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt, response)
+                logger.info("Gemini call failed (%s), retrying in %.2fs", last_error, delay)
+                time.sleep(delay)
+
+        self.breaker.record_failure()
+        raise last_error
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide GeminiClient, configured from the environment"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeminiClient(
+                    connect_timeout=float(os.getenv('GEMINI_CONNECT_TIMEOUT', 3.05)),
+                    read_timeout=float(os.getenv('GEMINI_READ_TIMEOUT', 30)),
+                    max_retries=int(os.getenv('GEMINI_MAX_RETRIES', 2)),
+                    backoff_base=float(os.getenv('GEMINI_BACKOFF_BASE', 0.5)),
+                    backoff_max=float(os.getenv('GEMINI_BACKOFF_MAX', 8)),
+                    pool_size=int(os.getenv('GEMINI_POOL_SIZE', 10)),
+                    breaker=CircuitBreaker(
+                        failure_threshold=int(os.getenv('GEMINI_BREAKER_THRESHOLD', 5)),
+                        reset_timeout=float(os.getenv('GEMINI_BREAKER_RESET', 30)),
+                    ),
+                )
+    return _client
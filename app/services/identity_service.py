@@ -0,0 +1,111 @@
+import os
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app import db
+from app.models.models import User
+from app.services.cache_service import MemoryCache
+
+# How long a user's identity is served from memory before it is re-read;
+# changes made in this process invalidate it at once, other processes
+# (workers, the Discord bot) see them after at most this long
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+API_TOKEN_MAX_AGE = int(os.getenv('API_TOKEN_MAX_AGE', 3600))
+
+# Everything current_user needs; the password hash stays out of the cache
+# (it is loaded from the database if something reads it)
+IDENTITY_COLUMNS = (User.id, User.username, User.email, User.is_admin, User.created_at, User.updated_at)
+
+_identities = MemoryCache(max_entries=int(os.getenv('USER_CACHE_MAX_ENTRIES', 1024)), default_ttl=USER_CACHE_TTL)
+
+
+class IdentityService:
+    """
+    Flask-Login user loading without a query per request.
+
+    Users are cached as plain column snapshots and attached to the request's
+    session with merge(load=False), so current_user is a normal User that
+    didn't cost a SELECT. JSON clients can also authenticate with a signed
+    API token ("Authorization: Bearer <token>"); it is checked against the
+    same cached identity, and updating the user revokes it.
+    """
+
+    @staticmethod
+    def load(user_id):
+        """The User with `user_id`, from the cache when possible, or None"""
+        snapshot = IdentityService._snapshot(user_id)
+        return IdentityService._attach(snapshot) if snapshot else None
+
+    @staticmethod
+    def issue_token(user):
+        """A signed token for `user`, valid for API_TOKEN_MAX_AGE seconds or until the user changes"""
+        return IdentityService._serializer().dumps({'id': user.id, 'stamp': IdentityService._stamp(user.updated_at)})
+
+    @staticmethod
+    def load_from_token(token):
+        """The User a valid, unexpired and unrevoked API token belongs to, or None"""
+        try:
+            claims = IdentityService._serializer().loads(token, max_age=API_TOKEN_MAX_AGE)
+        except BadSignature:
+            return None
+        snapshot = IdentityService._snapshot(claims.get('id'))
+        if not snapshot or IdentityService._stamp(snapshot['updated_at']) != claims.get('stamp'):
+            return None
+        return IdentityService._attach(snapshot)
+
+    @staticmethod
+    def invalidate(*user_ids):
+        for user_id in user_ids:
+            _identities.delete(user_id)
+
+    @staticmethod
+    def _snapshot(user_id):
+        if not isinstance(user_id, int):
+            return None
+        snapshot = _identities.get(user_id)
+        if snapshot is None:
+            row = db.session.execute(select(*IDENTITY_COLUMNS).where(User.id == user_id)).mappings().first()
+            if row is None:
+                return None
+            snapshot = dict(row)
+            _identities.set(user_id, snapshot)
+        return snapshot
+
+    @staticmethod
+    def _attach(snapshot):
+        # A detached User built from the snapshot, merged without a SELECT;
+        # if the request already loaded this user, that instance is returned
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    @staticmethod
+    def _serializer():
+        return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='api-token')
+
+    @staticmethod
+    def _stamp(updated_at):
+        # updated_at changes on every ORM update of the user (password, role, ...)
+        return updated_at.isoformat() if updated_at else None
+
+
+def _note_user_writes(session, flush_context):
+    changed = {obj.id for obj in (*session.dirty, *session.deleted) if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault('users_changed', set()).update(changed)
+
+
+def _invalidate_after_commit(session):
+    IdentityService.invalidate(*session.info.pop('users_changed', ()))
+
+
+def _forget_rolled_back_writes(session, previous_transaction):
+    session.info.pop('users_changed', None)
+
+
+event.listen(Session, 'after_flush', _note_user_writes)
+event.listen(Session, 'after_commit', _invalidate_after_commit)
+event.listen(Session, 'after_soft_rollback', _forget_rolled_back_writes)
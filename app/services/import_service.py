@@ -0,0 +1,356 @@
+import os
+import csv
+import math
+import time
+import logging
+from datetime import datetime
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models.models import Category, Product, Supplier
+from app.services.job_queue import job_queue
+from app.services.stock_ledger import StockLedger
+from app.signals import stock_changed
+from app.utils.sql import upsert
+
+logger = logging.getLogger(__name__)
+
+IMPORT_EXTENSIONS = ('.csv', '.xlsx')
+CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+MAX_REPORTED_ERRORS = 500
+
+# Accepted spellings of each column, after lower-casing and replacing spaces with _
+COLUMN_ALIASES = {
+    'sku': ('sku', 'product_sku', 'code'),
+    'name': ('name', 'product_name', 'product'),
+    'description': ('description',),
+    'unit_price': ('unit_price', 'price'),
+    'quantity': ('quantity', 'quantity_in_stock', 'stock', 'opening_balance'),
+    'reorder_level': ('reorder_level',),
+    'reorder_quantity': ('reorder_quantity',),
+    'category': ('category', 'category_name'),
+    'supplier': ('supplier', 'supplier_name'),
+}
+REQUIRED_COLUMNS = ('sku', 'name', 'unit_price')
+
+
+class ProductImporter:
+    """
+    Streams a CSV or XLSX catalog into Product, Category and Supplier:
+
+    - rows are read lazily and validated in chunks; bad rows are reported
+      with their row number and skipped, the rest of the file still loads
+    - products are upserted by SKU with one INSERT ... ON CONFLICT per chunk;
+      categories and suppliers are matched by name (case-insensitive) and
+      missing ones are created in bulk
+    - new products can get their quantity as an opening balance, written
+      as InventoryTransaction rows in one executemany per chunk; the stock
+      of existing products is never changed here (use StockLedger)
+
+    Each chunk commits on its own, so a failure loses one chunk at most.
+    """
+
+    def __init__(self, path, opening_balance=True, user_id=None, chunk_size=CHUNK_SIZE, progress=None):
+        self.path = path
+        self.opening_balance = opening_balance
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'opening_balances': 0, 'failed': 0}
+        self.errors = []
+        self._seen_skus = {}
+        self._categories = {}
+        self._suppliers = {}
+        self._created_ids = []
+
+    def run(self):
+        started = time.perf_counter()
+        rows, columns, total = self._open()
+        missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+        if missing:
+            raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+
+        self._categories = self._load_names(Category)
+        self._suppliers = self._load_names(Supplier)
+
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk, columns)
+
+            elapsed = time.perf_counter() - started
+            rate = self.stats['rows'] / elapsed if elapsed else 0
+            if self.progress:
+                percent = 100 * self.stats['rows'] // total if total else 0
+                self.progress(min(percent, 99), f"{self.stats['rows']:,} rows imported ({rate:,.0f} rows/s)")
+
+        if self._created_ids:
+            stock_changed.send(current_app._get_current_object(), product_ids=self._created_ids)
+
+        elapsed = time.perf_counter() - started
+        return {
+            **self.stats,
+            'seconds': round(elapsed, 2),
+            'rows_per_second': round(self.stats['rows'] / elapsed) if elapsed else None,
+            'errors': self.errors,
+            'errors_truncated': self.stats['failed'] > len(self.errors),
+        }
+
+    # ─── Reading ──────────────────────────────────────────────────────────────
+
+    def _open(self):
+        """(row iterator of (row number, dict), recognised column names, total rows or None)"""
+        extension = os.path.splitext(self.path)[1].lower()
+        if extension == '.csv':
+            return self._read_csv()
+        if extension == '.xlsx':
+            return self._read_xlsx()
+        raise ValueError(f"Unsupported file type {extension}; use {' or '.join(IMPORT_EXTENSIONS)}")
+
+    def _read_csv(self):
+        with open(self.path, newline='', encoding='utf-8-sig') as handle:
+            header = next(csv.reader(handle), [])
+        # Newlines are a cheap upper bound on the number of rows, for progress
+        with open(self.path, 'rb') as handle:
+            total = max(sum(block.count(b'\n') for block in iter(lambda: handle.read(1 << 20), b'')) - 1, 0)
+
+        def rows():
+            with open(self.path, newline='', encoding='utf-8-sig') as handle:
+                reader = csv.reader(handle)
+                next(reader, None)
+                for number, values in enumerate(reader, start=2):
+                    if any(value.strip() for value in values):
+                        yield number, values
+
+        return self._mapped(rows(), header), self._columns(header), total
+
+    def _read_xlsx(self):
+        try:
+            from openpyxl import load_workbook
+        except ImportError as e:
+            raise ValueError("Importing .xlsx files needs the openpyxl package; upload a CSV instead") from e
+
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            header = [str(cell) if cell is not None else '' for cell in next(sheet.iter_rows(values_only=True), ())]
+            total = (sheet.max_row or 1) - 1
+        finally:
+            workbook.close()
+
+        def rows():
+            # Read-only mode streams the sheet instead of loading it into memory
+            workbook = load_workbook(self.path, read_only=True, data_only=True)
+            try:
+                values = workbook.active.iter_rows(min_row=2, values_only=True)
+                for number, cells in enumerate(values, start=2):
+                    cells = ['' if cell is None else str(cell) for cell in cells]
+                    if any(cell.strip() for cell in cells):
+                        yield number, cells
+            finally:
+                workbook.close()
+
+        return self._mapped(rows(), header), self._columns(header), total
+
+    @staticmethod
+    def _columns(header):
+        """Map each recognised column name to its position in the header"""
+        positions = {}
+        normalised = [(cell or '').strip().lower().replace(' ', '_') for cell in header]
+        for name, aliases in COLUMN_ALIASES.items():
+            for index, cell in enumerate(normalised):
+                if cell in aliases:
+                    positions[name] = index
+                    break
+        return positions
+
+    def _mapped(self, rows, header):
+        columns = self._columns(header)
+        for number, values in rows:
+            yield number, {
+                name: values[index].strip() if index < len(values) else ''
+                for name, index in columns.items()
+            }
+
+    # ─── Validation ──────────────────────────────────────────────────────────
+
+    def _validate(self, number, raw):
+        """Returns (clean row, None) or (None, [errors])"""
+        errors = []
+        row = {}
+
+        row['sku'] = raw.get('sku', '')
+        if not row['sku']:
+            errors.append("SKU is required")
+        elif len(row['sku']) > 50:
+            errors.append("SKU is longer than 50 characters")
+        elif row['sku'] in self._seen_skus:
+            errors.append(f"SKU {row['sku']} already appears on row {self._seen_skus[row['sku']]}")
+
+        row['name'] = raw.get('name', '')
+        if not row['name']:
+            errors.append("Name is required")
+        elif len(row['name']) > 100:
+            errors.append("Name is longer than 100 characters")
+
+        for name, convert, required in (('unit_price', float, True), ('quantity', int, False),
+                                        ('reorder_level', int, False), ('reorder_quantity', int, False)):
+            value = raw.get(name, '')
+            if value == '':
+                if required:
+                    errors.append(f"{name} is required")
+                row[name] = None
+                continue
+            try:
+                parsed = float(value)
+                if not math.isfinite(parsed):
+                    errors.append(f"{name} must be a finite number, got {value!r}")
+                    continue
+                row[name] = convert(parsed)
+            except (ValueError, OverflowError):
+                errors.append(f"{name} must be a number, got {value!r}")
+                continue
+            if row[name] < 0:
+                errors.append(f"{name} cannot be negative")
+
+        row['description'] = raw.get('description') or None
+        for name, limit in (('category', 64), ('supplier', 100)):
+            row[name] = raw.get(name) or None
+            if row[name] and len(row[name]) > limit:
+                errors.append(f"{name} is longer than {limit} characters")
+
+        if errors:
+            return None, errors
+        self._seen_skus[row['sku']] = number
+        return row, None
+
+    # ─── Loading ─────────────────────────────────────────────────────────────
+
+    def _import_chunk(self, chunk, columns):
+        valid = []
+        for number, raw in chunk:
+            row, errors = self._validate(number, raw)
+            if errors:
+                self._fail(number, errors)
+            else:
+                valid.append((number, row))
+        self.stats['rows'] += len(chunk)
+        if not valid:
+            return
+
+        try:
+            created, updated, balances = self._load(valid, columns)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.exception("Product import chunk failed")
+            for number, _ in valid:
+                self._fail(number, [f"Database error: {e.__class__.__name__}"])
+            # Rows in this chunk weren't loaded, so their SKUs may appear again
+            for _, row in valid:
+                self._seen_skus.pop(row['sku'], None)
+            self._categories = self._load_names(Category)
+            self._suppliers = self._load_names(Supplier)
+            return
+
+        self.stats['created'] += len(created)
+        self.stats['updated'] += updated
+        self.stats['opening_balances'] += balances
+        self._created_ids.extend(created)
+
+    def _load(self, valid, columns):
+        """Upsert one chunk; returns (new product ids, rows updated, opening balances written)"""
+        rows = [row for _, row in valid]
+        category_ids = self._ensure_names(Category, self._categories, {r['category'] for r in rows if r['category']})
+        supplier_ids = self._ensure_names(Supplier, self._suppliers, {r['supplier'] for r in rows if r['supplier']})
+
+        skus = [row['sku'] for row in rows]
+        existing = set(db.session.execute(select(Product.sku).where(Product.sku.in_(skus))).scalars())
+
+        now = datetime.utcnow()
+        products = []
+        for row in rows:
+            is_new = row['sku'] not in existing
+            products.append({
+                'sku': row['sku'],
+                'name': row['name'],
+                'description': row['description'],
+                'unit_price': row['unit_price'],
+                # Stock only comes from the file for new products
+                'quantity_in_stock': (row['quantity'] or 0) if is_new else 0,
+                'reorder_level': row['reorder_level'] if row['reorder_level'] is not None else 10,
+                'reorder_quantity': row['reorder_quantity'] if row['reorder_quantity'] is not None else 50,
+                'category_id': category_ids.get(row['category'].lower()) if row['category'] else None,
+                'supplier_id': supplier_ids.get(row['supplier'].lower()) if row['supplier'] else None,
+                'created_at': now,
+                'updated_at': now,
+            })
+
+        # Existing products only get the columns the file actually has
+        set_columns = ['name', 'unit_price', 'updated_at']
+        set_columns += [name for name in ('description', 'reorder_level', 'reorder_quantity') if name in columns]
+        set_columns += [f"{name}_id" for name in ('category', 'supplier') if name in columns]
+        upsert(Product.__table__, products, key_columns=('sku',), set_columns=set_columns)
+
+        new_skus = [sku for sku in skus if sku not in existing]
+        updated = len(rows) - len(new_skus)
+        if not new_skus:
+            return [], updated, 0
+
+        new_ids = dict(db.session.execute(select(Product.sku, Product.id).where(Product.sku.in_(new_skus))).all())
+        balances = []
+        if self.opening_balance:
+            balances = [
+                {
+                    'product_id': new_ids[row['sku']],
+                    'delta': row['quantity'],
+                    'transaction_type': 'adjustment',
+                    'unit_price': row['unit_price'],
+                    'notes': 'Opening balance (import)',
+                }
+                for row in rows if row['sku'] in new_ids and row['quantity']
+            ]
+            StockLedger.record(balances, user_id=self.user_id)
+        return list(new_ids.values()), updated, len(balances)
+
+    @staticmethod
+    def _load_names(model):
+        return {name.lower(): id_ for id_, name in db.session.execute(select(model.id, model.name)).all()}
+
+    @staticmethod
+    def _ensure_names(model, known, names):
+        """Create the missing categories/suppliers in one executemany; returns the lower(name) -> id map"""
+        missing = {name.lower(): name for name in names if name.lower() not in known}
+        if missing:
+            now = datetime.utcnow()
+            db.session.execute(insert(model), [
+                {'name': name, 'created_at': now, 'updated_at': now} for name in missing.values()
+            ])
+            known.update(
+                (name.lower(), id_) for id_, name in db.session.execute(
+                    select(model.id, model.name).where(func.lower(model.name).in_(list(missing)))
+                ).all()
+            )
+        return known
+
+    def _fail(self, number, errors):
+        self.stats['failed'] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': number, 'errors': errors})
+
+
+@job_queue.handler('product_import')
+def product_import_job(job, path, opening_balance=True, user_id=None):
+    """Background job: import an uploaded catalog file, then delete it"""
+    try:
+        return ProductImporter(path, opening_balance=opening_balance, user_id=user_id, progress=job.progress).run()
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,176 @@
+import re
+import string
+from collections import deque, namedtuple
+
+# Result of matching one chat message. intent is one of INTENTS; update is
+# {"sku", "quantity", "operation"} for stock updates, otherwise None
+IntentMatch = namedtuple('IntentMatch', 'intent update')
+
+# In priority order: the first intent found in a message wins
+INTENTS = ('show_more', 'confirmation', 'stock_update', 'low_stock', 'stock_listing', 'general')
+
+CONFIRMATION_WORDS = ["yes", "confirm", "approved", "ok", "okay", "sure", "go ahead", "do it", "y", "yep", "yeah"]
+
+LOW_STOCK_PHRASES = [
+    "low stock", "stock below", "reorder level", "need to reorder", "running low", "stock alert",
+    "inventory alert", "products to reorder", "items to reorder", "low inventory", "inventory running low",
+    "list all products with low stock", "show products with low stock", "which products have low stock",
+    "which all have low stock",
+]
+
+STOCK_LISTING_PHRASES = [
+    "list all stock", "show all stock", "list all products", "show all products", "list inventory",
+    "show inventory", "what products do we have", "what items do we have", "all products", "all items",
+    "all stock", "show me all", "list all", "all available products", "available stock",
+]
+
+# Every stock update phrasing starts with one of these words; without one
+# the update regex isn't run at all
+UPDATE_VERBS = ["add", "update", "increase", "decrease", "reduce", "remove", "subtract"]
+
+SHOW_MORE_PATTERN = re.compile(r"^(?:(?:show|see|load|list)\s+)?(?:more|next)(?:\s+(?:products|items|page))?\s*[.!]?$|^continue$")
+
+_UNITS = r"(?:units?|items?|stock|pieces?)"
+_SKU = r"(?:product\s+)?(?:sku[\s-]*)?([a-zA-Z0-9-]+)"
+
+# The four stock update phrasings as one alternation; the named group that
+# matched tells the operation and the order of SKU and quantity
+STOCK_UPDATE_PATTERN = re.compile("|".join([
+    # "add 20 units to product SKU-1234"
+    rf"(?P<add>(?:add|update|increase)\s+(\d+)\s+{_UNITS}\s+(?:to|for)\s+{_SKU})",
+    # "update product SKU-5678 add 10 units"
+    rf"(?P<add_sku_first>(?:update|add\s+to)\s+{_SKU}\s+(?:add|with)\s+(\d+)\s+{_UNITS})",
+    # "remove 15 units from SKU-1234"
+    rf"(?P<remove>(?:decrease|reduce|remove|subtract)\s+(\d+)\s+{_UNITS}\s+(?:from)\s+{_SKU})",
+    # "update SKU-5678 reduce 5 units"
+    rf"(?P<remove_sku_first>(?:update|decrease|reduce|remove\s+from)\s+{_SKU}\s+(?:decrease|reduce|remove|subtract)\s+(\d+)\s+{_UNITS})",
+]))
+
+
+# Bits the keyword scan sets for what it found
+CONFIRMATION, LOW_STOCK, STOCK_LISTING, UPDATE_VERB = 1, 2, 4, 8
+KEYWORDS = {
+    CONFIRMATION: CONFIRMATION_WORDS,
+    LOW_STOCK: LOW_STOCK_PHRASES,
+    STOCK_LISTING: STOCK_LISTING_PHRASES,
+    UPDATE_VERB: UPDATE_VERBS,
+}
+KEYWORD_NAMES = {CONFIRMATION: 'confirmation', LOW_STOCK: 'low_stock', STOCK_LISTING: 'stock_listing',
+                 UPDATE_VERB: 'update_verb'}
+
+# Stripped from both ends of each word: "stock?" and "(yes" are keywords
+_PUNCTUATION = string.punctuation
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over words: finds every phrase in KEYWORDS that
+    occurs in a text in one left-to-right pass, however many phrases there
+    are and however they overlap ("all stock alert" has both a listing and
+    a low stock phrase).
+
+    States are word prefixes of the phrases; each has its word transitions,
+    a failure link (the longest proper suffix that is also a prefix) and
+    the bits of every phrase ending there, including through failure links.
+    """
+
+    def __init__(self, keywords):
+        self.transitions = [{}]
+        self.outputs = [0]
+        for bit, phrases in keywords.items():
+            for phrase in phrases:
+                state = 0
+                for word in phrase.split():
+                    if word not in self.transitions[state]:
+                        self.transitions.append({})
+                        self.outputs.append(0)
+                        self.transitions[state][word] = len(self.transitions) - 1
+                    state = self.transitions[state][word]
+                self.outputs[state] |= bit
+
+        # Failure links, breadth first so shorter prefixes are done first
+        self.failures = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self.transitions[state].items():
+                queue.append(child)
+                fallback = self.failures[state]
+                while fallback and word not in self.transitions[fallback]:
+                    fallback = self.failures[fallback]
+                self.failures[child] = self.transitions[fallback].get(word, 0) if state else 0
+                self.outputs[child] |= self.outputs[self.failures[child]]
+
+    def scan(self, text):
+        """Bits of every phrase in `text` (lower case), OR-ed together"""
+        transitions, failures, outputs = self.transitions, self.failures, self.outputs
+        state = found = 0
+        for word in text.split():
+            word = word.strip(_PUNCTUATION)
+            while state and word not in transitions[state]:
+                state = failures[state]
+            state = transitions[state].get(word, 0)
+            found |= outputs[state]
+        return found
+
+
+class IntentMatcher:
+    """
+    Classifies chat messages into INTENTS with one pass over the message.
+
+    The message is lowercased once and scanned once by a KeywordAutomaton
+    holding every confirmation word, low stock and listing phrase and
+    stock update verb. Keywords match whole words ("y" is a confirmation,
+    "inventory" isn't). The combined stock update regex only runs when the
+    scan found an update verb.
+    """
+
+    def __init__(self, keywords=KEYWORDS):
+        self.automaton = KeywordAutomaton(keywords)
+
+    def keywords_in(self, text):
+        """Names of the keyword groups found in `text` (lower case)"""
+        found = self.automaton.scan(text)
+        return {name for bit, name in KEYWORD_NAMES.items() if found & bit}
+
+    def match(self, message):
+        """The highest-priority intent in `message`, as an IntentMatch"""
+        text = message.lower().strip()
+        if SHOW_MORE_PATTERN.match(text):
+            return IntentMatch('show_more', None)
+
+        found = self.automaton.scan(text)
+        if found & CONFIRMATION:
+            return IntentMatch('confirmation', None)
+        if found & UPDATE_VERB:
+            update = self.stock_update(text)
+            if update:
+                return IntentMatch('stock_update', update)
+        if found & LOW_STOCK:
+            return IntentMatch('low_stock', None)
+        if found & STOCK_LISTING:
+            return IntentMatch('stock_listing', None)
+        return IntentMatch('general', None)
+
+    @staticmethod
+    def stock_update(text):
+        """{"sku", "quantity", "operation"} if `text` (lower case) asks to change stock, else None"""
+        match = STOCK_UPDATE_PATTERN.search(text)
+        if not match:
+            return None
+        kind = match.lastgroup
+        # Each named alternative has its two captures right after it
+        index = STOCK_UPDATE_PATTERN.groupindex[kind]
+        first, second = match.group(index + 1), match.group(index + 2)
+        if kind.endswith('_sku_first'):
+            sku, quantity = first, second
+        else:
+            quantity, sku = first, second
+        operation = 'add' if kind.startswith('add') else 'remove'
+        return {"sku": sku, "quantity": int(quantity), "operation": operation}
+
+    def is_confirmation(self, message):
+        return bool(self.automaton.scan(message.lower()) & CONFIRMATION)
+
+
+intent_matcher = IntentMatcher()
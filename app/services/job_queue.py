@@ -0,0 +1,252 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+class JobContext:
+    """Handed to job handlers so they can report progress while they run"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def progress(self, percent, message=None):
+        """
+        Record progress (0-100) on its own connection so pollers see it
+        immediately. Best effort: a failed update never fails the job (e.g.
+        SQLite allows one writer, and the job may be holding it).
+        """
+        from app.models.models import Job
+
+        values = {'progress': max(0, min(int(percent), 100)), 'heartbeat_at': datetime.utcnow()}
+        if message is not None:
+            values['message'] = message[:255]
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(update(Job.__table__).where(Job.__table__.c.id == self.job_id).values(**values))
+        except SQLAlchemyError as e:
+            logger.warning("Could not record progress for job %s: %s", self.job_id, e)
+
+
+class JobQueue:
+    """
+    Database-backed background jobs. Jobs are rows in the jobs table, so they
+    survive restarts and are visible to every worker process; worker threads
+    claim queued rows with a conditional UPDATE so each job runs once.
+
+    Jobs enqueued with a dedupe key share one row while it is queued or
+    running: a second request for the same work gets the existing job back.
+    Running jobs that stop heartbeating (e.g. the process died) are requeued
+    up to JOB_MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.handlers = {}
+        self.workers = 1
+        self.poll_interval = 5.0
+        self.stale_after = 600
+        self.max_attempts = 3
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = int(os.getenv('JOB_WORKER_THREADS', 1))
+        self.poll_interval = float(os.getenv('JOB_POLL_INTERVAL', 5))
+        self.stale_after = int(os.getenv('JOB_STALE_AFTER', 600))
+        self.max_attempts = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+        app.extensions['job_queue'] = self
+
+        @app.cli.command('run-jobs')
+        def run_jobs():
+            """Run queued background jobs until none are left (for cron-style deployments)."""
+            self.requeue_stale()
+            print(f"Ran {self.run_pending()} job(s)")
+
+        # JOB_WORKER_THREADS=0 disables the threads, e.g. on serverless hosts
+        # where queued jobs are drained by `flask run-jobs` instead.
+        if self.workers > 0:
+            self.start()
+
+    def handler(self, kind):
+        """Decorator registering fn(job, **params) as the handler for `kind` jobs"""
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    # ─── Producer side ──────────────────────────────────────────────────────────
+
+    def enqueue(self, kind, params=None, dedupe_key=None, user_id=None):
+        """
+        Queue a job and return it. If `dedupe_key` is given and a job with that
+        key is still queued or running, that job is returned instead.
+        """
+        from app.models.models import Job
+
+        table = Job.__table__
+        for _ in range(3):
+            job_id = str(uuid.uuid4())
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(table.insert().values(
+                        id=job_id, kind=kind, active_key=dedupe_key, status='queued',
+                        progress=0, params=json.dumps(params or {}), attempts=0,
+                        created_by=user_id, created_at=datetime.utcnow(),
+                    ))
+            except IntegrityError:
+                with db.engine.connect() as conn:
+                    job_id = conn.execute(
+                        select(table.c.id).where(table.c.active_key == dedupe_key)
+                    ).scalar()
+                if job_id is None:
+                    # The other job finished in between; try again
+                    continue
+            else:
+                self._wakeup.set()
+            return db.session.get(Job, job_id, populate_existing=True)
+
+        raise RuntimeError(f"Could not enqueue {kind} job")
+
+    # ─── Worker side ───────────────────────────────────────────────────────────
+
+    def start(self):
+        if any(t.is_alive() for t in self._threads):
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._loop, name=f'job-worker-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.requeue_stale()
+                self.run_pending()
+            except Exception:
+                logger.exception("Job worker iteration failed")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _heartbeat_loop(self):
+        from app.models.models import Job
+
+        table = Job.__table__
+        while not self._stop.wait(max(self.stale_after / 3, 1)):
+            with self._running_lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                with self.app.app_context(), db.engine.begin() as conn:
+                    conn.execute(update(table).where(table.c.id.in_(running)).values(heartbeat_at=datetime.utcnow()))
+            except Exception:
+                logger.exception("Job heartbeat failed")
+
+    def requeue_stale(self):
+        """Requeue running jobs whose worker stopped heartbeating, or fail them after max attempts"""
+        from app.models.models import Job
+
+        table = Job.__table__
+        now = datetime.utcnow()
+        stale = (table.c.status == 'running') & (table.c.heartbeat_at < now - timedelta(seconds=self.stale_after))
+        with self.app.app_context(), db.engine.begin() as conn:
+            conn.execute(
+                update(table).where(stale, table.c.attempts >= self.max_attempts)
+                .values(status='failed', error='Worker stopped responding', active_key=None, finished_at=now)
+            )
+            conn.execute(
+                update(table).where(stale).values(status='queued', message='Requeued after worker was lost')
+            )
+
+    def run_pending(self):
+        """Run queued jobs one at a time until none are left. Returns how many ran."""
+        ran = 0
+        while not self._stop.is_set():
+            job_id = self._claim()
+            if job_id is None:
+                break
+            self._execute(job_id)
+            ran += 1
+        return ran
+
+    def _claim(self):
+        """Atomically move the oldest queued job to running; returns its id or None"""
+        from app.models.models import Job
+
+        table = Job.__table__
+        with self.app.app_context():
+            while True:
+                with db.engine.begin() as conn:
+                    job_id = conn.execute(
+                        select(table.c.id).where(table.c.status == 'queued')
+                        .order_by(table.c.created_at).limit(1)
+                    ).scalar()
+                    if job_id is None:
+                        return None
+                    now = datetime.utcnow()
+                    claimed = conn.execute(
+                        update(table).where(table.c.id == job_id, table.c.status == 'queued')
+                        .values(status='running', started_at=now, heartbeat_at=now,
+                                attempts=table.c.attempts + 1)
+                    ).rowcount
+                if claimed:
+                    return job_id
+
+    def _execute(self, job_id):
+        from app.models.models import Job
+
+        table = Job.__table__
+        with self._running_lock:
+            self._running.add(job_id)
+        try:
+            with self.app.app_context():
+                job = db.session.get(Job, job_id)
+                handler = self.handlers.get(job.kind)
+                params = json.loads(job.params or '{}')
+                db.session.commit()  # don't hold a transaction open while the job runs
+
+                try:
+                    if handler is None:
+                        raise LookupError(f"No handler registered for {job.kind} jobs")
+                    result = handler(JobContext(job_id), **params)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.exception("Job %s (%s) failed", job_id, job.kind)
+                    values = {'status': 'failed', 'error': str(e) or type(e).__name__}
+                else:
+                    values = {'status': 'succeeded', 'progress': 100, 'result': json.dumps(result)}
+
+                values.update(active_key=None, finished_at=datetime.utcnow())
+                with db.engine.begin() as conn:
+                    conn.execute(update(table).where(table.c.id == job_id).values(**values))
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,116 @@
+import os
+import logging
+import threading
+
+from app.signals import stock_changed
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationScheduler:
+    """
+    Runs the low-stock and irregular-activity scans off the request path.
+
+    A daemon thread scans every NOTIFICATION_SCAN_INTERVAL seconds and a few
+    seconds after any stock change. Scans are single-flight: if one is already
+    running, further requests are folded into the next pass.
+
+    The thread starts with the first request the process serves, so CLI
+    commands (`flask db upgrade`, `flask run-jobs`, ...), the reloader's
+    parent process and apps that never serve requests don't run one.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 300
+        self.debounce = 5.0
+        self._run_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._connected = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = int(os.getenv('NOTIFICATION_SCAN_INTERVAL', 300))
+        self.debounce = float(os.getenv('NOTIFICATION_SCAN_DEBOUNCE', 5))
+        app.extensions['notification_scheduler'] = self
+
+        # One receiver per process, however many apps are created
+        if not self._connected:
+            stock_changed.connect(self._on_stock_changed, weak=False)
+            self._connected = True
+
+        @app.cli.command('scan-notifications')
+        def scan_notifications():
+            """Run the notification scans once (for cron-style deployments)."""
+            self.run_once()
+
+        # NOTIFICATION_SCAN_INTERVAL=0 disables the thread, e.g. on serverless
+        # hosts where scans are driven by `flask scan-notifications` instead.
+        if self.interval > 0:
+            app.before_request(self._start_on_first_request)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name='notification-scheduler', daemon=True
+            )
+            self._thread.start()
+        # Scan shortly after startup rather than waiting a full interval
+        self._wakeup.set()
+
+    def _start_on_first_request(self):
+        if self._thread is None:
+            self.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def trigger(self):
+        """Ask for a scan soon; bursts of triggers collapse into one scan."""
+        self._wakeup.set()
+
+    def _on_stock_changed(self, sender, **extra):
+        self.trigger()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            triggered = self._wakeup.wait(self.interval)
+            if self._stop.is_set():
+                break
+            if triggered:
+                # Let a burst of stock changes settle before scanning
+                self._stop.wait(self.debounce)
+                self._wakeup.clear()
+            self.run_once()
+
+    def run_once(self):
+        """Run both scans now. Returns False if a scan is already in progress."""
+        if not self._run_lock.acquire(blocking=False):
+            return False
+
+        try:
+            from app.services.notification_service import NotificationService
+
+            with self.app.app_context():
+                notification_service = NotificationService()
+                notification_service.check_low_stock()
+                notification_service.check_irregular_activity()
+            return True
+        except Exception:
+            logger.exception("Notification scan failed")
+            return False
+        finally:
+            self._run_lock.release()
+
+
+notification_scheduler = NotificationScheduler()
@@ -1,7 +1,8 @@
 from app import db
-from app.models.models import Product, Notification, InventoryTransaction, Supplier
+from app.models.models import Product, Notification, InventoryTransaction, Watermark
 from app.services.ai_service import AIService
-from sqlalchemy import func
+from sqlalchemy import func, exists, insert
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 
 class NotificationService:
@@ -10,104 +11,142 @@ class NotificationService:
     
     def check_low_stock(self):
         """Check for products with low stock and generate notifications"""
-        # Find products where quantity is below reorder level
-        low_stock_products = Product.query.filter(
-            Product.quantity_in_stock <= Product.reorder_level
+        # Low-stock products that don't already have an unread low_stock
+        # notification, with their suppliers loaded in the same query
+        has_unread_notification = exists().where(
+            Notification.product_id == Product.id,
+            Notification.notification_type == 'low_stock',
+            Notification.is_read == False
+        )
+        low_stock_products = Product.query.options(
+            joinedload(Product.supplier)
+        ).filter(
+            Product.quantity_in_stock <= Product.reorder_level,
+            ~has_unread_notification
         ).all()
         
         created_notifications = []
         
         for product in low_stock_products:
-            # Check if a notification already exists for this product
-            existing_notification = Notification.query.filter_by(
-                product_id=product.id,
-                notification_type='low_stock',
-                is_read=False
-            ).first()
+            # Generate AI notification message
+            ai_message = self.ai_service.generate_low_stock_notification(product, product.supplier)
             
-            if not existing_notification:
-                supplier = Supplier.query.get(product.supplier_id)
-                
-                # Generate AI notification message
-                ai_message = self.ai_service.generate_low_stock_notification(product, supplier)
-                
-                # Create notification
-                notification = Notification(
-                    product_id=product.id,
-                    notification_type='low_stock',
-                    message=f"Low stock alert for {product.name}. Current stock: {product.quantity_in_stock}, Reorder level: {product.reorder_level}",
-                    ai_summary=ai_message
-                )
-                
-                db.session.add(notification)
-                created_notifications.append(notification)
+            created_notifications.append({
+                'product_id': product.id,
+                'notification_type': 'low_stock',
+                'message': f"Low stock alert for {product.name}. Current stock: {product.quantity_in_stock}, Reorder level: {product.reorder_level}",
+                'ai_summary': ai_message
+            })
         
         if created_notifications:
+            db.session.execute(insert(Notification), created_notifications)
             db.session.commit()
         
         return created_notifications
     
     def check_irregular_activity(self, days=7):
-        """Check for irregular inventory activity"""
-        # Get transactions from the last X days
+        """Check transactions recorded since the last scan for irregular activity"""
         recent_date = datetime.utcnow() - timedelta(days=days)
-        recent_transactions = InventoryTransaction.query.filter(
-            InventoryTransaction.transaction_date >= recent_date
-        ).all()
         
-        created_notifications = []
+        # Only transactions after the watermark are scored; earlier ones were
+        # handled by a previous scan
+        watermark = db.session.get(Watermark, 'irregular_activity') or Watermark(name='irregular_activity', last_id=0)
+        max_id = db.session.query(func.max(InventoryTransaction.id)).scalar()
+        if max_id is None or max_id <= watermark.last_id:
+            return []
+        
+        new_in_window = (
+            (InventoryTransaction.id > watermark.last_id) &
+            (InventoryTransaction.id <= max_id) &
+            (InventoryTransaction.transaction_date >= recent_date)
+        )
+        
+        # Mean and standard deviation per (product, type) over the window,
+        # computed in SQL for the products that have new transactions
+        touched_products = db.session.query(InventoryTransaction.product_id).filter(new_in_window)
+        window_stats = db.session.query(
+            InventoryTransaction.product_id,
+            InventoryTransaction.transaction_type,
+            func.count(InventoryTransaction.id),
+            func.avg(InventoryTransaction.quantity),
+            func.avg(InventoryTransaction.quantity * InventoryTransaction.quantity)
+        ).filter(
+            InventoryTransaction.transaction_date >= recent_date,
+            InventoryTransaction.id <= max_id,
+            InventoryTransaction.product_id.in_(touched_products)
+        ).group_by(
+            InventoryTransaction.product_id,
+            InventoryTransaction.transaction_type
+        ).having(func.count(InventoryTransaction.id) > 1)  # Need at least 2 transactions to detect irregularities
+        
+        stats = {}
+        for product_id, transaction_type, count, mean, mean_of_squares in window_stats:
+            mean = float(mean)
+            stddev = max(float(mean_of_squares) - mean * mean, 0.0) ** 0.5
+            stats[(product_id, transaction_type)] = (mean, stddev)
         
-        # Get average transaction quantities by product and type
-        product_avgs = {}
-        for transaction in recent_transactions:
+        # Stream the new transactions and keep the most irregular one per product
+        deviation_threshold = 2.0  # 200% above average or 50% below average
+        candidates = {}
+        new_transactions = db.session.query(
+            InventoryTransaction.id,
+            InventoryTransaction.product_id,
+            InventoryTransaction.transaction_type,
+            InventoryTransaction.quantity,
+            InventoryTransaction.transaction_date
+        ).filter(new_in_window).order_by(InventoryTransaction.id).yield_per(1000)
+        
+        for transaction in new_transactions:
             key = (transaction.product_id, transaction.transaction_type)
-            if key not in product_avgs:
-                product_avgs[key] = {'total': 0, 'count': 0, 'transactions': []}
+            if key not in stats:
+                continue
+            
+            avg_quantity, stddev = stats[key]
+            deviation = transaction.quantity / avg_quantity if avg_quantity > 0 else 0
+            is_irregular = deviation > deviation_threshold or (deviation > 0 and deviation < (1/deviation_threshold))
             
-            product_avgs[key]['total'] += transaction.quantity
-            product_avgs[key]['count'] += 1
-            product_avgs[key]['transactions'].append(transaction)
+            if is_irregular:
+                score = max(deviation, 1 / deviation)
+                current = candidates.get(transaction.product_id)
+                if current is None or score > current[0]:
+                    candidates[transaction.product_id] = (score, transaction, avg_quantity, stddev)
         
-        # Calculate averages
-        for key, data in product_avgs.items():
-            if data['count'] > 1:  # Need at least 2 transactions to detect irregularities
-                avg_quantity = data['total'] / data['count']
+        created_notifications = []
+        
+        if candidates:
+            # Skip products that already have an unread irregular activity notification
+            already_notified = {
+                product_id for (product_id,) in db.session.query(Notification.product_id).filter(
+                    Notification.product_id.in_(list(candidates)),
+                    Notification.notification_type == 'irregular_activity',
+                    Notification.is_read == False
+                ).distinct()
+            }
+            products = {
+                product.id: product
+                for product in Product.query.filter(Product.id.in_(set(candidates) - already_notified))
+            }
+            
+            for product_id, product in products.items():
+                _, transaction, avg_quantity, stddev = candidates[product_id]
                 
-                for transaction in data['transactions']:
-                    # Check if transaction is significantly different from average
-                    deviation_threshold = 2.0  # 200% above average or 50% below average
-                    deviation = transaction.quantity / avg_quantity if avg_quantity > 0 else 0
-                    
-                    is_irregular = deviation > deviation_threshold or (deviation > 0 and deviation < (1/deviation_threshold))
-                    
-                    if is_irregular:
-                        # Check if notification already exists for this transaction
-                        existing_notification = Notification.query.filter_by(
-                            product_id=transaction.product_id,
-                            notification_type='irregular_activity',
-                            is_read=False
-                        ).first()
-                        
-                        if not existing_notification:
-                            product = Product.query.get(transaction.product_id)
-                            
-                            # Generate AI alert message
-                            ai_message = self.ai_service.generate_irregular_activity_alert(
-                                product, transaction, avg_quantity
-                            )
-                            
-                            # Create notification
-                            notification = Notification(
-                                product_id=transaction.product_id,
-                                notification_type='irregular_activity',
-                                message=f"Irregular activity detected for {product.name}. Transaction quantity: {transaction.quantity}, Average: {avg_quantity:.2f}",
-                                ai_summary=ai_message
-                            )
-                            
-                            db.session.add(notification)
-                            created_notifications.append(notification)
+                # Generate AI alert message
+                ai_message = self.ai_service.generate_irregular_activity_alert(
+                    product, transaction, avg_quantity
+                )
+                
+                created_notifications.append({
+                    'product_id': product_id,
+                    'notification_type': 'irregular_activity',
+                    'message': f"Irregular activity detected for {product.name}. Transaction quantity: {transaction.quantity}, Average: {avg_quantity:.2f}, Std dev: {stddev:.2f}",
+                    'ai_summary': ai_message
+                })
         
         if created_notifications:
-            db.session.commit()
+            db.session.execute(insert(Notification), created_notifications)
+        
+        watermark.last_id = max_id
+        db.session.add(watermark)
+        db.session.commit()
         
         return created_notifications
@@ -0,0 +1,93 @@
+from datetime import datetime
+
+from sqlalchemy import case, select, update
+
+from app import db
+from app.models.models import PurchaseOrder, PurchaseOrderItem
+from app.services.stock_ledger import StockLedger
+
+
+class PurchaseOrderService:
+    @staticmethod
+    def receive(order_id, quantities=None, user_id=None):
+        """
+        Receive a purchase order's outstanding quantities into stock.
+
+        `quantities` maps item id -> units received now (partial receipts);
+        None receives everything still outstanding. Each line records what
+        it has received, so receiving the same order again only adds what
+        is left: repeating a receipt is a no-op. Lines are read in one
+        query and stock is updated with one set-based statement.
+
+        Returns {'received': {product_id: units}, 'status': new status}.
+        Raises LookupError for an unknown or canceled order and ValueError
+        for quantities beyond what is outstanding. Does not commit.
+        """
+        po, item = PurchaseOrder, PurchaseOrderItem
+
+        # 1) Write-lock the order first so concurrent receipts of it queue up
+        #    and each sees the quantities the previous one recorded
+        locked = db.session.execute(
+            update(po).where(po.id == order_id, po.status != 'canceled')
+            .values(updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not locked:
+            raise LookupError(f"Purchase order {order_id} not found or canceled")
+
+        # 2) All lines in one query
+        lines = db.session.execute(
+            select(item.id, item.product_id, item.quantity, item.received_quantity, item.unit_price)
+            .where(item.purchase_order_id == order_id)
+        ).all()
+
+        # 3) Work out what each line receives now
+        receipts = {}
+        for line in lines:
+            outstanding = max(line.quantity - (line.received_quantity or 0), 0)
+            wanted = outstanding if quantities is None else int(quantities.get(line.id, 0))
+            if wanted < 0 or wanted > outstanding:
+                raise ValueError(f"Line {line.id} has {outstanding} units outstanding, cannot receive {wanted}")
+            if wanted:
+                receipts[line.id] = wanted
+        unknown = set(quantities or ()) - {line.id for line in lines}
+        if unknown:
+            raise ValueError(f"Items {sorted(unknown)} are not on purchase order {order_id}")
+
+        # Nothing arrived (e.g. every line entered as 0) on an order that is
+        # still outstanding: its status stays as it is
+        complete = all((line.received_quantity or 0) + receipts.get(line.id, 0) >= line.quantity for line in lines)
+        if not receipts and not complete:
+            status = db.session.execute(select(po.status).where(po.id == order_id)).scalar()
+            return {'received': {}, 'status': status}
+
+        # 4) Record the receipts per line, then move stock in bulk
+        if receipts:
+            db.session.execute(
+                update(item).where(item.id.in_(list(receipts)))
+                .values(received_quantity=item.received_quantity + case(receipts, value=item.id, else_=0))
+                .execution_options(synchronize_session='fetch')
+            )
+            StockLedger.receive_many([
+                {
+                    'product_id': line.product_id,
+                    'delta': receipts[line.id],
+                    'transaction_type': 'purchase',
+                    'unit_price': line.unit_price,
+                    'notes': f"Received from PO #{order_id}",
+                }
+                for line in lines if line.id in receipts
+            ], user_id=user_id)
+
+        # 5) Received once every line is complete, otherwise partially received
+        status = 'received' if complete else 'partially_received'
+        db.session.execute(
+            update(po).where(po.id == order_id).values(status=status)
+            .execution_options(synchronize_session='fetch')
+        )
+
+        received = {}
+        for line in lines:
+            if line.id in receipts:
+                received[line.product_id] = received.get(line.product_id, 0) + receipts[line.id]
+        return {'received': received, 'status': status}
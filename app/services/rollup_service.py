@@ -0,0 +1,230 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import delete, event, func, inspect, select, text
+from sqlalchemy.orm import Session
+
+from app import db
+from app.services.job_queue import job_queue
+from app.utils.sql import upsert
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ('hour', 'day')
+
+# Stored transaction types use mixed spellings; rollups use one name per kind
+CANONICAL_TYPES = {'purchase': 'purchase', 'in': 'purchase', 'sale': 'sale', 'out': 'sale'}
+
+
+def canonical_type(transaction_type):
+    ttype = (transaction_type or '').strip().lower()
+    return CANONICAL_TYPES.get(ttype, ttype)
+
+
+def bucket_start(moment, granularity):
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _rollup_rows(movements):
+    """
+    Fold (product_id, transaction_type, quantity, transaction_date, sign)
+    movements into upsert rows for every granularity
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for product_id, transaction_type, quantity, transaction_date, sign in movements:
+        moment = transaction_date or datetime.utcnow()
+        ttype = canonical_type(transaction_type)
+        for granularity in GRANULARITIES:
+            entry = totals[(granularity, bucket_start(moment, granularity), product_id, ttype)]
+            entry[0] += sign * (quantity or 0)
+            entry[1] += sign
+    return [
+        {'granularity': granularity, 'bucket': bucket, 'product_id': product_id,
+         'transaction_type': ttype, 'quantity': quantity, 'transaction_count': count}
+        for (granularity, bucket, product_id, ttype), (quantity, count) in totals.items()
+        if quantity or count
+    ]
+
+
+class StockRollups:
+    """
+    Maintains stock_movement_rollups, hourly and daily transaction totals per
+    product and type, in the same database transaction as the writes:
+
+    - InventoryTransaction rows added, changed or deleted through the ORM are
+      picked up by flush listeners.
+    - Code that writes transactions with Core bulk inserts must call
+      `record(rows)` itself on the same session.
+    - `flask rebuild-rollups` (or the job queued when the table is empty)
+      rebuilds everything from the raw ledger.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['stock_rollups'] = self
+
+        if not event.contains(Session, 'after_flush', _after_flush):
+            event.listen(Session, 'before_flush', _before_flush)
+            event.listen(Session, 'after_flush', _after_flush)
+
+        @app.cli.command('rebuild-rollups')
+        def rebuild_rollups():
+            """Rebuild the dashboard's stock movement rollups from the transaction ledger."""
+            print(f"Rolled up {self.rebuild():,} transactions")
+
+        # First start after the table was added: backfill it in the background
+        from app.models.models import InventoryTransaction, StockMovementRollup
+        with app.app_context():
+            try:
+                needs_backfill = (
+                    db.session.query(StockMovementRollup.product_id).first() is None
+                    and db.session.query(InventoryTransaction.id).first() is not None
+                )
+                if needs_backfill:
+                    job_queue.enqueue('rebuild_rollups', dedupe_key='rebuild_rollups')
+            except Exception:
+                logger.exception("Could not check the stock movement rollups")
+            finally:
+                db.session.remove()
+
+    @staticmethod
+    def record(rows, sign=1, session=None):
+        """
+        Add (sign=1) or remove (sign=-1) transactions written without the ORM.
+        `rows` are dicts with product_id, transaction_type, quantity and
+        transaction_date.
+        """
+        session = session or db.session
+        StockRollups._apply(session.connection(), [
+            (row['product_id'], row['transaction_type'], row['quantity'], row.get('transaction_date'), sign)
+            for row in rows
+        ])
+
+    @staticmethod
+    def forget_product(product_id):
+        """Drop a deleted product's rollups (its transactions are bulk-deleted with it)"""
+        from app.models.models import StockMovementRollup
+        db.session.execute(delete(StockMovementRollup).where(StockMovementRollup.product_id == product_id))
+
+    @staticmethod
+    def rebuild(progress=None, batch_size=10000, chunk_size=50000):
+        """Recompute every rollup from inventory_transaction; returns how many transactions were read"""
+        from app.models.models import InventoryTransaction, StockMovementRollup
+
+        connection = db.session.connection()
+        if connection.dialect.name == 'postgresql':
+            # Keep writers out so no transaction is counted twice or missed
+            connection.execute(text("LOCK TABLE inventory_transaction IN SHARE MODE"))
+        db.session.execute(delete(StockMovementRollup))
+
+        total = db.session.query(func.count(InventoryTransaction.id)).scalar() or 0
+        pending, seen = [], 0
+        rows = db.session.execute(
+            select(
+                InventoryTransaction.product_id, InventoryTransaction.transaction_type,
+                InventoryTransaction.quantity, InventoryTransaction.transaction_date,
+            ).execution_options(yield_per=batch_size)
+        )
+        for row in rows:
+            pending.append((*row, 1))
+            seen += 1
+            if len(pending) >= chunk_size:
+                StockRollups._apply(connection, pending)
+                pending = []
+                if progress and total:
+                    progress(100 * seen // total, f"Rolled up {seen:,} of {total:,} transactions")
+        StockRollups._apply(connection, pending)
+
+        db.session.commit()
+        return seen
+
+    @staticmethod
+    def movements(granularity, start, end):
+        """
+        Totals per bucket and type between `start` (inclusive) and `end`
+        (exclusive), summed over products: [(bucket, type, quantity, count)]
+        """
+        from app.models.models import StockMovementRollup as R
+
+        return (
+            db.session.query(
+                R.bucket, R.transaction_type,
+                func.sum(R.quantity), func.sum(R.transaction_count),
+            )
+            .filter(R.granularity == granularity, R.bucket >= start, R.bucket < end)
+            .group_by(R.bucket, R.transaction_type)
+            .all()
+        )
+
+    @staticmethod
+    def _apply(connection, movements):
+        from app.models.models import StockMovementRollup
+
+        upsert(
+            StockMovementRollup.__table__,
+            _rollup_rows(movements),
+            key_columns=('granularity', 'bucket', 'product_id', 'transaction_type'),
+            add_columns=('quantity', 'transaction_count'),
+            bind=connection,
+        )
+
+
+_TRACKED_FIELDS = ('product_id', 'transaction_type', 'quantity', 'transaction_date')
+
+
+def _before_flush(session, flush_context, instances):
+    """Take changed and deleted transactions out, using the values still in the database"""
+    from app.models.models import InventoryTransaction
+
+    changed = [
+        obj for obj in session.dirty
+        if isinstance(obj, InventoryTransaction)
+        and any(inspect(obj).attrs[name].history.has_changes() for name in _TRACKED_FIELDS)
+    ]
+    removed_ids = [
+        inspect(obj).identity[0] for obj in session.deleted
+        if isinstance(obj, InventoryTransaction) and inspect(obj).identity
+    ]
+    old_ids = [inspect(obj).identity[0] for obj in changed] + removed_ids
+    if not old_ids:
+        return
+
+    table = InventoryTransaction.__table__
+    connection = session.connection()
+    old_rows = connection.execute(
+        select(*(table.c[name] for name in _TRACKED_FIELDS)).where(table.c.id.in_(old_ids))
+    ).all()
+
+    movements = [(*row, -1) for row in old_rows]
+    # ...and put changed ones back in with their new values
+    movements += [(*(getattr(obj, name) for name in _TRACKED_FIELDS), 1) for obj in changed]
+    StockRollups._apply(connection, movements)
+
+
+def _after_flush(session, flush_context):
+    """Add new transactions once their defaults (e.g. transaction_date) are set"""
+    from app.models.models import InventoryTransaction
+
+    movements = [
+        (*(getattr(obj, name) for name in _TRACKED_FIELDS), 1)
+        for obj in session.new if isinstance(obj, InventoryTransaction)
+    ]
+    if movements:
+        StockRollups._apply(session.connection(), movements)
+
+
+stock_rollups = StockRollups()
+
+
+@job_queue.handler('rebuild_rollups')
+def rebuild_rollups_job(job):
+    """Background job: rebuild the rollups (queued automatically when the table is empty)"""
+    return {'transactions': StockRollups.rebuild(progress=job.progress)}
@@ -0,0 +1,105 @@
+from sqlalchemy import case, func, or_, select
+
+from app import db
+from app.models.models import Product
+
+SEARCH_LIMIT = 10
+
+# Without trigram indexes, rank only the first matches a scan finds, so
+# common terms stop scanning early instead of sorting the whole table
+CANDIDATE_WINDOW = 500
+
+# Columns returned by searches; enough for chat replies and pickers
+SEARCH_COLUMNS = (
+    Product.id, Product.name, Product.sku, Product.description,
+    Product.quantity_in_stock, Product.unit_price, Product.reorder_level,
+)
+
+
+class ProductSearch:
+    """
+    Product lookups for the chatbot, the Discord bot and SKU resolution.
+
+    SKUs are matched exactly (case-insensitively) through the lower(sku)
+    index first. Free-text searches are ranked: exact SKU, SKU prefix, name
+    prefix, name, SKU and description matches, in that order. On PostgreSQL
+    the '%term%' filters are served by pg_trgm GIN indexes and near misses
+    (typos) also match by trigram similarity; other databases scan and rank
+    the first CANDIDATE_WINDOW matches.
+    """
+
+    @staticmethod
+    def find_by_sku(sku):
+        """The product whose SKU is `sku` (ignoring case and a 'SKU-' prefix), or None"""
+        return db.session.execute(ProductSearch.sku_statement(sku)).scalars().first()
+
+    @staticmethod
+    def search(query, limit=SEARCH_LIMIT):
+        """Best matches for `query` in name, SKU and description, as dicts"""
+        if not (query or '').strip():
+            return []
+        dialect = db.session.get_bind().dialect.name
+        rows = db.session.execute(ProductSearch.search_statement(query, dialect, limit)).mappings()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def resolve_sku(sku, limit=5):
+        """
+        Resolve a SKU typed by a user to one product without guessing.
+        Returns (product, candidates): the exact match if there is one, else
+        the only search hit if there is exactly one, else (None, hits).
+        """
+        product = ProductSearch.find_by_sku(sku)
+        if product:
+            return product, []
+        candidates = ProductSearch.search(sku, limit=limit)
+        if len(candidates) == 1:
+            return db.session.get(Product, candidates[0]['id']), []
+        return None, candidates
+
+    @staticmethod
+    def sku_statement(sku):
+        term = (sku or '').strip().lower()
+        keys = {term}
+        # Chat messages often drop the 'SKU-' prefix ("add 5 units to sku 1234")
+        if term and not term.startswith('sku'):
+            keys.update({f'sku-{term}', f'sku{term}'})
+        return (
+            select(Product)
+            .where(func.lower(Product.sku).in_(sorted(keys)))
+            .order_by(case((func.lower(Product.sku) == term, 0), else_=1))
+            .limit(1)
+        )
+
+    @staticmethod
+    def search_statement(query, dialect, limit=SEARCH_LIMIT):
+        term = query.strip().lower()
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        contains, prefix = f'%{escaped}%', f'{escaped}%'
+
+        rank = case(
+            (func.lower(Product.sku) == term, 0),
+            (Product.sku.ilike(prefix, escape='\\'), 1),
+            (Product.name.ilike(prefix, escape='\\'), 2),
+            (Product.name.ilike(contains, escape='\\'), 3),
+            (Product.sku.ilike(contains, escape='\\'), 4),
+            else_=5,
+        )
+        matches = [
+            Product.name.ilike(contains, escape='\\'),
+            Product.sku.ilike(contains, escape='\\'),
+            Product.description.ilike(contains, escape='\\'),
+        ]
+        order = [rank]
+        stmt = select(*SEARCH_COLUMNS)
+        if dialect == 'postgresql':
+            # pg_trgm: '%' is the indexed similarity operator
+            matches.append(Product.name.op('%')(term))
+            order.append(func.similarity(Product.name, term).desc())
+            stmt = stmt.where(or_(*matches))
+        else:
+            window = select(Product.id).where(or_(*matches)).limit(CANDIDATE_WINDOW).subquery()
+            stmt = stmt.join(window, window.c.id == Product.id)
+        order.extend([Product.name, Product.id])
+
+        return stmt.order_by(*order).limit(limit)
@@ -0,0 +1,179 @@
+from datetime import datetime
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import case, func, insert, select, update
+
+from app import db
+from app.models.models import InventoryTransaction, Product
+from app.services.rollup_service import StockRollups
+
+# Result of one applied stock movement
+StockChange = namedtuple('StockChange', 'product_id old_quantity new_quantity')
+
+
+class InsufficientStock(ValueError):
+    """A movement would take a product's stock below zero; nothing was changed"""
+
+    def __init__(self, product_id, available, requested):
+        self.product_id = product_id
+        self.available = available
+        self.requested = requested
+        super().__init__(f"Not enough stock for product {product_id}: {available} available, {requested} requested")
+
+
+class StockLedger:
+    """
+    The only place product stock levels are changed by a delta.
+
+    Each movement is a single conditional UPDATE (quantity_in_stock + delta,
+    only where the result stays >= 0) so concurrent writers can neither lose
+    updates nor oversell; the matching InventoryTransaction rows are inserted
+    in the same database transaction. The product table also has a CHECK
+    constraint as a last line of defence.
+
+    Nothing is committed here: callers commit (and send stock_changed) so
+    the movement is part of their unit of work.
+    """
+
+    @staticmethod
+    def apply(product_id, delta, transaction_type, quantity=None, unit_price=None, notes=None,
+              user_id=None, transaction_date=None, session=None):
+        """Move one product's stock by `delta` and record it; returns a StockChange"""
+        return StockLedger.apply_many([{
+            'product_id': product_id, 'delta': delta, 'transaction_type': transaction_type,
+            'quantity': quantity, 'unit_price': unit_price, 'notes': notes,
+            'transaction_date': transaction_date,
+        }], user_id=user_id, session=session)[0]
+
+    @staticmethod
+    def apply_many(movements, user_id=None, session=None):
+        """
+        Apply several movements, of any sign, atomically.
+        Each movement is a dict with product_id, delta and transaction_type,
+        and optionally unit_price, notes, transaction_date and quantity (the
+        recorded quantity, default abs(delta)).
+
+        Raises InsufficientStock or LookupError (unknown product); the caller
+        rolls back, which also undoes any movements already applied.
+        """
+        session = session or db.session
+        changes = {}
+
+        # 1) Lock rows in a fixed order so two multi-product writers can't deadlock
+        for movement in sorted(movements, key=lambda m: m['product_id']):
+            product_id, delta = movement['product_id'], int(movement['delta'])
+            new_quantity = StockLedger._update(session, product_id, delta)
+            old_quantity = new_quantity - delta
+            if product_id in changes:
+                old_quantity = changes[product_id].old_quantity
+            changes[product_id] = StockChange(product_id, old_quantity, new_quantity)
+
+        # 2) One executemany for the ledger rows
+        StockLedger.record(movements, user_id, session)
+
+        return [changes[movement['product_id']] for movement in movements]
+
+    @staticmethod
+    def receive_many(movements, user_id=None, session=None):
+        """
+        Add stock for many lines at once (e.g. a supplier delivery): one
+        set-based UPDATE for every product plus one executemany for the
+        ledger rows, whatever the number of lines. Deltas must be positive,
+        so no per-row guard is needed. Takes the same movement dicts as
+        apply_many().
+        """
+        session = session or db.session
+        deltas = defaultdict(int)
+        for movement in movements:
+            if int(movement['delta']) <= 0:
+                raise ValueError("receive_many only adds stock")
+            deltas[movement['product_id']] += int(movement['delta'])
+        if not deltas:
+            return 0
+
+        updated = session.execute(
+            update(Product).where(Product.id.in_(list(deltas)))
+            .values(quantity_in_stock=func.coalesce(Product.quantity_in_stock, 0)
+                    + case(dict(deltas), value=Product.id, else_=0))
+            .execution_options(synchronize_session='fetch')
+        ).rowcount
+        if updated != len(deltas):
+            raise LookupError("Some products to receive no longer exist")
+
+        StockLedger.record(movements, user_id, session)
+        return updated
+
+    @staticmethod
+    def record(movements, user_id=None, session=None):
+        """
+        Insert the InventoryTransaction rows for `movements` in one executemany,
+        without touching stock (e.g. opening balances of newly created products).
+        """
+        session = session or db.session
+        now = datetime.utcnow()
+        rows = []
+        for movement in movements:
+            quantity = movement.get('quantity')
+            if quantity is None:
+                quantity = abs(int(movement['delta']))
+            unit_price = movement.get('unit_price')
+            rows.append({
+                'product_id': movement['product_id'],
+                'transaction_type': movement['transaction_type'],
+                'quantity': quantity,
+                'unit_price': unit_price,
+                'total_price': movement.get('total_price') or (unit_price * quantity if unit_price is not None else None),
+                'transaction_date': movement.get('transaction_date') or now,
+                'notes': movement.get('notes'),
+                'created_by': user_id,
+            })
+        if rows:
+            session.execute(insert(InventoryTransaction), rows)
+            # Core inserts bypass the ORM flush listeners that maintain the rollups
+            StockRollups.record(rows, session=session)
+
+    @staticmethod
+    def _update(session, product_id, delta):
+        """Atomically add `delta` to a product's stock; returns the new level"""
+        stock = func.coalesce(Product.quantity_in_stock, 0)
+        guarded = (Product.id == product_id) & (stock + delta >= 0)
+
+        if session.get_bind().dialect.update_returning:
+            new_quantity = session.execute(
+                update(Product).where(guarded)
+                .values(quantity_in_stock=stock + delta)
+                .returning(Product.quantity_in_stock)
+                .execution_options(synchronize_session='fetch')
+            ).scalar()
+        else:
+            # No UPDATE ... RETURNING (e.g. MySQL): lock the row, then update it
+            row = session.execute(
+                select(Product.quantity_in_stock).where(Product.id == product_id).with_for_update()
+            ).first()
+            new_quantity = None
+            if row is not None and (row[0] or 0) + delta >= 0:
+                session.execute(
+                    update(Product).where(guarded)
+                    .values(quantity_in_stock=stock + delta)
+                    .execution_options(synchronize_session='fetch')
+                )
+                new_quantity = (row[0] or 0) + delta
+
+        if new_quantity is None:
+            available = session.execute(
+                select(Product.quantity_in_stock).where(Product.id == product_id)
+            ).first()
+            if available is None:
+                raise LookupError(f"Product {product_id} not found")
+            raise InsufficientStock(product_id, available[0] or 0, -delta)
+        return new_quantity
+
+    @staticmethod
+    def delta_for(transaction_type, quantity):
+        """Signed stock delta for a transaction type ('adjustment' only records)"""
+        ttype = (transaction_type or '').strip().lower()
+        if ttype in ('purchase', 'in'):
+            return quantity
+        if ttype in ('sale', 'out'):
+            return -quantity
+        return 0
@@ -0,0 +1,179 @@
+import os
+import json
+import base64
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, func, or_
+
+from app import db
+from app.models.models import InventoryTransaction, Product, User
+from app.services.cache_service import MemoryCache
+from app.signals import stock_changed
+
+# Transaction types are stored with mixed spellings ('purchase'/'IN', 'sale'/'OUT')
+IN_TYPES = ('purchase', 'in')
+OUT_TYPES = ('sale', 'out')
+
+# Type filter values accepted by the ledger, with every spelling they cover
+TYPE_FILTERS = {
+    'purchase': ['purchase', 'IN'],
+    'sale': ['sale', 'OUT'],
+    'adjustment': ['adjustment'],
+}
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Other processes (e.g. the Discord bot) don't send our signals, so the TTL
+# bounds how stale the totals can get
+_totals_cache = MemoryCache(max_entries=1, default_ttl=int(os.getenv('TRANSACTION_TOTALS_TTL', 60)))
+
+
+class TransactionService:
+    @staticmethod
+    def summary_totals():
+        """
+        Ledger-wide stock in / stock out quantities and total value, computed
+        in one aggregate query and cached until the next stock change.
+        """
+        totals = _totals_cache.get('totals')
+        if totals is None:
+            totals = TransactionService._query_totals()
+            _totals_cache.set('totals', totals)
+        return totals
+
+    @staticmethod
+    def _query_totals():
+        ttype = func.lower(func.trim(InventoryTransaction.transaction_type))
+        count, stock_in, stock_out, total_value = db.session.query(
+            func.count(InventoryTransaction.id),
+            func.coalesce(func.sum(case((ttype.in_(IN_TYPES), InventoryTransaction.quantity), else_=0)), 0),
+            func.coalesce(func.sum(case((ttype.in_(OUT_TYPES), InventoryTransaction.quantity), else_=0)), 0),
+            func.coalesce(func.sum(InventoryTransaction.total_price), 0.0),
+        ).one()
+        return {
+            'transaction_count': int(count),
+            'stock_in_count': int(stock_in),
+            'stock_out_count': int(stock_out),
+            'total_value': float(total_value),
+        }
+
+    @staticmethod
+    def parse_filters(args):
+        """Validate ledger filters from query-string args; raises ValueError on bad input"""
+        filters = {}
+        transaction_type = (args.get('type') or '').strip().lower()
+        if transaction_type:
+            if transaction_type not in TYPE_FILTERS:
+                raise ValueError(f"Unknown transaction type: {transaction_type}")
+            filters['type'] = transaction_type
+        for name in ('product_id', 'user_id'):
+            if args.get(name):
+                filters[name] = int(args[name])
+        for name in ('date_from', 'date_to'):
+            if args.get(name):
+                filters[name] = datetime.strptime(args[name], '%Y-%m-%d')
+        return filters
+
+    @staticmethod
+    def apply_filters(query, filters):
+        """Restrict a query or select() over InventoryTransaction to parse_filters() output"""
+        t = InventoryTransaction
+        if 'type' in filters:
+            query = query.where(t.transaction_type.in_(TYPE_FILTERS[filters['type']]))
+        if 'product_id' in filters:
+            query = query.where(t.product_id == filters['product_id'])
+        if 'user_id' in filters:
+            query = query.where(t.created_by == filters['user_id'])
+        if 'date_from' in filters:
+            query = query.where(t.transaction_date >= filters['date_from'])
+        if 'date_to' in filters:
+            # date_to is inclusive of the whole day
+            query = query.where(t.transaction_date < filters['date_to'] + timedelta(days=1))
+        return query
+
+    @staticmethod
+    def page(filters, cursor=None, limit=PAGE_SIZE):
+        """
+        One page of the ledger, newest first, using keyset pagination on
+        (transaction_date, id): each page costs the same however deep it is.
+        Rows without a transaction_date (raw or imported inserts) come last,
+        newest id first, whatever order the database gives NULLs.
+        Returns {'data': [...], 'next_cursor': str or None, 'has_more': bool}.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        t = InventoryTransaction
+
+        query = (
+            db.session.query(
+                t.id, t.transaction_date, t.transaction_type, t.quantity,
+                t.unit_price, t.total_price, t.notes, t.product_id,
+                Product.name.label('product_name'),
+                User.username.label('created_by'),
+            )
+            .join(Product, Product.id == t.product_id)
+            .outerjoin(User, User.id == t.created_by)
+        )
+
+        query = TransactionService.apply_filters(query, filters)
+
+        last_date, last_id = TransactionService._decode_cursor(cursor) if cursor else (None, None)
+
+        rows = []
+        if last_id is None or last_date is not None:
+            dated = query.filter(t.transaction_date.isnot(None))
+            if last_id is not None:
+                dated = dated.filter(or_(
+                    t.transaction_date < last_date,
+                    and_(t.transaction_date == last_date, t.id < last_id),
+                ))
+            rows = dated.order_by(t.transaction_date.desc(), t.id.desc()).limit(limit + 1).all()
+        if len(rows) <= limit:
+            undated = query.filter(t.transaction_date.is_(None))
+            if last_id is not None and last_date is None:
+                undated = undated.filter(t.id < last_id)
+            rows += undated.order_by(t.id.desc()).limit(limit + 1 - len(rows)).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        return {
+            'data': [
+                {
+                    'id': r.id,
+                    'transaction_date': r.transaction_date.isoformat() if r.transaction_date else None,
+                    'transaction_type': r.transaction_type,
+                    'quantity': r.quantity,
+                    'unit_price': r.unit_price,
+                    'total_price': r.total_price,
+                    'notes': r.notes,
+                    'product_id': r.product_id,
+                    'product_name': r.product_name,
+                    'created_by': r.created_by,
+                }
+                for r in rows
+            ],
+            'next_cursor': TransactionService._encode_cursor(rows[-1]) if has_more else None,
+            'has_more': has_more,
+        }
+
+    @staticmethod
+    def _encode_cursor(row):
+        last_date = row.transaction_date.isoformat() if row.transaction_date else None
+        payload = json.dumps([last_date, row.id])
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            last_date, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return (datetime.fromisoformat(last_date) if last_date is not None else None), int(last_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError("Invalid cursor") from e
+
+    @staticmethod
+    def invalidate_totals(sender=None, **extra):
+        _totals_cache.clear()
+
+
+stock_changed.connect(TransactionService.invalidate_totals, weak=False)
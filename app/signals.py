@@ -0,0 +1,7 @@
+from blinker import Namespace
+
+_signals = Namespace()
+
+# Sent after a commit that changed product stock levels.
+# Receivers are called with the app as sender and `product_ids=[...]`.
+stock_changed = _signals.signal('stock-changed')
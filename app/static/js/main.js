@@ -106,6 +106,32 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+// Fill in AI content that the server generates after the page has rendered
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-ai-url]').forEach(element => loadAIContent(element));
+});
+
+function loadAIContent(element, attempt = 0) {
+    fetch(element.dataset.aiUrl, {
+        headers: { 'X-Requested-With': 'XMLHttpRequest' }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.status === 'done') {
+            element.innerHTML = data.html;
+        } else if (attempt < 30) {
+            // Still being generated: poll again, backing off to every 3 seconds
+            setTimeout(() => loadAIContent(element, attempt + 1), 1000 * Math.min(attempt + 1, 3));
+        } else {
+            element.textContent = 'The AI analysis is taking longer than expected. Refresh the page to try again.';
+        }
+    })
+    .catch(error => {
+        console.error('Error loading AI content:', error);
+        element.textContent = 'Unable to load the AI analysis right now.';
+    });
+}
+
 // Function to mark notification as read
 function markNotificationAsRead(notificationId) {
     fetch('/notifications/mark_read/' + notificationId, {
@@ -889,9 +915,60 @@ document.addEventListener('DOMContentLoaded', () => {
     options:{ responsive:true, plugins:{ legend:{position:'bottom'} } }
   });
 });
+// Poll a background job's status URL until it finishes. Resolves with the
+// job on success and rejects with its error otherwise.
+function pollJob(statusUrl, onProgress, interval = 2000) {
+  return new Promise((resolve, reject) => {
+    const check = () => {
+      fetch(statusUrl, { headers: { 'Accept': 'application/json' } })
+        .then(res => {
+          if (!res.ok) throw new Error(`Server returned ${res.status}`);
+          return res.json();
+        })
+        .then(job => {
+          if (job.status === 'succeeded') return resolve(job);
+          if (job.status === 'failed') return reject(new Error(job.error || 'Job failed'));
+          if (onProgress) onProgress(job);
+          setTimeout(check, interval);
+        })
+        .catch(reject);
+    };
+    check();
+  });
+}
+
+// POST to an endpoint that queues a job, then wait for the job to finish
+function runJob(url, onProgress) {
+  return fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' }
+  })
+  .then(res => {
+    if (!res.ok) throw new Error(`Server returned ${res.status}`);
+    return res.json();
+  })
+  .then(data => {
+    if (!data.success) throw new Error(data.error || 'Could not start job');
+    return pollJob(data.status_url, onProgress);
+  });
+}
+
 document.addEventListener('DOMContentLoaded', () => {
   // … existing chart code …
 
+  // First visit: an analysis was queued by the server, reload once it is done
+  if (window.analysisJobUrl) {
+    const pendingText = document.getElementById('analysisPendingText');
+    pollJob(window.analysisJobUrl, job => {
+      if (pendingText && job.message) pendingText.textContent = `${job.message} (${job.progress}%)`;
+    })
+    .then(() => window.location.reload())
+    .catch(err => {
+      console.error(err);
+      if (pendingText) pendingText.textContent = 'Analysis failed. Use Analyse to try again.';
+    });
+  }
+
   // Analyse button handler
   const analyseBtn = document.getElementById('analyseBtn');
   if (analyseBtn && window.analysisRunUrl) {
@@ -899,21 +976,12 @@ document.addEventListener('DOMContentLoaded', () => {
       analyseBtn.disabled = true;
       analyseBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-1"></i> Running';
 
-      fetch(window.analysisRunUrl, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' }
+      runJob(window.analysisRunUrl, job => {
+        analyseBtn.innerHTML = `<i class="fas fa-spinner fa-spin me-1"></i> Running ${job.progress}%`;
       })
-      .then(res => {
-        if (!res.ok) throw new Error(`Server returned ${res.status}`);
-        return res.json();
-      })
-      .then(data => {
-        if (data.success) {
-          // refresh to load new ML results
-          window.location.reload();
-        } else {
-          throw new Error('Analysis endpoint failed');
-        }
+      .then(() => {
+        // refresh to load new ML results
+        window.location.reload();
       })
       .catch(err => {
         console.error(err);
@@ -931,14 +999,9 @@ document.addEventListener('DOMContentLoaded', () => {
       emailBtn.disabled = true;
       emailBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-1"></i> Sending';
 
-      fetch(window.analysisEmailUrl, { method: 'POST' })
-        .then(res => res.json())
-        .then(data => {
-          if (data.success) {
-            alert('Report emailed to all users!');
-          } else {
-            throw new Error(data.error || 'Unknown error');
-          }
+      runJob(window.analysisEmailUrl)
+        .then(() => {
+          alert('Report emailed to all users!');
         })
         .catch(err => {
           console.error(err);
@@ -0,0 +1,200 @@
+"""
+Benchmark the hot dashboard / notification / analytics queries with and
+without the indexes from migration 3f9c2a7d41b6.
+
+Seeds a scratch database (never the app's DATABASE_URL unless you pass it),
+prints each query's plan and median time, adds the indexes and repeats:
+
+    python -m app.utils.index_benchmark --rows 1000000 --database-url sqlite:///index_benchmark.db
+"""
+import time
+import random
+import argparse
+import importlib.util
+import statistics
+from pathlib import Path
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from app import db
+from app.models.models import (
+    User, Supplier, Category, Product, InventoryTransaction,
+    Notification, PurchaseOrder, PurchaseOrderItem, MLResult
+)
+
+TABLES = [
+    User.__table__, Supplier.__table__, Category.__table__, Product.__table__,
+    InventoryTransaction.__table__, Notification.__table__, PurchaseOrder.__table__,
+    PurchaseOrderItem.__table__, MLResult.__table__,
+]
+
+NOW = datetime(2026, 1, 1)
+
+# (label, SQL, params) – the shapes used by the dashboard, product pages,
+# NotificationService and AnalysisService
+QUERIES = [
+    ("Dashboard: transactions in period",
+     "SELECT COUNT(*) FROM inventory_transaction WHERE transaction_date >= :start AND transaction_date < :end",
+     {"start": NOW - timedelta(days=30), "end": NOW}),
+    ("Dashboard: recent transactions",
+     "SELECT * FROM inventory_transaction WHERE transaction_date >= :start AND transaction_date < :end "
+     "ORDER BY transaction_date DESC LIMIT 5",
+     {"start": NOW - timedelta(days=30), "end": NOW}),
+    ("Dashboard: daily sales chart",
+     "SELECT DATE(transaction_date) AS day, SUM(quantity) FROM inventory_transaction "
+     "WHERE transaction_type = :type AND transaction_date >= :start AND transaction_date < :end "
+     "GROUP BY DATE(transaction_date)",
+     {"type": "sale", "start": NOW - timedelta(days=7), "end": NOW}),
+    ("Product page: transaction history",
+     "SELECT * FROM inventory_transaction WHERE product_id = :product_id ORDER BY transaction_date DESC",
+     {"product_id": 42}),
+    ("Notifications: unread duplicate check",
+     "SELECT 1 FROM notification WHERE product_id = :product_id AND notification_type = :type AND is_read = :is_read",
+     {"product_id": 42, "type": "low_stock", "is_read": False}),
+    ("Notifications: unread count",
+     "SELECT COUNT(*) FROM notification WHERE is_read = :is_read",
+     {"is_read": False}),
+    ("Purchase orders: active count",
+     "SELECT COUNT(*) FROM purchase_order WHERE status IN ('pending', 'approved')",
+     {}),
+    ("Purchase orders: newest first",
+     "SELECT * FROM purchase_order ORDER BY order_date DESC LIMIT 20",
+     {}),
+    ("Products: by category",
+     "SELECT * FROM product WHERE category_id = :category_id",
+     {"category_id": 3}),
+    ("Analytics: latest ML run",
+     "SELECT * FROM ml_results WHERE run_date = (SELECT MAX(run_date) FROM ml_results)",
+     {}),
+]
+
+
+def load_index_migration():
+    """The INDEXES list from the migration, so the benchmark measures exactly what ships"""
+    path = next((Path(__file__).resolve().parents[2] / "migrations" / "versions").glob("3f9c2a7d41b6_*.py"))
+    spec = importlib.util.spec_from_file_location("index_migration", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.INDEXES
+
+
+def reset_schema(engine, indexes):
+    """Recreate the tables, then drop the benchmarked indexes to get the 'before' state"""
+    db.metadata.drop_all(engine, tables=TABLES)
+    db.metadata.create_all(engine, tables=TABLES)
+    with engine.begin() as conn:
+        for name, table, _ in indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def seed(engine, rows, products=1000, chunk=50_000):
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{"id": 1, "username": "bench", "email": "bench@example.com",
+                                                 "password_hash": "x", "is_admin": True}])
+        conn.execute(Supplier.__table__.insert(), [{"id": i, "name": f"Supplier {i}"} for i in range(1, 21)])
+        conn.execute(Category.__table__.insert(), [{"id": i, "name": f"Category {i}"} for i in range(1, 11)])
+        conn.execute(Product.__table__.insert(), [
+            {"id": i, "name": f"Product {i}", "sku": f"SKU-{i:06d}", "unit_price": rng.uniform(1, 500),
+             "quantity_in_stock": rng.randint(0, 500), "reorder_level": 10, "reorder_quantity": 50,
+             "category_id": rng.randint(1, 10), "supplier_id": rng.randint(1, 20)}
+            for i in range(1, products + 1)
+        ])
+
+        for start in range(0, rows, chunk):
+            batch = []
+            for _ in range(min(chunk, rows - start)):
+                quantity = rng.randint(1, 20)
+                price = rng.uniform(1, 500)
+                batch.append({
+                    "product_id": rng.randint(1, products),
+                    "transaction_type": rng.choice(("purchase", "sale", "sale", "adjustment")),
+                    "quantity": quantity, "unit_price": price, "total_price": quantity * price,
+                    "transaction_date": NOW - timedelta(seconds=rng.randint(0, 365 * 86400)),
+                    "created_by": 1,
+                })
+            conn.execute(InventoryTransaction.__table__.insert(), batch)
+            print(f"  seeded {start + len(batch):,} / {rows:,} transactions")
+
+        conn.execute(Notification.__table__.insert(), [
+            {"product_id": rng.randint(1, products), "notification_type": rng.choice(("low_stock", "irregular_activity")),
+             "message": "benchmark", "is_read": rng.random() < 0.9,
+             "created_at": NOW - timedelta(minutes=rng.randint(0, 525_600))}
+            for _ in range(max(rows // 50, 1))
+        ])
+        conn.execute(PurchaseOrder.__table__.insert(), [
+            {"supplier_id": rng.randint(1, 20), "status": rng.choice(("pending", "approved", "received", "received", "canceled")),
+             "order_date": NOW - timedelta(minutes=rng.randint(0, 525_600)), "total_amount": 0, "created_by": 1}
+            for _ in range(max(rows // 50, 1))
+        ])
+        for run in range(10):
+            run_date = NOW - timedelta(days=run)
+            conn.execute(MLResult.__table__.insert(), [
+                {"run_id": f"run-{run}", "run_date": run_date, "product_id": i, "product_name": f"Product {i}",
+                 "popularity_index": rng.randint(1, 3), "predicted_days_until_reorder": rng.uniform(0, 90)}
+                for i in range(1, products + 1)
+            ])
+
+
+def explain(conn, sql, params):
+    dialect = conn.engine.dialect.name
+    prefix = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN ANALYZE "}.get(dialect, "EXPLAIN ")
+    rows = conn.execute(text(prefix + sql), params).fetchall()
+    if dialect == "sqlite":
+        return [row[-1] for row in rows]
+    return [" | ".join(str(col) for col in row) for row in rows]
+
+
+def run_queries(engine, repeat):
+    timings = {}
+    with engine.connect() as conn:
+        for label, sql, params in QUERIES:
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[label] = statistics.median(samples)
+            print(f"\n{label}: {timings[label]:.2f} ms")
+            for line in explain(conn, sql, params):
+                print(f"    {line}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///index_benchmark.db",
+                        help="Scratch database to seed (its benchmark tables are dropped and recreated)")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Inventory transactions to seed")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query; the median is reported")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    indexes = load_index_migration()
+
+    print(f"Seeding {args.database_url} ...")
+    reset_schema(engine, indexes)
+    seed(engine, args.rows)
+
+    print("\n=== Without indexes ===")
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    before = run_queries(engine, args.repeat)
+
+    with engine.begin() as conn:
+        for name, table, columns in indexes:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        conn.execute(text("ANALYZE"))
+
+    print("\n=== With indexes ===")
+    after = run_queries(engine, args.repeat)
+
+    print(f"\n{'Query':<40} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for label, _, _ in QUERIES:
+        speedup = before[label] / after[label] if after[label] else float("inf")
+        print(f"{label:<40} {before[label]:>10.2f} {after[label]:>10.2f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Micro-benchmark the chatbot's intent detection: the old sequence of checks
+(lowercasing per check, four regexes compiled on the fly, two substring
+scans) against IntentMatcher's single scan.
+
+Runs over a built-in corpus of chat messages, or your own (one message per
+line, e.g. exported from the chat logs), and prints time per message and
+every message the two classify differently:
+
+    python -m app.utils.intent_benchmark
+    python -m app.utils.intent_benchmark --corpus chat_messages.txt --repeat 200
+"""
+import re
+import time
+import argparse
+import statistics
+
+from app.services.intent_matcher import (
+    intent_matcher, CONFIRMATION_WORDS, LOW_STOCK_PHRASES, STOCK_LISTING_PHRASES, SHOW_MORE_PATTERN,
+)
+
+CORPUS = [
+    "add 20 units to product SKU-1234", "update product SKU-5678 add 10 units", "remove 15 units from SKU-1234",
+    "Add 5 units to sku 0042", "increase 12 pieces for EL-LAP-001", "decrease 3 items from product KT-BLE-000311",
+    "update sku-9 reduce 5 units", "subtract 2 units from sku-abc", "add to SKU-77 with 30 items",
+    "yes", "Yes please", "ok", "go ahead", "sure", "do it", "yep", "confirm",
+    "list all stock", "Show inventory", "what products do we have?", "show me all", "available stock",
+    "list all products", "what items do we have",
+    "which products have low stock", "low stock", "what needs to be reordered? anything running low?",
+    "show products with low stock", "list all products with low stock", "any stock alert today",
+    "show more", "next", "more products", "continue",
+    "how many wireless keyboards do we have?", "what's the price of the ergonomic chair?",
+    "who supplies our desk lamps", "what were the best selling products last month",
+    "can you summarise this week's inventory movements", "is the blue t-shirt in stock in size M",
+    "hello", "thanks!", "what can you do?", "when is the next delivery from Acme Supplies expected",
+    "give me the stock value by category", "which supplier has the most products",
+    "how do I create a purchase order", "why did the stock of SKU-1234 drop yesterday",
+]
+
+
+class LegacyIntents:
+    """The checks ChatbotService.process_message used to run, in order"""
+
+    add_pattern = r"(?:add|update|increase)\s+(\d+)\s+(?:units?|items?|stock|pieces?)\s+(?:to|for)\s+(?:product\s+)?(?:sku[\s-]*)?([a-zA-Z0-9-]+)"
+    alt_pattern = r"(?:update|add\s+to)\s+(?:product\s+)?(?:sku[\s-]*)?([a-zA-Z0-9-]+)\s+(?:add|with)\s+(\d+)\s+(?:units?|items?|stock|pieces?)"
+    decrease_pattern = r"(?:decrease|reduce|remove|subtract)\s+(\d+)\s+(?:units?|items?|stock|pieces?)\s+(?:from)\s+(?:product\s+)?(?:sku[\s-]*)?([a-zA-Z0-9-]+)"
+    alt_decrease_pattern = r"(?:update|decrease|reduce|remove\s+from)\s+(?:product\s+)?(?:sku[\s-]*)?([a-zA-Z0-9-]+)\s+(?:decrease|reduce|remove|subtract)\s+(\d+)\s+(?:units?|items?|stock|pieces?)"
+
+    def match(self, message):
+        if SHOW_MORE_PATTERN.match(message.lower().strip()):
+            return ("show_more", None)
+        if self.is_confirmation(message):
+            return ("confirmation", None)
+        update = self.stock_update(message)
+        if update:
+            return ("stock_update", update)
+        if self.is_low_stock(message):
+            return ("low_stock", None)
+        if self.is_stock_listing(message):
+            return ("stock_listing", None)
+        return ("general", None)
+
+    def stock_update(self, message):
+        for pattern, sku_first, operation in [(self.add_pattern, False, "add"), (self.alt_pattern, True, "add"),
+                                               (self.decrease_pattern, False, "remove"),
+                                               (self.alt_decrease_pattern, True, "remove")]:
+            match = re.search(pattern, message.lower())
+            if match:
+                sku, quantity = (match.group(1), match.group(2)) if sku_first else (match.group(2), match.group(1))
+                return {"sku": sku, "quantity": int(quantity), "operation": operation}
+        return None
+
+    def is_confirmation(self, message):
+        message_lower = message.lower().strip()
+        if message_lower in CONFIRMATION_WORDS:
+            return True
+        return any(word in message_lower for word in CONFIRMATION_WORDS)
+
+    def is_stock_listing(self, message):
+        message_lower = message.lower().strip()
+        if self.is_low_stock(message_lower):
+            return False
+        return any(pattern in message_lower for pattern in STOCK_LISTING_PHRASES)
+
+    def is_low_stock(self, message):
+        message_lower = message.lower().strip()
+        return any(pattern in message_lower for pattern in LOW_STOCK_PHRASES)
+
+
+def time_per_message(classify, corpus, repeat):
+    """Median over `repeat` runs of the corpus, in microseconds per message"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for message in corpus:
+            classify(message)
+        samples.append((time.perf_counter() - started) / len(corpus) * 1_000_000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="File with one chat message per line (default: built-in corpus)")
+    parser.add_argument("--repeat", type=int, default=100, help="Runs over the corpus; the median is reported")
+    args = parser.parse_args()
+
+    corpus = CORPUS
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+
+    legacy = LegacyIntents()
+    results = [
+        ("Old checks", time_per_message(legacy.match, corpus, args.repeat)),
+        ("IntentMatcher", time_per_message(intent_matcher.match, corpus, args.repeat)),
+    ]
+
+    print(f"\n{len(corpus)} messages, median of {args.repeat} runs\n")
+    print(f"{'Classifier':<20} {'us/message':>12}")
+    for label, us in results:
+        print(f"{label:<20} {us:>12.2f}")
+    print(f"\nSpeed-up: {results[0][1] / results[1][1]:.1f}x")
+
+    changed = [(m, legacy.match(m), tuple(intent_matcher.match(m))) for m in corpus]
+    changed = [row for row in changed if row[1] != row[2]]
+    print(f"\nClassified differently: {len(changed)} of {len(corpus)}")
+    for message, old, new in changed:
+        print(f"    {message!r}: {old[0]} -> {new[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark product search and SKU lookups: the old leading-wildcard ILIKE
+queries against ProductSearch's statements.
+
+Seeds a scratch database (never the app's DATABASE_URL unless you pass it)
+with products, then prints each query's plan, median time and how many
+products it matched:
+
+    python -m app.utils.search_benchmark --products 100000 --database-url sqlite:///search_benchmark.db
+
+On PostgreSQL the pg_trgm extension must be available to the user.
+"""
+import time
+import random
+import argparse
+import statistics
+
+from sqlalchemy import create_engine, or_, select, text
+
+from app import db
+from app.models.models import Category, Supplier, Product
+from app.services.search_service import ProductSearch
+
+TABLES = [Supplier.__table__, Category.__table__, Product.__table__]
+
+ADJECTIVES = ["wireless", "compact", "heavy-duty", "ergonomic", "portable", "premium", "stainless", "smart",
+              "industrial", "eco", "foldable", "rechargeable", "waterproof", "digital", "classic", "mini"]
+NOUNS = ["keyboard", "monitor", "drill", "kettle", "lamp", "chair", "backpack", "speaker", "router", "cable",
+         "bottle", "scanner", "printer", "headset", "charger", "toolbox", "blender", "camera", "desk", "fan"]
+PREFIXES = ["EL", "HW", "KT", "OF", "SP", "TL"]
+
+
+def reset_schema(engine):
+    db.metadata.drop_all(engine, tables=TABLES)
+    db.metadata.create_all(engine, tables=TABLES)
+
+
+def seed(engine, products, chunk=20_000):
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(Supplier.__table__.insert(), [{"id": i, "name": f"Supplier {i}"} for i in range(1, 21)])
+        conn.execute(Category.__table__.insert(), [{"id": i, "name": f"Category {i}"} for i in range(1, 11)])
+        for start in range(1, products + 1, chunk):
+            batch = []
+            for i in range(start, min(start + chunk, products + 1)):
+                adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+                batch.append({
+                    "id": i, "name": f"{adjective.title()} {noun.title()} {i}",
+                    "sku": f"{rng.choice(PREFIXES)}-{noun[:3].upper()}-{i:06d}",
+                    "description": f"{adjective} {noun} for home and office use, model {rng.randint(100, 999)}",
+                    "unit_price": rng.uniform(1, 500), "quantity_in_stock": rng.randint(0, 500),
+                    "reorder_level": 10, "reorder_quantity": 50,
+                    "category_id": rng.randint(1, 10), "supplier_id": rng.randint(1, 20),
+                })
+            conn.execute(Product.__table__.insert(), batch)
+            print(f"  seeded {start + len(batch) - 1:,} / {products:,} products")
+        conn.execute(text("ANALYZE"))
+
+
+def legacy_sku_lookup(sku):
+    return select(Product).where(Product.sku.ilike(f"%{sku}%")).limit(1)
+
+
+def legacy_search(query, limit=10):
+    return select(Product).where(or_(
+        Product.name.ilike(f"%{query}%"),
+        Product.sku.ilike(f"%{query}%"),
+        Product.description.ilike(f"%{query}%"),
+    )).limit(limit)
+
+
+def queries(conn, products):
+    """Lookups for real rows: a SKU as typed in chat (lower case, no prefix) and a product name"""
+    dialect = conn.engine.dialect.name
+    sku = conn.execute(select(Product.sku).where(Product.id == products // 2)).scalar_one().lower()
+    name = conn.execute(select(Product.name).where(Product.id == products // 3)).scalar_one()
+    return [
+        ("Old SKU lookup (ILIKE '%sku%')", legacy_sku_lookup(sku)),
+        ("SKU lookup (lower(sku) index)", ProductSearch.sku_statement(sku)),
+        ("Old search: 'ergonomic'", legacy_search("ergonomic")),
+        ("Search: 'ergonomic'", ProductSearch.search_statement("ergonomic", dialect)),
+        ("Old search: 'keybaord' (typo)", legacy_search("keybaord")),
+        ("Search: 'keybaord' (typo)", ProductSearch.search_statement("keybaord", dialect)),
+        ("Old search: product name", legacy_search(name)),
+        ("Search: product name", ProductSearch.search_statement(name, dialect)),
+    ]
+
+
+def explain(conn, sql):
+    dialect = conn.engine.dialect.name
+    prefix = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN ANALYZE "}.get(dialect, "EXPLAIN ")
+    rows = conn.execute(text(prefix + sql)).fetchall()
+    if dialect == "sqlite":
+        return [row[-1] for row in rows]
+    return [" | ".join(str(col) for col in row) for row in rows]
+
+
+def run_queries(engine, products, repeat):
+    results = []
+    with engine.connect() as conn:
+        for label, stmt in queries(conn, products):
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = conn.execute(stmt).fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+            results.append((label, statistics.median(samples), len(rows)))
+            print(f"\n{label}: {results[-1][1]:.2f} ms, {len(rows)} rows")
+            sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+            for line in explain(conn, sql):
+                print(f"    {line}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///search_benchmark.db",
+                        help="Scratch database to seed (its benchmark tables are dropped and recreated)")
+    parser.add_argument("--products", type=int, default=100_000, help="Products to seed")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query; the median is reported")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    print(f"Seeding {args.database_url} ...")
+    reset_schema(engine)
+    seed(engine, args.products)
+
+    results = run_queries(engine, args.products, args.repeat)
+
+    print(f"\n{'Query':<40} {'ms':>10} {'rows':>6}")
+    for label, ms, rows in results:
+        print(f"{label:<40} {ms:>10.2f} {rows:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from sqlalchemy import and_, select, update
+
+from app import db
+
+
+def upsert(table, rows, key_columns, add_columns=(), set_columns=(), bind=None):
+    """
+    Insert `rows` (a list of dicts) into `table`, resolving conflicts on
+    `key_columns`: `add_columns` are incremented by the new values and
+    `set_columns` are overwritten. Runs as one INSERT ... ON CONFLICT
+    statement on PostgreSQL and SQLite, row by row elsewhere. Runs on the
+    session unless another `bind` (e.g. a Connection) is given.
+    """
+    if not rows:
+        return
+
+    executor = bind if bind is not None else db.session
+    dialect = (bind.dialect if bind is not None else db.engine.dialect).name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+        stmt = dialect_insert(table)
+        updates = {name: table.c[name] + stmt.excluded[name] for name in add_columns}
+        updates.update({name: stmt.excluded[name] for name in set_columns})
+        if updates:
+            stmt = stmt.on_conflict_do_update(index_elements=list(key_columns), set_=updates)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(key_columns))
+        executor.execute(stmt, rows)
+        return
+
+    for row in rows:
+        match = and_(*(table.c[name] == row[name] for name in key_columns))
+        exists = executor.execute(select(table.c[key_columns[0]]).where(match)).first()
+        if exists is None:
+            executor.execute(table.insert().values(**row))
+            continue
+        values = {name: table.c[name] + row[name] for name in add_columns}
+        values.update({name: row[name] for name in set_columns})
+        if values:
+            executor.execute(update(table).where(match).values(**values))
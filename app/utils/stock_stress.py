@@ -0,0 +1,177 @@
+"""
+Concurrency stress test for StockLedger: many threads sell and restock the
+same few products at once, then the final stock levels are checked against
+the committed transactions. Any lost update or oversell is reported.
+
+Uses a scratch database (its product/transaction tables are dropped and
+recreated), so never point it at real data:
+
+    python -m app.utils.stock_stress --database-url postgresql://localhost/stress --threads 16 --ops 200
+
+--naive runs the old read-modify-write code path instead, to show the
+lost updates the ledger prevents.
+"""
+import sys
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+
+from flask import Flask
+from sqlalchemy import case, func
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models.models import User, Product, InventoryTransaction, StockMovementRollup
+from app.services.stock_ledger import StockLedger, InsufficientStock
+
+TABLES = [User.__table__, Product.__table__, InventoryTransaction.__table__, StockMovementRollup.__table__]
+
+
+def make_app(database_url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    if database_url.startswith('sqlite'):
+        # SQLite has a single writer; wait for it rather than failing
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+    else:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 32, 'max_overflow': 8}
+    db.init_app(app)
+    return app
+
+
+def reset(products, initial_stock):
+    db.metadata.drop_all(db.engine, tables=TABLES)
+    db.metadata.create_all(db.engine, tables=TABLES)
+    db.session.add(User(id=1, username='stress', email='stress@example.com', password_hash='x'))
+    db.session.add_all([
+        Product(id=i, name=f'Stress {i}', sku=f'STRESS-{i}', unit_price=1.0, quantity_in_stock=initial_stock)
+        for i in range(1, products + 1)
+    ])
+    db.session.commit()
+
+
+def ledger_move(product_id, delta):
+    StockLedger.apply(product_id, delta, 'purchase' if delta > 0 else 'sale', unit_price=1.0, user_id=1)
+
+
+def naive_move(product_id, delta):
+    # What the controllers used to do: read, change in Python, write back
+    product = db.session.get(Product, product_id)
+    if product.quantity_in_stock + delta < 0:
+        raise InsufficientStock(product_id, product.quantity_in_stock, -delta)
+    time.sleep(0.001)  # widen the window between read and write, as a slow request would
+    product.quantity_in_stock += delta
+    db.session.add(InventoryTransaction(
+        product_id=product_id, transaction_type='purchase' if delta > 0 else 'sale',
+        quantity=abs(delta), unit_price=1.0, total_price=float(abs(delta)), created_by=1,
+    ))
+
+
+class Outcomes(Counter):
+    """Counter shared by the worker threads"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            self[name] += 1
+
+
+def worker(app, move, products, ops, seed, outcomes):
+    rng = random.Random(seed)
+    with app.app_context():
+        for _ in range(ops):
+            product_id = rng.randint(1, products)
+            # Mostly sales, so stock runs out and the non-negative guard is exercised
+            delta = rng.choice((-1, -1, -1, -2, -5, 3))
+            for attempt in range(5):
+                try:
+                    move(product_id, delta)
+                    db.session.commit()
+                    outcomes.add('committed')
+                    break
+                except InsufficientStock:
+                    db.session.rollback()
+                    outcomes.add('insufficient')
+                    break
+                except OperationalError:
+                    # Lock timeout / deadlock / serialization failure: retry
+                    db.session.rollback()
+                    outcomes.add('retried')
+            else:
+                outcomes.add('gave_up')
+        db.session.remove()
+
+
+def check(products, initial_stock):
+    """Compare every product's stock with initial stock + its committed transactions"""
+    moved = dict(
+        db.session.query(
+            InventoryTransaction.product_id,
+            func.sum(case(
+                (InventoryTransaction.transaction_type == 'purchase', InventoryTransaction.quantity),
+                else_=-InventoryTransaction.quantity,
+            )),
+        ).group_by(InventoryTransaction.product_id).all()
+    )
+    problems = []
+    for product in db.session.query(Product).order_by(Product.id):
+        expected = initial_stock + (moved.get(product.id) or 0)
+        if product.quantity_in_stock != expected:
+            problems.append(f"product {product.id}: stock {product.quantity_in_stock}, "
+                            f"transactions say {expected} ({expected - product.quantity_in_stock:+d} lost)")
+        if product.quantity_in_stock < 0:
+            problems.append(f"product {product.id}: oversold to {product.quantity_in_stock}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///stock_stress.db",
+                        help="Scratch database (its product and transaction tables are recreated)")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200, help="Stock movements per thread")
+    parser.add_argument("--products", type=int, default=3, help="Few products means more contention")
+    parser.add_argument("--initial-stock", type=int, default=300)
+    parser.add_argument("--naive", action="store_true", help="Use read-modify-write instead of StockLedger")
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    move = naive_move if args.naive else ledger_move
+    outcomes = Outcomes()
+
+    with app.app_context():
+        reset(args.products, args.initial_stock)
+
+    threads = [
+        threading.Thread(target=worker, args=(app, move, args.products, args.ops, seed, outcomes))
+        for seed in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        problems = check(args.products, args.initial_stock)
+
+    total = args.threads * args.ops
+    print(f"{'naive' if args.naive else 'StockLedger'}: {total:,} movements on {args.products} products "
+          f"from {args.threads} threads in {elapsed:.2f}s ({total / elapsed:,.0f}/s)")
+    print("  " + ", ".join(f"{name}={count:,}" for name, count in sorted(outcomes.items())))
+    if problems:
+        print("FAILED:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("OK: no lost updates, no negative stock")
+
+
+if __name__ == "__main__":
+    main()
@@ -42,18 +42,27 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_dir)
 
+# Import local modules (relative to discord-bot folder)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from worker_pool import WorkerPool
+from intent_engine import IntentEngine, ACTION_INTENTS
+
 # Import app services and custom services
 try:
     from app.services.chatbot_service import ChatbotService
-    
-    # Import local modules (relative to discord-bot folder)
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    if current_dir not in sys.path:
-        sys.path.append(current_dir)
-    
     from gemini_service import GeminiService
     from inventory_service import InventoryService
     
+    # The web app runs the background workers; the bot only needs the app
+    # for its database session and signal handlers
+    os.environ.setdefault("JOB_WORKER_THREADS", "0")
+    os.environ.setdefault("NOTIFICATION_SCAN_INTERVAL", "0")
+    from app import create_app
+    flask_app = create_app()
+    
     chatbot_service = ChatbotService()
     gemini_service = GeminiService()
     inventory_service = InventoryService()
@@ -64,6 +73,32 @@ except ImportError as e:
     chatbot_service = None
     gemini_service = None
     inventory_service = None
+    flask_app = None
+
+# Blocking service calls (database, Gemini) run here, never on the event loop
+workers = WorkerPool(flask_app)
+
+TIMEOUT_MESSAGE = "Sorry, the inventory system is taking too long to respond. Please try again in a moment."
+
+
+async def run_blocking(source, func, *args, **kwargs):
+    """Run a blocking service call for a message or command context in the worker pool"""
+    return await workers.run(func, *args, user=source.author.id, channel=source.channel.id, **kwargs)
+
+
+def conversation(source):
+    """Conversation key of a message or command context: the user and channel, as the chatbot expects them"""
+    return str(source.author.id), f"discord:{source.channel.id}"
+
+
+async def inventory_context(source):
+    """Inventory summary for Gemini prompts, fetched only when a prompt needs it"""
+    if not inventory_service:
+        return None
+    return await run_blocking(source, inventory_service.get_inventory_summary)
+
+
+intent_engine = IntentEngine(chatbot_service, gemini_service)
 
 
 @bot.event
@@ -108,179 +143,135 @@ async def on_message(message):
         if not content:
             return
         
-        # Let the user know we're processing their message
-        async with message.channel.typing():
-            # Get inventory context for Gemini
-            inventory_context = None
-            if inventory_service:
-                inventory_context = inventory_service.get_inventory_summary()
-            
-            # Use Gemini to detect intent if available
-            intent_data = None
-            if gemini_service:
-                intent_data = gemini_service.extract_inventory_intent(content)
+        try:
+            # Let the user know we're processing their message
+            async with message.channel.typing():
+                # Local rules first; Gemini only reads what they can't
+                intent_data = intent_engine.match(content)
+                if intent_engine.needs_llm(intent_data):
+                    intent_data = await run_blocking(message, intent_engine.ask_llm, content)
                 logger.info(f"Detected intent: {intent_data}")
             
-            # If we have a clear intent from Gemini, process it directly
-            if intent_data and intent_data.get("intent") != "unknown":
-                intent = intent_data.get("intent")
-                entities = intent_data.get("entities", {})
+                # If we have a clear intent, process it directly
+                if intent_data["intent"] in ACTION_INTENTS:
+                    intent = intent_data.get("intent")
+                    entities = intent_data.get("entities", {})
                 
-                if intent == "add_stock" and "product_sku" in entities and "quantity" in entities:
-                    # Format as a stock update message for the chatbot service
-                    formatted_message = f"add {entities['quantity']} units to product {entities['product_sku']}"
-                    if chatbot_service:
-                        response_data = chatbot_service.process_message(formatted_message, str(message.author.id))
-                        await message.reply(response_data["response"])
-                        
-                        # Store the product details for confirmation if needed
-                        if response_data.get("needsConfirmation"):
-                            message.author._last_product_request = response_data.get("product")
-                    else:
-                        await message.reply("I'm having trouble connecting to the inventory system.")
+                    if intent == "add_stock" and "product_sku" in entities and "quantity" in entities:
+                        # Format as a stock update message for the chatbot service
+                        formatted_message = f"add {entities['quantity']} units to product {entities['product_sku']}"
+                        if chatbot_service:
+                            response_data = await run_blocking(message, chatbot_service.process_message, formatted_message, *conversation(message))
+                            await message.reply(response_data["response"])
+                        else:
+                            await message.reply("I'm having trouble connecting to the inventory system.")
                 
-                elif intent == "remove_stock" and "product_sku" in entities and "quantity" in entities:
-                    # Format as a stock removal message for the chatbot service
-                    formatted_message = f"remove {entities['quantity']} units from product {entities['product_sku']}"
-                    if chatbot_service:
-                        response_data = chatbot_service.process_message(formatted_message, str(message.author.id))
-                        await message.reply(response_data["response"])
-                        
-                        # Store the product details for confirmation if needed
-                        if response_data.get("needsConfirmation"):
-                            message.author._last_product_request = response_data.get("product")
-                    else:
-                        await message.reply("I'm having trouble connecting to the inventory system.")
+                    elif intent == "remove_stock" and "product_sku" in entities and "quantity" in entities:
+                        # Format as a stock removal message for the chatbot service
+                        formatted_message = f"remove {entities['quantity']} units from product {entities['product_sku']}"
+                        if chatbot_service:
+                            response_data = await run_blocking(message, chatbot_service.process_message, formatted_message, *conversation(message))
+                            await message.reply(response_data["response"])
+                        else:
+                            await message.reply("I'm having trouble connecting to the inventory system.")
                 
-                elif intent == "check_inventory" or intent == "product_info":
-                    # Use either product_sku or product_name to search
-                    search_term = entities.get("product_sku", entities.get("product_name", ""))
+                    elif intent == "check_inventory" or intent == "product_info":
+                        # Use either product_sku or product_name to search
+                        search_term = entities.get("product_sku", entities.get("product_name", ""))
                     
-                    if search_term and inventory_service:
-                        # Search for products
-                        products = inventory_service.search_products(search_term)
+                        if search_term and inventory_service:
+                            # Search for products
+                            products = await run_blocking(message, inventory_service.search_products, search_term)
                         
-                        if products:
-                            # Format product information
-                            product_info = "\n".join([
-                                f"**{p['name']}** (SKU: {p['sku']})\n"
-                                f"Stock: {p['quantity_in_stock']} units\n"
-                                f"Price: ${p['unit_price']:.2f}\n"
-                                for p in products[:3]  # Limit to 3 products
-                            ])
+                            if products:
+                                # Format product information
+                                product_info = "\n".join([
+                                    f"**{p['name']}** (SKU: {p['sku']})\n"
+                                    f"Stock: {p['quantity_in_stock']} units\n"
+                                    f"Price: ${p['unit_price']:.2f}\n"
+                                    for p in products[:3]  # Limit to 3 products
+                                ])
                             
-                            embed = discord.Embed(
-                                title="Product Information",
-                                description=f"Here's what I found for '{search_term}':",
-                                color=discord.Color.blue()
-                            )
+                                embed = discord.Embed(
+                                    title="Product Information",
+                                    description=f"Here's what I found for '{search_term}':",
+                                    color=discord.Color.blue()
+                                )
                             
-                            embed.add_field(
-                                name="Products",
-                                value=product_info or "No product details available",
-                                inline=False
-                            )
+                                embed.add_field(
+                                    name="Products",
+                                    value=product_info or "No product details available",
+                                    inline=False
+                                )
                             
-                            await message.reply(embed=embed)
+                                await message.reply(embed=embed)
+                            else:
+                                await message.reply(f"I couldn't find any products matching '{search_term}'.")
                         else:
-                            await message.reply(f"I couldn't find any products matching '{search_term}'.")
+                            # Use the general query handler if we don't have a specific product to look up
+                            if chatbot_service:
+                                response_data = await run_blocking(message, chatbot_service._handle_general_query, content)
+                                await message.reply(response_data["response"])
+                            elif gemini_service:
+                                response = await run_blocking(message, gemini_service.process_inventory_query, content, await inventory_context(message))
+                                await message.reply(response)
+                            else:
+                                await message.reply("I'm having trouble connecting to the inventory system.")
                     else:
-                        # Use the general query handler if we don't have a specific product to look up
+                        # Fall back to regular processing for other intents
                         if chatbot_service:
-                            response_data = chatbot_service._handle_general_query(content)
+                            # Process the message using our existing chatbot service
+                            response_data = await run_blocking(message, chatbot_service.process_message, content, *conversation(message))
+                        
+                            # Stock updates wait for confirmation in the conversation store,
+                            # and confirmations are applied from it
                             await message.reply(response_data["response"])
                         elif gemini_service:
-                            response = gemini_service.process_inventory_query(content, inventory_context)
+                            # Use Gemini if chatbot service is not available
+                            response = await run_blocking(message, gemini_service.process_inventory_query, content, await inventory_context(message))
                             await message.reply(response)
                         else:
-                            await message.reply("I'm having trouble connecting to the inventory system.")
+                            await message.reply("I'm having trouble connecting to the inventory system. Please try again later.")
+            
+                # If we don't have a clear intent, use the chatbot service or Gemini
                 else:
-                    # Fall back to regular processing for other intents
                     if chatbot_service:
-                        # Process the message using our existing chatbot service
-                        response_data = chatbot_service.process_message(content, str(message.author.id))
-                        
-                        # Check if this is a request that needs confirmation
-                        if response_data.get("needsConfirmation"):
-                            await message.reply(response_data["response"])
-                            
-                            # Store the product details for confirmation
-                            message.author._last_product_request = response_data.get("product")
-                            
-                        # Check if this is a confirmation message
-                        elif response_data.get("isConfirmation") and hasattr(message.author, "_last_product_request"):
-                            product = message.author._last_product_request
-                            
-                            # Process the stock update
-                            update_result = chatbot_service.update_stock(
-                                product["id"], 
-                                product["quantity"] if product["operation"] == "add" else -product["quantity"],
-                                str(message.author.id)
-                            )
-                            
-                            await message.reply(update_result["message"])
-                            
-                            # Clear the stored request
-                            delattr(message.author, "_last_product_request")
-                            
-                        # General response
-                        else:
-                            await message.reply(response_data["response"])
+                        # Confirmations of pending stock updates are handled by the chatbot too
+                        response_data = await run_blocking(message, chatbot_service.process_message, content, *conversation(message))
+                        await message.reply(response_data["response"])
                     elif gemini_service:
                         # Use Gemini if chatbot service is not available
-                        response = gemini_service.process_inventory_query(content, inventory_context)
+                        response = await run_blocking(message, gemini_service.process_inventory_query, content, await inventory_context(message))
                         await message.reply(response)
                     else:
                         await message.reply("I'm having trouble connecting to the inventory system. Please try again later.")
-            
-            # If we don't have a clear intent, use the chatbot service or Gemini
-            else:
-                if chatbot_service:
-                    # Check if this is a confirmation message first
-                    if chatbot_service._is_confirmation(content) and hasattr(message.author, "_last_product_request"):
-                        product = message.author._last_product_request
-                        
-                        # Process the stock update
-                        update_result = chatbot_service.update_stock(
-                            product["id"], 
-                            product["quantity"] if product["operation"] == "add" else -product["quantity"],
-                            str(message.author.id)
-                        )
-                        
-                        await message.reply(update_result["message"])
-                        
-                        # Clear the stored request
-                        delattr(message.author, "_last_product_request")
-                    else:
-                        # Process the message using our existing chatbot service
-                        response_data = chatbot_service.process_message(content, str(message.author.id))
-                        
-                        # Check if this is a request that needs confirmation
-                        if response_data.get("needsConfirmation"):
-                            await message.reply(response_data["response"])
-                            
-                            # Store the product details for confirmation
-                            message.author._last_product_request = response_data.get("product")
-                        else:
-                            await message.reply(response_data["response"])
-                elif gemini_service:
-                    # Use Gemini if chatbot service is not available
-                    response = gemini_service.process_inventory_query(content, inventory_context)
-                    await message.reply(response)
-                else:
-                    await message.reply("I'm having trouble connecting to the inventory system. Please try again later.")
+    
+        except asyncio.TimeoutError:
+            await message.reply(TIMEOUT_MESSAGE)
     
     # Process commands (for command-based interactions)
     await bot.process_commands(message)
 
 
+@bot.event
+async def on_command_error(ctx, error):
+    """Report slow backend calls to the user; log everything else."""
+    if isinstance(error, commands.CommandInvokeError) and isinstance(error.original, asyncio.TimeoutError):
+        await ctx.send(TIMEOUT_MESSAGE)
+        return
+    if isinstance(error, commands.UserInputError):
+        await ctx.send(f"{error}. See !help_inventory for usage.")
+        return
+    logger.error(f"Error in command {ctx.command}: {error}", exc_info=error)
+
+
 @bot.command(name="inventory", help="Check inventory levels for products")
 async def inventory(ctx, *, query: Optional[str] = None):
     """Command to check inventory levels."""
     if not query:
         # If no query is provided, show a summary of inventory
         if inventory_service:
-            summary = inventory_service.get_inventory_summary()
+            summary = await run_blocking(ctx, inventory_service.get_inventory_summary)
             
             embed = discord.Embed(
                 title="Inventory Summary",
@@ -297,7 +288,7 @@ async def inventory(ctx, *, query: Optional[str] = None):
                 embed.add_field(name="Recent Products", value=product_list, inline=False)
             
             # Add low stock products
-            low_stock = inventory_service.get_low_stock_products(5)
+            low_stock = await run_blocking(ctx, inventory_service.get_low_stock_products, 5)
             if low_stock:
                 low_stock_list = "\n".join([
                     f"• **{p['name']}** (SKU: {p['sku']}) - {p['quantity_in_stock']}/{p['reorder_level']} units"
@@ -314,7 +305,7 @@ async def inventory(ctx, *, query: Optional[str] = None):
     async with ctx.typing():
         # Try to search for products matching the query
         if inventory_service:
-            products = inventory_service.search_products(query)
+            products = await run_blocking(ctx, inventory_service.search_products, query)
             
             if products:
                 # Create an embed for product information
@@ -336,12 +327,11 @@ async def inventory(ctx, *, query: Optional[str] = None):
         
         # If no products found or if search fails, use the chatbot or Gemini service
         if chatbot_service:
-            response_data = chatbot_service._handle_general_query(query)
+            response_data = await run_blocking(ctx, chatbot_service._handle_general_query, query)
             await ctx.send(response_data["response"])
         elif gemini_service and inventory_service:
             # Get inventory context for Gemini
-            inventory_context = inventory_service.get_inventory_summary()
-            response = gemini_service.process_inventory_query(query, inventory_context)
+            response = await run_blocking(ctx, gemini_service.process_inventory_query, query, await inventory_context(ctx))
             await ctx.send(response)
         else:
             await ctx.send("I'm having trouble connecting to the inventory system. Please try again later.")
@@ -360,7 +350,7 @@ async def add_stock(ctx, sku: str, quantity: int):
     # Let the user know we're processing their request
     async with ctx.typing():
         if chatbot_service:
-            response_data = chatbot_service.process_message(formatted_message, str(ctx.author.id))
+            response_data = await run_blocking(ctx, chatbot_service.process_message, formatted_message, *conversation(ctx))
             
             if response_data.get("needsConfirmation"):
                 await ctx.send(response_data["response"])
@@ -371,24 +361,21 @@ async def add_stock(ctx, sku: str, quantity: int):
                 
                 try:
                     await bot.wait_for('message', check=check, timeout=60.0)
-                    
-                    # Process the stock update
-                    product = response_data.get("product")
-                    update_result = chatbot_service.update_stock(
-                        product["id"], 
-                        product["quantity"],
-                        str(ctx.author.id)
-                    )
-                    
-                    await ctx.send(update_result["message"])
-                    
                 except asyncio.TimeoutError:
+                    await run_blocking(ctx, chatbot_service.discard_pending_update, *conversation(ctx))
                     await ctx.send("Confirmation timed out. Stock update cancelled.")
+                    return
+                
+                # Apply the update waiting in the conversation store; in a DM
+                # on_message may already have applied it for the same "yes"
+                update_result = await run_blocking(ctx, chatbot_service.confirm_pending_update, *conversation(ctx))
+                if update_result:
+                    await ctx.send(update_result["message"])
             else:
                 await ctx.send(response_data["response"])
         elif inventory_service:
             # Use the inventory service directly if chatbot service is not available
-            product = inventory_service.get_product_by_sku(sku)
+            product = await run_blocking(ctx, inventory_service.get_product_by_sku, sku)
             
             if not product:
                 await ctx.send(f"I couldn't find a product with SKU similar to '{sku}'. Please check the SKU and try again.")
@@ -404,14 +391,14 @@ async def add_stock(ctx, sku: str, quantity: int):
             
             try:
                 await bot.wait_for('message', check=check, timeout=60.0)
-                
-                # Process the stock update
-                update_result = inventory_service.update_stock(sku, quantity, str(ctx.author.id))
-                
-                await ctx.send(update_result["message"])
-                
             except asyncio.TimeoutError:
                 await ctx.send("Confirmation timed out. Stock update cancelled.")
+                return
+            
+            # Process the stock update
+            update_result = await run_blocking(ctx, inventory_service.update_stock, sku, quantity, str(ctx.author.id))
+            
+            await ctx.send(update_result["message"])
         else:
             await ctx.send("I'm having trouble connecting to the inventory system. Please try again later.")
 
@@ -429,7 +416,7 @@ async def remove_stock(ctx, sku: str, quantity: int):
     # Let the user know we're processing their request
     async with ctx.typing():
         if chatbot_service:
-            response_data = chatbot_service.process_message(formatted_message, str(ctx.author.id))
+            response_data = await run_blocking(ctx, chatbot_service.process_message, formatted_message, *conversation(ctx))
             
             if response_data.get("needsConfirmation"):
                 await ctx.send(response_data["response"])
@@ -440,24 +427,21 @@ async def remove_stock(ctx, sku: str, quantity: int):
                 
                 try:
                     await bot.wait_for('message', check=check, timeout=60.0)
-                    
-                    # Process the stock update
-                    product = response_data.get("product")
-                    update_result = chatbot_service.update_stock(
-                        product["id"], 
-                        -product["quantity"],
-                        str(ctx.author.id)
-                    )
-                    
-                    await ctx.send(update_result["message"])
-                    
                 except asyncio.TimeoutError:
+                    await run_blocking(ctx, chatbot_service.discard_pending_update, *conversation(ctx))
                     await ctx.send("Confirmation timed out. Stock update cancelled.")
+                    return
+                
+                # Apply the update waiting in the conversation store; in a DM
+                # on_message may already have applied it for the same "yes"
+                update_result = await run_blocking(ctx, chatbot_service.confirm_pending_update, *conversation(ctx))
+                if update_result:
+                    await ctx.send(update_result["message"])
             else:
                 await ctx.send(response_data["response"])
         elif inventory_service:
             # Use the inventory service directly if chatbot service is not available
-            product = inventory_service.get_product_by_sku(sku)
+            product = await run_blocking(ctx, inventory_service.get_product_by_sku, sku)
             
             if not product:
                 await ctx.send(f"I couldn't find a product with SKU similar to '{sku}'. Please check the SKU and try again.")
@@ -478,14 +462,14 @@ async def remove_stock(ctx, sku: str, quantity: int):
             
             try:
                 await bot.wait_for('message', check=check, timeout=60.0)
-                
-                # Process the stock update
-                update_result = inventory_service.update_stock(sku, -quantity, str(ctx.author.id))
-                
-                await ctx.send(update_result["message"])
-                
             except asyncio.TimeoutError:
                 await ctx.send("Confirmation timed out. Stock update cancelled.")
+                return
+            
+            # Process the stock update
+            update_result = await run_blocking(ctx, inventory_service.update_stock, sku, -quantity, str(ctx.author.id))
+            
+            await ctx.send(update_result["message"])
         else:
             await ctx.send("I'm having trouble connecting to the inventory system. Please try again later.")
 
@@ -496,7 +480,7 @@ async def low_stock(ctx, limit: Optional[int] = 10):
     # Let the user know we're processing their request
     async with ctx.typing():
         if inventory_service:
-            low_stock_products = inventory_service.get_low_stock_products(limit)
+            low_stock_products = await run_blocking(ctx, inventory_service.get_low_stock_products, limit)
             
             if not low_stock_products:
                 await ctx.send("Good news! There are no products below their reorder levels.")
@@ -531,7 +515,7 @@ async def search_products(ctx, *, query: str):
     # Let the user know we're processing their request
     async with ctx.typing():
         if inventory_service:
-            products = inventory_service.search_products(query)
+            products = await run_blocking(ctx, inventory_service.search_products, query)
             
             if not products:
                 await ctx.send(f"No products found matching '{query}'.")
@@ -615,4 +599,7 @@ if __name__ == "__main__":
         logger.warning("ChatbotService could not be loaded. Some functionality may be limited.")
     
     # Start the bot
-    bot.run(TOKEN)
+    try:
+        bot.run(TOKEN)
+    finally:
+        workers.shutdown()
@@ -5,6 +5,7 @@ for natural language processing capabilities.
 """
 import os
 import logging
+import threading
 from typing import Dict, Any, Optional
 import google.generativeai as genai
 from dotenv import load_dotenv
@@ -34,6 +35,8 @@ class GeminiService:
         """Initialize the Gemini service."""
         self.model = None
         self.conversation = None
+        # Calls arrive from several worker threads; the chat history is shared
+        self._conversation_lock = threading.Lock()
         
         if GEMINI_API_KEY:
             try:
@@ -88,7 +91,8 @@ class GeminiService:
             
             # Send the query to Gemini with the context
             full_prompt = f"{system_prompt}\n\nUSER QUERY:\n{query}"
-            response = self.conversation.send_message(full_prompt)
+            with self._conversation_lock:
+                response = self.conversation.send_message(full_prompt)
             
             return response.text
             
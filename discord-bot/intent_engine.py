@@ -0,0 +1,114 @@
+"""
+Tiered intent detection for the Discord bot.
+Most messages ("add 5 units to SKU-1", "low stock", "yes") can be read
+locally; only the rest are sent to Gemini.
+"""
+import os
+import re
+import logging
+from collections import Counter
+from typing import Dict, Any
+
+try:
+    from app.services.intent_matcher import intent_matcher, SHOW_MORE_PATTERN
+except ImportError:
+    # bot.py reports the app failing to import; only the LLM tier is left
+    intent_matcher = SHOW_MORE_PATTERN = None
+
+logger = logging.getLogger("discord-bot.intents")
+
+# Below this confidence the message goes to the LLM
+CONFIDENCE_THRESHOLD = float(os.getenv("DISCORD_INTENT_THRESHOLD", 0.75))
+
+# Intents the bot acts on itself; "chat" means ChatbotService.process_message
+# handles it (confirmations, listings, "show more")
+ACTION_INTENTS = ("add_stock", "remove_stock", "check_inventory", "product_info")
+
+# Whole-message confirmations only: ChatbotService._is_confirmation also
+# accepts a confirmation word anywhere ("sure, how many ..."), which would
+# swallow questions
+CONFIRMATION_PATTERN = re.compile(r"^(?:yes|y|yep|yeah|ok|okay|sure|confirm(?:ed)?|approved?|go ahead|do it)\s*[.!]*$", re.I)
+# "sku" must be a word of its own ("skull", "skus" aren't SKUs) and, like
+# the bare form, the code must contain a digit ("what sku is ..." isn't one)
+SKU_PATTERN = re.compile(r"\bsku\b[\s:#-]*(?=[a-z0-9-]*\d)([a-z0-9][a-z0-9-]*)|\b([a-z]{2,}-[a-z0-9-]*\d[a-z0-9-]*)\b", re.I)
+LOOKUP_PATTERN = re.compile(
+    r"\b(?:how many|how much|in stock|stock (?:level|count)s?|do we have|price|details?|info(?:rmation)?|look ?up|find)\b",
+    re.I,
+)
+# Product name as the subject of a lookup question, e.g. "how many blue t-shirts do we have"
+PRODUCT_NAME_PATTERNS = [
+    re.compile(r"\bhow many (?:units of |items of )?(.+?)\s+(?:do we have|are (?:there|left|in stock)|in stock|left)\b", re.I),
+    re.compile(r"\b(?:stock (?:level|count)s?|price|details?|info(?:rmation)?) (?:of|for|on|about) (?:the )?(.+?)[?.!]*$", re.I),
+    re.compile(r"\b(?:do we have|look ?up|find) (?:any )?(.+?)(?: in stock)?[?.!]*$", re.I),
+]
+
+
+class IntentEngine:
+    """
+    Detects intents in three tiers, stopping at the first confident one:
+
+    1. ChatbotService's own rules: stock update regexes, confirmations,
+       listings and "show more" (certain, answered by the chatbot),
+    2. keyword rules for product lookups (SKU-like tokens, "how many X
+       do we have", ...),
+    3. Gemini's extract_inventory_intent, for anything else.
+
+    Results are {"intent", "entities", "confidence", "source"}.
+    """
+
+    def __init__(self, chatbot_service=None, gemini_service=None):
+        self.chatbot_service = chatbot_service
+        self.gemini_service = gemini_service
+        self.sources = Counter()
+
+    def match(self, message: str) -> Dict[str, Any]:
+        """Tiers 1 and 2: local rules only, cheap enough for the event loop"""
+        result = self._match_rules(message) or self._match_keywords(message) or self._result("unknown", {}, 0.0, "rules")
+        if result["confidence"] >= CONFIDENCE_THRESHOLD:
+            self.sources[result["source"]] += 1
+        return result
+
+    def needs_llm(self, result: Dict[str, Any]) -> bool:
+        return result["confidence"] < CONFIDENCE_THRESHOLD and self.gemini_service is not None
+
+    def ask_llm(self, message: str) -> Dict[str, Any]:
+        """Tier 3: blocking Gemini call; run it in the worker pool"""
+        data = self.gemini_service.extract_inventory_intent(message) or {}
+        self.sources["llm"] += 1
+        entities = data.get("entities") or {}
+        return self._result(data.get("intent") or "unknown", entities, 0.5, "llm")
+
+    def _match_rules(self, message):
+        if not self.chatbot_service or intent_matcher is None:
+            return None
+        # One keyword scan; the stock update regex only runs if it found an update verb
+        text = message.lower().strip()
+        found = intent_matcher.keywords_in(text)
+        update = intent_matcher.stock_update(text) if "update_verb" in found else None
+        if update:
+            intent = "add_stock" if update["operation"] == "add" else "remove_stock"
+            return self._result(intent, {"product_sku": update["sku"], "quantity": update["quantity"]}, 1.0, "rules")
+        if (CONFIRMATION_PATTERN.match(text) or SHOW_MORE_PATTERN.match(text)
+                or found & {"low_stock", "stock_listing"}):
+            return self._result("chat", {}, 1.0, "rules")
+        return None
+
+    def _match_keywords(self, message):
+        lookup = LOOKUP_PATTERN.search(message)
+        sku = SKU_PATTERN.search(message)
+        if sku:
+            # A SKU plus a lookup word is a product question; a bare SKU probably is
+            confidence = 0.9 if lookup else 0.8
+            return self._result("check_inventory", {"product_sku": sku.group(1) or sku.group(2)}, confidence, "keywords")
+        if lookup:
+            for pattern in PRODUCT_NAME_PATTERNS:
+                name = pattern.search(message)
+                if name and name.group(1).strip():
+                    return self._result("check_inventory", {"product_name": name.group(1).strip()}, 0.8, "keywords")
+            # A lookup without a recognisable product: let the LLM read it
+            return self._result("check_inventory", {}, 0.4, "keywords")
+        return None
+
+    @staticmethod
+    def _result(intent, entities, confidence, source):
+        return {"intent": intent, "entities": entities, "confidence": confidence, "source": source}
@@ -18,6 +18,7 @@ sys.path.append(parent_dir)
 try:
     from app.services.chatbot_service import ChatbotService
     from app.models.models import Product, InventoryTransaction
+    from app.services.search_service import ProductSearch
     
     # Initialize the chatbot service
     chatbot_service = ChatbotService()
@@ -49,9 +50,8 @@ class InventoryService:
             return None
             
         try:
-            # Use the existing system's database models
-            from app import db
-            product = Product.query.filter(Product.sku.ilike(f"%{sku}%")).first()
+            # Exact SKU first, else the only close match; ambiguous SKUs find nothing
+            product, _ = ProductSearch.resolve_sku(sku)
             
             if not product:
                 return None
@@ -178,22 +178,23 @@ class InventoryService:
             
         try:
             # First get the product by SKU
-            product = Product.query.filter(Product.sku.ilike(f"%{sku}%")).first()
+            product, candidates = ProductSearch.resolve_sku(sku)
             
-            if not product:
+            if not product and candidates:
                 return {
                     "success": False,
-                    "message": f"Product with SKU similar to '{sku}' not found"
+                    "message": f"Several products match '{sku}': "
+                               + ", ".join(c["sku"] for c in candidates)
+                               + ". Please use the exact SKU."
                 }
-            
-            # Check if we have enough stock for removal
-            if quantity < 0 and product.quantity_in_stock < abs(quantity):
+            if not product:
                 return {
                     "success": False,
-                    "message": f"Not enough stock. Current stock: {product.quantity_in_stock}, Requested removal: {abs(quantity)}"
+                    "message": f"Product with SKU similar to '{sku}' not found"
                 }
             
-            # Use the existing chatbot service to update stock
+            # Use the existing chatbot service to update stock; it applies the
+            # change atomically and refuses removals beyond the current stock
             result = chatbot_service.update_stock(
                 product.id,
                 quantity,
@@ -224,22 +225,17 @@ class InventoryService:
             return []
             
         try:
-            # Use the existing system's database models
-            from app import db
-            products = Product.query.filter(
-                (Product.name.ilike(f"%{query}%")) | 
-                (Product.sku.ilike(f"%{query}%")) |
-                (Product.description.ilike(f"%{query}%"))
-            ).limit(limit).all()
+            # Ranked, index-backed search (best matches first)
+            products = ProductSearch.search(query, limit=limit)
             
             return [
                 {
-                    "id": p.id,
-                    "name": p.name,
-                    "sku": p.sku,
-                    "description": p.description,
-                    "quantity_in_stock": p.quantity_in_stock,
-                    "unit_price": float(p.unit_price) if p.unit_price else 0
+                    "id": p["id"],
+                    "name": p["name"],
+                    "sku": p["sku"],
+                    "description": p["description"],
+                    "quantity_in_stock": p["quantity_in_stock"],
+                    "unit_price": float(p["unit_price"]) if p["unit_price"] else 0
                 }
                 for p in products
             ]
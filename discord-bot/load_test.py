@@ -0,0 +1,144 @@
+"""
+Load test for the Discord bot's worker pool.
+
+Fires many simultaneous "messages" (product searches and stock listings,
+the bot's most common requests) from several users and channels through
+the same WorkerPool the bot uses, against a scratch database, and reports
+throughput, latency, how many calls ran in parallel and how long the event
+loop was blocked. --inline runs the calls on the event loop instead, the
+way the bot used to. --latency adds a simulated network round trip to every
+call, as with a remote database or Gemini:
+
+    python discord-bot/load_test.py --database-url sqlite:///discord_load_test.db
+    python discord-bot/load_test.py --database-url sqlite:///discord_load_test.db --inline
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(current_dir))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from worker_pool import WorkerPool
+
+SEARCH_TERMS = ["wireless", "keybaord", "chair", "ergonomic desk", "cable", "EL-", "lamp 12", "premium"]
+
+
+def setup(database_url, products):
+    """Create the app on the scratch database and make sure it has products"""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("JOB_WORKER_THREADS", "0")
+    os.environ.setdefault("NOTIFICATION_SCAN_INTERVAL", "0")
+    from app import create_app, db
+    from app.models.models import Product
+
+    app = create_app()
+    with app.app_context():
+        existing = db.session.query(Product.id).count()
+        if existing < products:
+            rng = random.Random(42)
+            words = ["Wireless", "Ergonomic", "Premium", "Compact", "Chair", "Desk", "Lamp", "Cable", "Keyboard"]
+            db.session.execute(Product.__table__.insert(), [
+                {"name": f"{rng.choice(words)} {rng.choice(words)} {i}", "sku": f"EL-LT-{i:06d}",
+                 "description": "load test product", "unit_price": 10.0, "quantity_in_stock": rng.randint(0, 50),
+                 "reorder_level": 10, "reorder_quantity": 20}
+                for i in range(existing, products)
+            ])
+            db.session.commit()
+    return app
+
+
+async def heartbeat(lags, stop, interval=0.01):
+    """Record how late the event loop wakes up; large lags mean something blocked it"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - started - interval)
+
+
+async def main_async(args):
+    app = setup(args.database_url, args.products)
+    from inventory_service import InventoryService
+    from app.services.chatbot_service import ChatbotService
+    inventory_service, chatbot_service = InventoryService(), ChatbotService()
+
+    pool = WorkerPool(app, max_workers=args.workers, timeout=args.timeout)
+    rng = random.Random(7)
+    latencies, durations = [], []
+    failures = {"timeouts": 0, "errors": 0}
+
+    def timed(func, *call_args):
+        started = time.perf_counter()
+        try:
+            time.sleep(args.latency / 1000)
+            return func(*call_args)
+        finally:
+            durations.append(time.perf_counter() - started)
+
+    async def message(i, arrived):
+        user, channel = rng.randrange(args.users), rng.randrange(args.channels)
+        if i % 4 == 0:
+            call = (chatbot_service.process_message, "list all stock", str(user))
+        else:
+            call = (inventory_service.search_products, rng.choice(SEARCH_TERMS))
+        try:
+            if args.inline:
+                with app.app_context():
+                    timed(*call)
+            else:
+                await pool.run(timed, *call, user=user, channel=channel)
+        except asyncio.TimeoutError:
+            failures["timeouts"] += 1
+        except Exception:
+            failures["errors"] += 1
+        # All messages arrive at once; latency is until each one is answered
+        latencies.append(time.perf_counter() - arrived)
+
+    lags, stop = [], asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(message(i, started) for i in range(args.messages)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await beat
+    pool.shutdown()
+
+    busy = sum(durations)
+    latencies.sort()
+    print(f"\nMode:                 {'inline (on the event loop)' if args.inline else f'worker pool ({args.workers} threads)'}")
+    print(f"Messages:             {args.messages} from {args.users} users in {args.channels} channels")
+    print(f"Wall time:            {wall:.2f}s ({args.messages / wall:.1f} messages/s)")
+    print(f"Time spent in calls:  {busy:.2f}s -> {busy / wall:.1f} calls in parallel on average")
+    if not args.inline:
+        print(f"Peak parallel calls:  {pool.stats()['peak']}")
+    print(f"Latency p50 / p95:    {statistics.median(latencies) * 1000:.0f} / "
+          f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms")
+    print(f"Event loop max lag:   {max(lags, default=wall) * 1000:.0f} ms")
+    print(f"Timeouts / errors:    {failures['timeouts']} / {failures['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///discord_load_test.db",
+                        help="Scratch database (products are added to it if it has fewer than --products)")
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--messages", type=int, default=200, help="Simultaneous messages to send")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=8, help="Worker threads")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-call timeout in seconds")
+    parser.add_argument("--latency", type=float, default=50,
+                        help="Simulated network round trip per call in ms (remote database / Gemini); 0 for none")
+    parser.add_argument("--inline", action="store_true", help="Run calls on the event loop (the old behaviour)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Worker pool for the Discord bot's blocking work.
+SQLAlchemy queries and Gemini calls are synchronous, so running them inside
+a coroutine stalls the event loop (and every guild) until they return. They
+run here instead, on a bounded thread pool inside a Flask app context.
+"""
+import os
+import asyncio
+import logging
+import threading
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("discord-bot.workers")
+
+
+class WorkerPool:
+    """
+    Runs blocking calls in worker threads, with:
+
+    - a per-call timeout (DISCORD_CALL_TIMEOUT seconds, including time spent
+      waiting for a free slot); the caller gets asyncio.TimeoutError,
+    - at most DISCORD_MAX_PENDING_CALLS calls queued or running at once,
+      on DISCORD_WORKER_THREADS threads,
+    - at most DISCORD_USER_CONCURRENCY calls per user and
+      DISCORD_CHANNEL_CONCURRENCY per channel, so one busy user or channel
+      can't take every worker.
+
+    A call that times out keeps running in its thread until it returns
+    (threads can't be interrupted); only the caller stops waiting.
+    """
+
+    def __init__(self, app=None, max_workers=None, max_pending=None, timeout=None,
+                 per_user=None, per_channel=None):
+        self.app = app
+        self.max_workers = max_workers or int(os.getenv("DISCORD_WORKER_THREADS", 8))
+        self.max_pending = max_pending or int(os.getenv("DISCORD_MAX_PENDING_CALLS", 64))
+        self.timeout = timeout or float(os.getenv("DISCORD_CALL_TIMEOUT", 20))
+        self.per_user = per_user or int(os.getenv("DISCORD_USER_CONCURRENCY", 2))
+        self.per_channel = per_channel or int(os.getenv("DISCORD_CHANNEL_CONCURRENCY", 4))
+
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="discord-bot-worker")
+        self._pending = asyncio.Semaphore(self.max_pending)
+        self._user_limits = {}     # user id -> [semaphore, waiters]
+        self._channel_limits = {}  # channel id -> [semaphore, waiters]
+
+        self._stats_lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.completed = 0
+        self.timeouts = 0
+
+    async def run(self, func, *args, user=None, channel=None, timeout=None, **kwargs):
+        """Run func(*args, **kwargs) in a worker thread and return its result"""
+        try:
+            return await asyncio.wait_for(
+                self._run(func, args, kwargs, user, channel),
+                timeout if timeout is not None else self.timeout,
+            )
+        except asyncio.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            logger.warning(f"{getattr(func, '__qualname__', func)} timed out (user {user}, channel {channel})")
+            raise
+
+    async def _run(self, func, args, kwargs, user, channel):
+        # Per-user and per-channel slots first, so a waiting user doesn't
+        # hold one of the shared slots
+        async with self._limit(self._user_limits, user, self.per_user), \
+                self._limit(self._channel_limits, channel, self.per_channel), \
+                self._pending:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(self._call, func, args, kwargs))
+
+    @contextlib.asynccontextmanager
+    async def _limit(self, limits, key, size):
+        if key is None:
+            yield
+            return
+        # Semaphores are dropped once nobody uses them, so idle users and
+        # channels don't accumulate (only the event loop touches this dict)
+        entry = limits.get(key)
+        if entry is None:
+            entry = limits[key] = [asyncio.Semaphore(size), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                limits.pop(key, None)
+
+    def _call(self, func, args, kwargs):
+        with self._stats_lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            if self.app is None:
+                return func(*args, **kwargs)
+            # Each call gets its own app context, hence its own DB session
+            with self.app.app_context():
+                return func(*args, **kwargs)
+        finally:
+            with self._stats_lock:
+                self.active -= 1
+                self.completed += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {"active": self.active, "peak": self.peak, "completed": self.completed, "timeouts": self.timeouts}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
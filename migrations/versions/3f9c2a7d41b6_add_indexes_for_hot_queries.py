@@ -0,0 +1,46 @@
+"""add indexes for hot queries
+
+Revision ID: 3f9c2a7d41b6
+Revises:
+Create Date: 2026-10-18 14:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b6'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns). Tables created by db.create_all() after these
+# were declared on the models already have them, hence if_not_exists.
+INDEXES = [
+    ('ix_inventory_transaction_transaction_date', 'inventory_transaction', ['transaction_date']),
+    ('ix_inventory_transaction_product_id_date', 'inventory_transaction', ['product_id', 'transaction_date']),
+    ('ix_inventory_transaction_type_date', 'inventory_transaction', ['transaction_type', 'transaction_date']),
+    ('ix_notification_product_type_read', 'notification', ['product_id', 'notification_type', 'is_read']),
+    ('ix_notification_read_created', 'notification', ['is_read', 'created_at']),
+    ('ix_product_category_id', 'product', ['category_id']),
+    ('ix_product_supplier_id', 'product', ['supplier_id']),
+    ('ix_purchase_order_supplier_id', 'purchase_order', ['supplier_id']),
+    ('ix_purchase_order_order_date', 'purchase_order', ['order_date']),
+    ('ix_purchase_order_status', 'purchase_order', ['status']),
+    ('ix_purchase_order_item_purchase_order_id', 'purchase_order_item', ['purchase_order_id']),
+    ('ix_purchase_order_item_product_id', 'purchase_order_item', ['product_id']),
+    ('ix_ml_results_run_id', 'ml_results', ['run_id']),
+    ('ix_ml_results_run_date', 'ml_results', ['run_date']),
+    ('ix_ml_results_product_id', 'ml_results', ['product_id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,39 @@
+"""add non-negative stock check
+
+Revision ID: 8c1e5b2f9a47
+Revises: 3f9c2a7d41b6
+Create Date: 2026-10-18 16:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1e5b2f9a47'
+down_revision = '3f9c2a7d41b6'
+branch_labels = None
+depends_on = None
+
+
+CONSTRAINT = 'ck_product_quantity_in_stock_non_negative'
+
+
+def upgrade():
+    negative = op.get_bind().execute(
+        sa.text("SELECT id, quantity_in_stock FROM product WHERE quantity_in_stock < 0")
+    ).fetchall()
+    if negative:
+        raise RuntimeError(
+            "Products with negative stock must be corrected before adding the check: "
+            + ", ".join(f"#{row.id} ({row.quantity_in_stock})" for row in negative)
+        )
+
+    # batch mode recreates the table on SQLite, which can't ALTER constraints
+    with op.batch_alter_table('product') as batch_op:
+        batch_op.create_check_constraint(CONSTRAINT, 'quantity_in_stock >= 0')
+
+
+def downgrade():
+    with op.batch_alter_table('product') as batch_op:
+        batch_op.drop_constraint(CONSTRAINT, type_='check')
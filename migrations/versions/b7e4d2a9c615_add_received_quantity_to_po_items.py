@@ -0,0 +1,32 @@
+"""add received quantity to purchase order items
+
+Revision ID: b7e4d2a9c615
+Revises: 8c1e5b2f9a47
+Create Date: 2026-10-18 17:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d2a9c615'
+down_revision = '8c1e5b2f9a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('purchase_order_item') as batch_op:
+        batch_op.add_column(sa.Column('received_quantity', sa.Integer(), nullable=False, server_default='0'))
+
+    # Orders received before this column existed already added their stock
+    op.execute(
+        "UPDATE purchase_order_item SET received_quantity = quantity "
+        "WHERE purchase_order_id IN (SELECT id FROM purchase_order WHERE status = 'received')"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('purchase_order_item') as batch_op:
+        batch_op.drop_column('received_quantity')
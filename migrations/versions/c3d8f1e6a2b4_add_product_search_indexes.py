@@ -0,0 +1,38 @@
+"""add product search indexes
+
+Revision ID: c3d8f1e6a2b4
+Revises: b7e4d2a9c615
+Create Date: 2026-10-18 19:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d8f1e6a2b4'
+down_revision = 'b7e4d2a9c615'
+branch_labels = None
+depends_on = None
+
+
+# Trigram indexes (PostgreSQL only) for ranked / '%term%' product search
+TRIGRAM_COLUMNS = ['name', 'sku', 'description']
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    op.create_index('ix_product_sku_lower', 'product', [sa.text('lower(sku)')], unique=False,
+                    if_not_exists=True, postgresql_using='hash')
+    if postgresql:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column in TRIGRAM_COLUMNS:
+            op.create_index(f'ix_product_{column}_trgm', 'product', [column], unique=False, if_not_exists=True,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for column in reversed(TRIGRAM_COLUMNS):
+            op.drop_index(f'ix_product_{column}_trgm', table_name='product', if_exists=True)
+    op.drop_index('ix_product_sku_lower', table_name='product', if_exists=True)